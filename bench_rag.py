@@ -0,0 +1,517 @@
+"""
+Benchmark and load-test suite for the RAG service, without API calls.
+
+Gemini and the Google embedding model are replaced by the offline stand-ins in
+`fake_models.py`, which keep a configurable latency profile, so results are
+reproducible and cost nothing. Three suites are available:
+
+- `ingestion`: builds index snapshots from synthetic PDF/DOCX corpora of
+  increasing size and reports documents and chunks per second
+- `retrieval`: runs the same queries against every retrieval mode of the
+  largest snapshot and reports latency percentiles
+- `load`: starts `main.py` under uvicorn with the fake models and sends
+  concurrent requests to the analysis and chat endpoints, reporting
+  p50/p95/p99 latency, time to first token for streams, throughput and errors
+
+The response cache is disabled during load tests unless `--cache` is given, so
+every request reaches the model.
+
+Results can be written as JSON (with the git commit they were measured on) to
+compare runs across commits. The load suite needs `httpx` (`pip install httpx`).
+
+Usage:
+    python bench_rag.py --sizes 10 50 200 --json results.json
+    python bench_rag.py --suites load --concurrency 1 8 32 --requests 200 --llm-latency 0.8
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import unicodedata
+from typing import Dict, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SUITES = ["ingestion", "retrieval", "load"]
+RETRIEVAL_MODES = ["chroma", "numpy", "hybrid", "lexical", "schema_index"]
+LOAD_SCENARIOS = ["analyze", "chat", "chat_stream"]
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+API_KEY = "benchmark"
+SERVER_START_TIMEOUT_SECONDS = 300
+
+# Filler words of the synthetic documents; schema names are mixed in per document
+FILLER_WORDS = [
+    "schema", "therapy", "childhood", "needs", "emotional", "relationship", "pattern", "coping", "mode",
+    "awareness", "change", "attachment", "trust", "parent", "experience", "feeling", "behavior", "client",
+    "therapist", "session", "belief", "memory", "anxiety", "avoidance", "surrender", "overcompensation",
+    "terapi", "cocukluk", "ihtiyac", "duygusal", "iliski", "davranis", "oruntu", "farkindalik", "baglanma",
+]
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    """Return the p50/p95/p99 of a list of values, rounded to microseconds."""
+    if not values:
+        return {"p50": None, "p95": None, "p99": None}
+    return {name: round(float(np.percentile(values, q)), 3) for name, q in (("p50", 50), ("p95", 95), ("p99", 99))}
+
+def git_commit() -> Optional[str]:
+    """Return the commit the benchmark runs on, or None outside a git checkout."""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=REPO_DIR, check=True, capture_output=True, text=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+# --- Synthetic corpora ---
+
+def ascii_fold(text: str) -> str:
+    """Drop accents so the text fits the standard PDF font encoding."""
+    decomposed = unicodedata.normalize("NFKD", text.replace("ı", "i").replace("İ", "I"))
+    return "".join(char for char in decomposed if ord(char) < 128)
+
+def synthetic_pages(rng: random.Random, pages: int, words_per_page: int) -> List[str]:
+    """Generate the pages of one document about two randomly chosen schemas."""
+    from schema_index import SCHEMAS
+
+    topics = []
+    for canonical in rng.sample(list(SCHEMAS), 2):
+        topics.extend([canonical, SCHEMAS[canonical][0]])
+
+    page_texts = []
+    for _ in range(pages):
+        words = [rng.choice(topics) if rng.random() < 0.08 else rng.choice(FILLER_WORDS) for _ in range(words_per_page)]
+        sentences = [" ".join(words[i:i + 12]).capitalize() + "." for i in range(0, len(words), 12)]
+        page_texts.append(ascii_fold(" ".join(sentences)))
+    return page_texts
+
+def _pdf_escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+def write_pdf(path: str, pages: List[str], line_chars: int = 90):
+    """Write a minimal, text-only PDF with one page per string (Helvetica, ASCII text)."""
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    page_ids = []
+    for text in pages:
+        lines, line = [], ""
+        for word in text.split():
+            if line and len(line) + len(word) + 1 > line_chars:
+                lines.append(line)
+                line = word
+            else:
+                line = f"{line} {word}" if line else word
+        lines.append(line)
+        content = "BT /F1 9 Tf 11 TL 40 800 Td " + " ".join(f"({_pdf_escape(line)}) Tj T*" for line in lines) + " ET"
+        stream = content.encode("latin-1")
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % (len(objects))
+        )
+        page_ids.append(len(objects))
+    kids = " ".join(f"{page_id} 0 R" for page_id in page_ids)
+    objects[1] = f"<< /Type /Pages /Kids [{kids}] /Count {len(page_ids)} >>".encode("ascii")
+
+    output = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(output))
+        output += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref_offset = len(output)
+    output += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    output += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    output += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref_offset)
+    with open(path, 'wb') as file:
+        file.write(output)
+
+def write_docx(path: str, pages: List[str]):
+    """Write a DOCX file with one paragraph per page."""
+    from docx import Document
+
+    document = Document()
+    for text in pages:
+        document.add_paragraph(text)
+    document.save(path)
+
+def build_corpus(folder: str, documents: int, pages: int, words_per_page: int, seed: int = 0) -> int:
+    """
+    Write a synthetic corpus of alternating PDF and DOCX files.
+
+    Returns:
+        The total size of the corpus in bytes
+    """
+    os.makedirs(folder, exist_ok=True)
+    rng = random.Random(seed)
+    total_bytes = 0
+    for number in range(documents):
+        page_texts = synthetic_pages(rng, pages, words_per_page)
+        if number % 2 == 0:
+            path = os.path.join(folder, f"doc-{number:05d}.pdf")
+            write_pdf(path, page_texts)
+        else:
+            path = os.path.join(folder, f"doc-{number:05d}.docx")
+            write_docx(path, page_texts)
+        total_bytes += os.path.getsize(path)
+    return total_bytes
+
+# --- Ingestion ---
+
+def build_snapshot(corpus_dir: str, snapshots_dir: str, args) -> Optional[str]:
+    """Build an index snapshot of a corpus with the fake embedding model."""
+    from embedding_stage import HASHING_EMBEDDING_DIMENSIONS, EmbeddingStage
+    from fake_models import FakeEmbeddings
+    from index_snapshots import build_index_snapshot
+
+    embeddings = FakeEmbeddings(latency_seconds=args.embedding_latency, seconds_per_text=args.embedding_seconds_per_text)
+    embedding_stage = EmbeddingStage(embeddings, batch_size=args.batch_size, max_in_flight=args.max_in_flight)
+    return build_index_snapshot(
+        corpus_dir, snapshots_dir, embedding_stage, f"hashing-{HASHING_EMBEDDING_DIMENSIONS}", workers=args.workers,
+    )
+
+def bench_ingestion(work_dir: str, args) -> List[dict]:
+    """Build a snapshot for each corpus size and measure the throughput."""
+    from prometheus_client import REGISTRY
+    from ingestion import load_manifest
+
+    results = []
+    print(f"{'docs':>6} {'chunks':>7} {'MiB':>7} {'seconds':>8} {'docs/s':>8} {'chunks/s':>9} {'sync chunks/s':>14}")
+    for size in args.sizes:
+        corpus_dir = os.path.join(work_dir, f"corpus-{size}")
+        snapshots_dir = os.path.join(work_dir, f"snapshots-{size}")
+        corpus_bytes = build_corpus(corpus_dir, size, args.pages, args.words_per_page, args.seed)
+
+        started = time.perf_counter()
+        snapshot_path = build_snapshot(corpus_dir, snapshots_dir, args)
+        seconds = time.perf_counter() - started
+        if snapshot_path is None:
+            raise RuntimeError(f"Index build failed for {size} documents")
+
+        manifest = load_manifest(snapshot_path)
+        chunks = sum(len(entry["chunk_ids"]) for entry in manifest["files"].values())
+        result = {
+            "documents": size,
+            "chunks": chunks,
+            "corpus_mb": round(corpus_bytes / (1024 * 1024), 2),
+            "seconds": round(seconds, 3),
+            "documents_per_second": round(size / seconds, 2),
+            "chunks_per_second": round(chunks / seconds, 2),
+            # Extraction and embedding only, without the derived indexes
+            "sync_documents_per_second": round(REGISTRY.get_sample_value("ingestion_files_per_second"), 2),
+            "sync_chunks_per_second": round(REGISTRY.get_sample_value("ingestion_chunks_per_second"), 2),
+        }
+        results.append(result)
+        print(
+            f"{size:>6} {chunks:>7} {result['corpus_mb']:>7} {result['seconds']:>8} "
+            f"{result['documents_per_second']:>8} {result['chunks_per_second']:>9} {result['sync_chunks_per_second']:>14}"
+        )
+    return results
+
+# --- Retrieval ---
+
+def benchmark_queries(count: int, seed: int) -> List[str]:
+    """Schema names in both languages and chat-style questions about them."""
+    from schema_index import SCHEMAS
+
+    rng = random.Random(seed)
+    names = [name for canonical, (turkish, _) in SCHEMAS.items() for name in (canonical, turkish)]
+    queries = []
+    for number in range(count):
+        schemas = rng.sample(names, rng.randint(1, 3))
+        if number % 2:
+            queries.append(", ".join(schemas))
+        else:
+            topic = rng.choice(FILLER_WORDS)
+            queries.append(f"Regarding the schemas '{', '.join(schemas)}', the user asks: how does {topic} relate?")
+    return queries
+
+def bench_retrieval(snapshot_path: str, args) -> List[dict]:
+    """Run the same queries against every retrieval mode and measure the latency."""
+    from langchain_chroma import Chroma
+    from embedding_stage import HashingEmbeddings
+    from ingestion import get_index_version
+    from lexical_index import HybridRetriever, LexicalRetriever, load_lexical_index
+    from schema_index import load_schema_index
+    from vector_index import NumpyRetriever, load_numpy_index
+
+    index_version = get_index_version(snapshot_path)
+    embeddings = HashingEmbeddings()
+    queries = benchmark_queries(args.queries, args.seed)
+
+    searches = {}
+    for mode in args.retrieval_modes:
+        started = time.perf_counter()
+        if mode == "chroma":
+            retriever = Chroma(persist_directory=snapshot_path, embedding_function=embeddings).as_retriever(
+                search_kwargs={"k": args.k}
+            )
+            search = retriever.invoke
+        elif mode == "numpy":
+            search = NumpyRetriever(index=load_numpy_index(snapshot_path, index_version), embeddings=embeddings, k=args.k).invoke
+        elif mode == "hybrid":
+            vector_retriever = NumpyRetriever(
+                index=load_numpy_index(snapshot_path, index_version), embeddings=embeddings, k=args.candidates
+            )
+            search = HybridRetriever(
+                vector_retriever=vector_retriever, index=load_lexical_index(snapshot_path, index_version),
+                k=args.k, candidates=args.candidates,
+            ).invoke
+        elif mode == "lexical":
+            search = LexicalRetriever(index=load_lexical_index(snapshot_path, index_version), k=args.k).invoke
+        else:
+            schema_index = load_schema_index(snapshot_path, embeddings, index_version)
+            search = lambda query: schema_index.lookup([name.strip() for name in query.split(",")], args.k)
+        search(queries[0])  # Warm-up: opens files, builds caches
+        searches[mode] = (search, time.perf_counter() - started)
+
+    results = []
+    print(f"{'mode':<13} {'load s':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for mode, (search, load_seconds) in searches.items():
+        # The schema index only answers analysis queries (bare schema names)
+        mode_queries = [query for query in queries if "asks:" not in query] if mode == "schema_index" else queries
+        latencies = []
+        for query in mode_queries:
+            started = time.perf_counter()
+            search(query)
+            latencies.append((time.perf_counter() - started) * 1000)
+        result = {"mode": mode, "queries": len(mode_queries), "load_seconds": round(load_seconds, 3),
+                  **{f"{name}_ms": value for name, value in percentiles(latencies).items()}}
+        results.append(result)
+        print(f"{mode:<13} {result['load_seconds']:>7} {result['p50_ms']:>8} {result['p95_ms']:>8} {result['p99_ms']:>8}")
+    return results
+
+# --- Load test ---
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def start_server(work_dir: str, snapshots_dir: str, port: int, args) -> subprocess.Popen:
+    """Start main.py under uvicorn with the fake models, loading the prebuilt snapshot."""
+    env = dict(os.environ)
+    env.update({
+        "GOOGLE_API_KEY": "offline",
+        "MY_APP_SECRET_KEY": API_KEY,
+        "EMBEDDING_BACKEND": "fake",
+        "LLM_BACKEND": "fake",
+        "INDEX_SNAPSHOT_DIR": snapshots_dir,
+        "INDEX_BUILD_ON_STARTUP": "false",
+        "FAKE_EMBEDDING_LATENCY_SECONDS": str(args.embedding_latency),
+        "FAKE_LLM_LATENCY_SECONDS": str(args.llm_latency),
+        "FAKE_LLM_TOKENS_PER_SECOND": str(args.llm_tokens_per_second),
+        "FAKE_LLM_RESPONSE_TOKENS": str(args.llm_response_tokens),
+        "FAKE_LLM_STALL_PROBABILITY": str(args.llm_stall_probability),
+    })
+    if not args.cache:
+        env["RESPONSE_CACHE_TTL_SECONDS"] = "0"
+    for setting in args.server_env:
+        name, _, value = setting.partition("=")
+        env[name] = value
+
+    log_file = open(os.path.join(work_dir, "server.log"), 'w')
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--app-dir", REPO_DIR,
+         "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=work_dir, env=env, stdout=log_file, stderr=subprocess.STDOUT,
+    )
+
+async def wait_until_ready(base_url: str, server: subprocess.Popen):
+    import httpx
+
+    deadline = time.monotonic() + SERVER_START_TIMEOUT_SECONDS
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                raise RuntimeError("Server exited during startup, see server.log")
+            try:
+                if (await client.get("/ready")).status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"Server not ready after {SERVER_START_TIMEOUT_SECONDS}s")
+
+def scenario_request(scenario: str, rng: random.Random) -> tuple:
+    """Return the path and JSON body of one request of a scenario."""
+    from schema_index import SCHEMAS
+
+    schemas = rng.sample(list(SCHEMAS), rng.randint(1, 3))
+    if scenario == "analyze":
+        return "/analyze-schemas/", {"schemas": schemas}
+    question = f"How does {rng.choice(FILLER_WORDS)} relate to my schemas? ({rng.getrandbits(32):08x})"
+    path = "/chat-with-results/stream" if scenario == "chat_stream" else "/chat-with-results/"
+    return path, {"schemas": schemas, "question": question}
+
+async def timed_request(client, scenario: str, path: str, body: dict) -> dict:
+    """Send one request; streams are read to the end and timed to their first token event."""
+    started = time.perf_counter()
+    first_token = None
+    if scenario == "chat_stream":
+        async with client.stream("POST", path, json=body) as response:
+            async for line in response.aiter_lines():
+                if first_token is None and line.startswith("event: token"):
+                    first_token = time.perf_counter() - started
+                if line.startswith("event: error"):
+                    return {"status": "stream_error", "seconds": time.perf_counter() - started, "ttft": first_token}
+            status_code = response.status_code
+    else:
+        status_code = (await client.post(path, json=body)).status_code
+    return {"status": str(status_code), "seconds": time.perf_counter() - started, "ttft": first_token}
+
+async def run_load(base_url: str, scenario: str, concurrency: int, requests: int, seed: int) -> dict:
+    """Send `requests` requests from `concurrency` concurrent clients and summarize them."""
+    import httpx
+
+    rng = random.Random(seed)
+    payloads = [scenario_request(scenario, rng) for _ in range(requests)]
+    outcomes = []
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, headers={"X-API-Key": API_KEY},
+                                 timeout=httpx.Timeout(600.0), limits=limits) as client:
+        async def worker():
+            while payloads:
+                path, body = payloads.pop()
+                try:
+                    outcomes.append(await timed_request(client, scenario, path, body))
+                except httpx.HTTPError as e:
+                    outcomes.append({"status": type(e).__name__, "seconds": None, "ttft": None})
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        wall_seconds = time.perf_counter() - started
+
+    statuses: Dict[str, int] = {}
+    for outcome in outcomes:
+        statuses[outcome["status"]] = statuses.get(outcome["status"], 0) + 1
+    succeeded = [outcome for outcome in outcomes if outcome["status"] == "200"]
+    latencies = [outcome["seconds"] * 1000 for outcome in succeeded]
+    ttfts = [outcome["ttft"] * 1000 for outcome in succeeded if outcome["ttft"] is not None]
+    result = {
+        "scenario": scenario,
+        "concurrency": concurrency,
+        "requests": requests,
+        "wall_seconds": round(wall_seconds, 3),
+        "rps": round(len(succeeded) / wall_seconds, 2),
+        "error_rate": round(1 - len(succeeded) / requests, 4),
+        "statuses": statuses,
+        **{f"{name}_ms": value for name, value in percentiles(latencies).items()},
+    }
+    if scenario == "chat_stream":
+        result.update({f"ttft_{name}_ms": value for name, value in percentiles(ttfts).items()})
+    return result
+
+def bench_load(work_dir: str, snapshots_dir: str, args) -> List[dict]:
+    """Run every scenario at every concurrency level against a server with the fake models."""
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    server = start_server(work_dir, snapshots_dir, port, args)
+    results = []
+    try:
+        asyncio.run(wait_until_ready(base_url, server))
+        print(f"{'scenario':<12} {'conc':>5} {'rps':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}")
+        for scenario in args.scenarios:
+            for concurrency in args.concurrency:
+                result = asyncio.run(run_load(base_url, scenario, concurrency, args.requests, args.seed))
+                results.append(result)
+                print(
+                    f"{scenario:<12} {concurrency:>5} {result['rps']:>8} {result['p50_ms']!s:>9} "
+                    f"{result['p95_ms']!s:>9} {result['p99_ms']!s:>9} {result['error_rate']:>7}"
+                )
+    except RuntimeError:
+        with open(os.path.join(work_dir, "server.log"), 'r') as file:
+            sys.stderr.write(file.read()[-4000:])
+        raise
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            server.kill()
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ingestion, retrieval and the API with offline fake models")
+    parser.add_argument("--suites", nargs="+", choices=SUITES, default=SUITES)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 50, 200],
+                        help="Corpus sizes in documents; retrieval and load use the largest")
+    parser.add_argument("--pages", type=int, default=4, help="Pages per synthetic document")
+    parser.add_argument("--words-per-page", type=int, default=400, help="Words per synthetic page")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Extraction worker processes")
+    parser.add_argument("--batch-size", type=int, default=100, help="Chunks per embedding request")
+    parser.add_argument("--max-in-flight", type=int, default=4, help="Concurrent embedding requests")
+    parser.add_argument("--embedding-latency", type=float, default=0.05, help="Fake embedding latency per request (s)")
+    parser.add_argument("--embedding-seconds-per-text", type=float, default=0.002,
+                        help="Fake embedding latency per text in a batch (s)")
+    parser.add_argument("--retrieval-modes", nargs="+", choices=RETRIEVAL_MODES, default=RETRIEVAL_MODES)
+    parser.add_argument("--queries", type=int, default=200, help="Queries per retrieval mode")
+    parser.add_argument("--k", type=int, default=5, help="Chunks returned per query")
+    parser.add_argument("--candidates", type=int, default=20, help="Chunks per ranking before hybrid fusion")
+    parser.add_argument("--scenarios", nargs="+", choices=LOAD_SCENARIOS, default=LOAD_SCENARIOS)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32], help="Concurrent clients")
+    parser.add_argument("--requests", type=int, default=100, help="Requests per scenario and concurrency level")
+    parser.add_argument("--llm-latency", type=float, default=0.8, help="Fake LLM time to first token (s)")
+    parser.add_argument("--llm-tokens-per-second", type=float, default=60, help="Fake LLM output rate")
+    parser.add_argument("--llm-response-tokens", type=int, default=300, help="Fake LLM tokens per answer")
+    parser.add_argument("--llm-stall-probability", type=float, default=0, help="Share of fake LLM calls that stall")
+    parser.add_argument("--cache", action="store_true", help="Keep the response cache enabled during load tests")
+    parser.add_argument("--server-env", nargs="*", default=[], metavar="NAME=VALUE",
+                        help="Extra environment variables for the server, e.g. MAX_CONCURRENT_REQUESTS=16")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the corpus, queries and request payloads")
+    parser.add_argument("--json", default=None, help="Write the results to this JSON file")
+    parser.add_argument("--keep", action="store_true", help="Keep the work directory with corpora and snapshots")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    report = {
+        "commit": git_commit(),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "config": vars(args),
+    }
+
+    work_dir = tempfile.mkdtemp(prefix="bench-rag-")
+    try:
+        largest = max(args.sizes)
+        if "ingestion" in args.suites:
+            report["ingestion"] = bench_ingestion(work_dir, args)
+
+        snapshots_dir = os.path.join(work_dir, f"snapshots-{largest}")
+        if {"retrieval", "load"} & set(args.suites):
+            # Reuses the snapshot built by the ingestion suite if there is one
+            corpus_dir = os.path.join(work_dir, f"corpus-{largest}")
+            if not os.path.exists(corpus_dir):
+                build_corpus(corpus_dir, largest, args.pages, args.words_per_page, args.seed)
+            snapshot_path = build_snapshot(corpus_dir, snapshots_dir, args)
+            if snapshot_path is None:
+                raise RuntimeError(f"Index build failed for {largest} documents")
+
+        if "retrieval" in args.suites:
+            report["retrieval"] = bench_retrieval(snapshot_path, args)
+        if "load" in args.suites:
+            report["load"] = bench_load(work_dir, snapshots_dir, args)
+    finally:
+        if args.keep:
+            print(f"Work directory kept at {work_dir}")
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as file:
+            json.dump(report, file, indent=2)
+
+if __name__ == "__main__":
+    main()
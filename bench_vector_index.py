@@ -0,0 +1,149 @@
+"""
+Benchmark: Chroma vs. the memory-mapped NumPy vector index.
+
+For each corpus size, a synthetic collection of random normalized embeddings is
+written to a fresh ChromaDB directory and exported to a NumPy index. Each
+backend is then loaded in its own subprocess, which runs the same top-k queries
+(by vector, so embedding cost is excluded) and reports query latency
+percentiles, load time and resident memory.
+
+Usage:
+    python bench_vector_index.py --sizes 1000 5000 20000 --queries 200
+    python bench_vector_index.py --json results.json
+"""
+
+import argparse
+import json
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ["chroma", "numpy-float32", "numpy-float16"]
+
+def current_rss_mb() -> float:
+    """Resident set size of this process in MiB (Linux), or peak RSS elsewhere."""
+    try:
+        with open("/proc/self/status", 'r') as file:
+            for line in file:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def build_corpus(db_path: str, size: int, dimensions: int, seed: int = 0):
+    """Write `size` random chunks to a ChromaDB directory and export its NumPy index."""
+    import chromadb
+    from vector_index import export_numpy_index
+
+    rng = np.random.default_rng(seed)
+    client = chromadb.PersistentClient(path=db_path)
+    collection = client.get_or_create_collection("langchain")
+    batch_size = 1000
+    for start in range(0, size, batch_size):
+        count = min(batch_size, size - start)
+        vectors = rng.standard_normal((count, dimensions)).astype(np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        collection.upsert(
+            ids=[f"chunk-{i:07d}" for i in range(start, start + count)],
+            embeddings=vectors.tolist(),
+            documents=[f"Synthetic chunk {i} " + "lorem ipsum " * 80 for i in range(start, start + count)],
+            metadatas=[{"source": f"doc-{i // 50}.pdf", "chunk_index": i % 50} for i in range(start, start + count)],
+        )
+    del client
+    export_numpy_index(db_path, index_version="benchmark")
+
+def run_backend(backend: str, db_path: str, queries: int, k: int, dimensions: int) -> dict:
+    """Load one backend, run the queries and return latency and memory figures."""
+    baseline_rss = current_rss_mb()
+    rng = np.random.default_rng(1)
+    query_vectors = rng.standard_normal((queries, dimensions)).astype(np.float32)
+    query_vectors /= np.linalg.norm(query_vectors, axis=1, keepdims=True)
+
+    started = time.perf_counter()
+    if backend == "chroma":
+        from langchain_chroma import Chroma
+        from embedding_stage import HashingEmbeddings
+        vectorstore = Chroma(persist_directory=db_path, embedding_function=HashingEmbeddings(dimensions))
+        search = lambda vector: vectorstore.similarity_search_by_vector(vector.tolist(), k=k)
+    else:
+        from vector_index import NumpyVectorIndex, get_numpy_index_path
+        index = NumpyVectorIndex.load(get_numpy_index_path(db_path), dtype=backend.split("-")[1])
+        search = lambda vector: index.documents([row for row, _ in index.search(vector, k)])
+
+    search(query_vectors[0])  # Warm-up: opens files, builds caches
+    load_seconds = time.perf_counter() - started
+
+    latencies = []
+    for vector in query_vectors:
+        query_started = time.perf_counter()
+        search(vector)
+        latencies.append((time.perf_counter() - query_started) * 1000)
+
+    return {
+        "backend": backend,
+        "load_seconds": round(load_seconds, 3),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 3),
+        "p99_ms": round(float(np.percentile(latencies, 99)), 3),
+        "rss_mb": round(current_rss_mb(), 1),
+        "rss_delta_mb": round(current_rss_mb() - baseline_rss, 1),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Chroma against the NumPy vector index")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 5000, 20000], help="Corpus sizes in chunks")
+    parser.add_argument("--dimensions", type=int, default=768, help="Embedding dimensions")
+    parser.add_argument("--queries", type=int, default=200, help="Queries per backend and size")
+    parser.add_argument("--k", type=int, default=5, help="Chunks returned per query")
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=BACKENDS)
+    parser.add_argument("--json", default=None, help="Write the results to this JSON file")
+    parser.add_argument("--worker", nargs=2, metavar=("BACKEND", "DB_PATH"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        backend, db_path = args.worker
+        print(json.dumps(run_backend(backend, db_path, args.queries, args.k, args.dimensions)))
+        return
+
+    logging.basicConfig(level=logging.WARNING)
+    results = []
+    print(f"{'chunks':>8}  {'backend':<14} {'load s':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'RSS MiB':>8} {'+RSS':>7}")
+    for size in args.sizes:
+        work_dir = tempfile.mkdtemp(prefix="bench-vector-index-")
+        try:
+            db_path = os.path.join(work_dir, "db")
+            build_corpus(db_path, size, args.dimensions)
+            for backend in args.backends:
+                # Each backend runs in a fresh process so RSS figures do not mix
+                output = subprocess.run(
+                    [sys.executable, os.path.abspath(__file__), "--worker", backend, db_path,
+                     "--queries", str(args.queries), "--k", str(args.k), "--dimensions", str(args.dimensions)],
+                    check=True, capture_output=True, text=True,
+                ).stdout
+                result = json.loads(output.strip().splitlines()[-1])
+                result["chunks"] = size
+                results.append(result)
+                print(
+                    f"{size:>8}  {backend:<14} {result['load_seconds']:>7} {result['p50_ms']:>8} "
+                    f"{result['p95_ms']:>8} {result['p99_ms']:>8} {result['rss_mb']:>8} {result['rss_delta_mb']:>7}"
+                )
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as file:
+            json.dump(results, file, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""
+Session-scoped context for follow-up chat.
+
+A client usually requests one analysis and then asks several chat questions
+about the same schema set. With a session ID, the context chunks of the first
+turn (or of the analysis) are kept on the server, and follow-up turns reuse
+them instead of embedding the question and searching the index again. Every
+turn of a session also sends the model the same context, so the prompt prefix
+stays stable across turns.
+
+A follow-up can move to another topic, though. The cached context is only
+reused when every schema the question names is covered by the session and
+enough of its terms occur in the context; otherwise the turn retrieves again
+and the fresh chunks are merged in front of the session context.
+
+Sessions live in an in-memory LRU with a sliding TTL. A session only matches
+requests for the same schema set against the same index version; after a
+reload, its next turn retrieves again.
+"""
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import TYPE_CHECKING, Dict, List, Optional, Set
+
+from response_cache import normalize_schemas
+
+if TYPE_CHECKING:
+    from langchain_core.documents import Document
+
+logger = logging.getLogger(__name__)
+
+MIN_TERM_LENGTH = 4  # Shorter words (articles, pronouns, "how") say nothing about the topic
+TERM_STEM_LENGTH = 5  # Same prefix stemming as the lexical index
+MAX_SCHEMA_ALIAS_WORDS = 6  # Longest schema alias, in words
+
+@lru_cache(maxsize=1)
+def _alias_table() -> Dict[str, str]:
+    # Imported here so that importing this module does not load LangChain
+    from schema_index import build_alias_table
+    return build_alias_table()
+
+def _normalize(text: str) -> str:
+    from schema_index import normalize_alias
+    return normalize_alias(text)
+
+def question_terms(text: str) -> Set[str]:
+    """Return the case- and accent-folded, prefix-stemmed content words of a text."""
+    return {word[:TERM_STEM_LENGTH] for word in _normalize(text).split() if len(word) >= MIN_TERM_LENGTH}
+
+def named_schemas(text: str) -> Set[str]:
+    """Return the canonical schemas whose name or alias occurs in a text."""
+    aliases = _alias_table()
+    words = _normalize(text).split()
+    found = set()
+    for size in range(1, MAX_SCHEMA_ALIAS_WORDS + 1):
+        for start in range(len(words) - size + 1):
+            canonical = aliases.get(" ".join(words[start:start + size]))
+            if canonical is not None:
+                found.add(canonical)
+    return found
+
+class ChatSessionStore:
+    """
+    LRU store of the context chunks of chat sessions.
+
+    Args:
+        max_sessions: Maximum number of sessions kept
+        ttl_seconds: Idle time after which a session expires
+        min_overlap: Share of a follow-up's terms that must occur in the session
+            context for the context to be reused
+        max_documents: Maximum number of chunks kept per session once fresh
+            chunks are merged in
+    """
+
+    def __init__(self, max_sessions: int = 1000, ttl_seconds: float = 1800, min_overlap: float = 0.5,
+                 max_documents: int = 20):
+        self.max_sessions = max(1, max_sessions)
+        self.ttl_seconds = ttl_seconds
+        self.min_overlap = min_overlap
+        self.max_documents = max(1, max_documents)
+        self._sessions: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+
+    def get(self, session_id: str, schemas: List[str], index_version: Optional[str]) -> Optional[List["Document"]]:
+        """
+        Return the context chunks of a session, or None if the session is unknown,
+        expired, or was started for other schemas or another index version.
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is not None:
+                session_schemas, session_version, documents, last_used = entry
+                if now - last_used >= self.ttl_seconds or session_version != index_version:
+                    del self._sessions[session_id]
+                elif session_schemas == normalize_schemas(schemas):
+                    self._sessions[session_id] = (session_schemas, session_version, documents, now)
+                    self._sessions.move_to_end(session_id)
+                    self.hits += 1
+                    return documents
+            self.misses += 1
+            return None
+
+    def set(self, session_id: str, schemas: List[str], index_version: Optional[str], documents: List["Document"]):
+        """Store the context chunks of a session, replacing any earlier context."""
+        with self._lock:
+            self._sessions[session_id] = (normalize_schemas(schemas), index_version, documents, time.time())
+            self._sessions.move_to_end(session_id)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+
+    def covers(self, documents: List["Document"], schemas: List[str], question: str) -> bool:
+        """
+        Return whether a session context can answer a follow-up question: every
+        schema the question names is a session schema or occurs in the context,
+        and at least `min_overlap` of its terms occur in the context. Counts a
+        refresh otherwise.
+        """
+        aliases = _alias_table()
+        context = "\n".join(document.page_content for document in documents)
+        covered_schemas = {aliases.get(_normalize(schema), schema) for schema in schemas} | named_schemas(context)
+        other_schemas = named_schemas(question) - covered_schemas
+        terms = question_terms(question)
+        if other_schemas:
+            reason = f"names other schemas {sorted(other_schemas)}"
+        elif terms:
+            context_terms = question_terms(context)
+            overlap = len(terms & context_terms) / len(terms)
+            if overlap >= self.min_overlap:
+                return True
+            reason = f"shares {overlap:.0%} of its terms with the context"
+        else:
+            return True
+        logger.info(f"Follow-up question {reason}, retrieving its context again")
+        with self._lock:
+            self.refreshes += 1
+        return False
+
+    def merge(self, fresh: List["Document"], documents: List["Document"]) -> List["Document"]:
+        """
+        Put freshly retrieved chunks in front of a session context, dropping
+        duplicates and keeping at most `max_documents` chunks.
+        """
+        merged, seen = [], set()
+        for document in [*fresh, *documents]:
+            key = document.id or document.page_content
+            if key not in seen:
+                seen.add(key)
+                merged.append(document)
+        return merged[:self.max_documents]
+
+    def stats(self) -> dict:
+        """Return hit/miss/refresh counters and the number of stored sessions."""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "refreshes": self.refreshes,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "sessions": len(self._sessions),
+        }
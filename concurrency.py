@@ -0,0 +1,125 @@
+"""
+Admission control for the Schema Therapy RAG API.
+
+Limits how many LLM-backed requests run at the same time and how many may wait
+for a slot. Requests beyond the queue cap, or that wait longer than the queue
+timeout, are rejected straight away instead of piling up behind slow calls.
+
+Identical requests that arrive while one is already being generated are
+coalesced onto that generation (single-flight) instead of calling the LLM again.
+"""
+
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, Dict
+
+class ServerOverloadedError(Exception):
+    """Raised when a request cannot be admitted because the server is at capacity."""
+
+class ConcurrencyLimiter:
+    """
+    Async concurrency limiter with a bounded wait queue.
+
+    Args:
+        max_concurrent: Maximum number of requests running at the same time
+        max_queued: Maximum number of requests waiting for a free slot
+        queue_timeout: Maximum time in seconds a request waits for a slot
+    """
+
+    def __init__(self, max_concurrent: int, max_queued: int, queue_timeout: float):
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queued = max(0, max_queued)
+        self.queue_timeout = queue_timeout
+        self._semaphore = asyncio.Semaphore(self.max_concurrent)
+        self._active = 0
+        self._waiting = 0
+
+    @property
+    def active(self) -> int:
+        """Number of requests currently holding a slot."""
+        return self._active
+
+    @property
+    def waiting(self) -> int:
+        """Number of requests currently waiting for a slot."""
+        return self._waiting
+
+    @asynccontextmanager
+    async def slot(self):
+        """
+        Hold one concurrency slot for the duration of the block.
+
+        Raises:
+            ServerOverloadedError: If the wait queue is full or no slot frees up in time
+        """
+        if not self._semaphore.locked():
+            # A slot is free: acquiring it completes without suspending
+            await self._semaphore.acquire()
+        else:
+            if self._waiting >= self.max_queued:
+                raise ServerOverloadedError(
+                    f"Server is at capacity ({self._active} running, {self._waiting} queued)"
+                )
+
+            self._waiting += 1
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout)
+            except asyncio.TimeoutError:
+                raise ServerOverloadedError(f"No capacity available within {self.queue_timeout:g}s")
+            finally:
+                self._waiting -= 1
+
+        self._active += 1
+        try:
+            yield
+        finally:
+            self._active -= 1
+            self._semaphore.release()
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key into a single execution.
+
+    The first caller for a key starts the work as a task; callers that arrive
+    while it runs await the same task and receive the same result or error.
+    A caller that is cancelled does not cancel the shared work.
+    """
+
+    def __init__(self):
+        self._calls: Dict[str, asyncio.Task] = {}
+        self.coalesced = 0
+
+    @property
+    def in_flight(self) -> int:
+        """Number of distinct keys currently being executed."""
+        return len(self._calls)
+
+    async def run(self, key: str, work: Callable[[], Awaitable]):
+        """
+        Run `work()` for a key, or join the execution already running for it.
+
+        Args:
+            key: Identity of the call, e.g. a response cache key
+            work: Coroutine function that performs the call
+
+        Returns:
+            The result of the shared execution
+        """
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(work())
+            self._calls[key] = task
+            task.add_done_callback(lambda finished: self._finish(key, finished))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def _finish(self, key: str, task: asyncio.Task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            task.exception()  # Mark the error as retrieved if every caller has gone
+
+    def stats(self) -> dict:
+        """Return the number of running and coalesced calls."""
+        return {"in_flight": self.in_flight, "coalesced": self.coalesced}
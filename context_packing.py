@@ -0,0 +1,189 @@
+"""
+Context assembly between retrieval and generation.
+
+Chunks are cut with a 200-character overlap, so retrieved chunks often repeat
+the same spans or come from neighbouring regions of one file. Before the
+chunks are placed into the prompt, the `ContextPacker`:
+
+1. merges chunks of the same file whose character ranges overlap or touch
+   into one passage, keeping the overlapping text only once,
+2. drops passages that are near-duplicates of a better-ranked passage (for
+   example the same text in two copies of a document),
+3. packs passages in rank order up to a token budget, truncating the last one
+   at a word boundary.
+
+Token counts are estimated from the character count, which is close enough
+for budgeting and needs no tokenizer.
+"""
+
+import logging
+import re
+import threading
+from typing import List, Optional
+
+from langchain_core.documents import Document
+
+logger = logging.getLogger(__name__)
+
+CHARS_PER_TOKEN = 4  # Rough average for Gemini models on Latin-script text
+MERGE_GAP_CHARS = 2  # Ranges this close are merged; the splitter strips whitespace at chunk edges
+SHINGLE_SIZE = 5  # Words per shingle for near-duplicate detection
+MIN_TRUNCATED_TOKENS = 50  # A passage is only truncated to fit if at least this much of it remains
+
+def estimate_tokens(text: str) -> int:
+    """Estimate the number of tokens of a text."""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+def _shingles(text: str) -> set:
+    words = re.findall(r"\w+", text.casefold())
+    if len(words) <= SHINGLE_SIZE:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+class _Passage:
+    """A contiguous span of one source file, built from one or more chunks."""
+
+    def __init__(self, document: Document, rank: int):
+        self.source = document.metadata.get("source")
+        self.start = document.metadata.get("start_index")
+        self.text = document.page_content
+        self.rank = rank
+        self.metadata = dict(document.metadata)
+        self.chunks = 1
+
+    @property
+    def end(self) -> int:
+        return self.start + len(self.text)
+
+    def extend(self, document: Document, rank: int):
+        """Append a chunk that starts at or before the end of this passage."""
+        start = document.metadata["start_index"]
+        end = start + len(document.page_content)
+        if end > self.end:
+            if start <= self.end:
+                self.text += document.page_content[self.end - start:]
+            else:
+                self.text += "\n" + document.page_content
+        self.rank = min(self.rank, rank)
+        self.chunks += 1
+
+    def to_document(self) -> Document:
+        metadata = dict(self.metadata)
+        if self.chunks > 1:
+            metadata["merged_chunks"] = self.chunks
+        return Document(page_content=self.text, metadata=metadata)
+
+class ContextPacker:
+    """
+    Merges, deduplicates and budgets retrieved chunks before they reach the LLM.
+
+    Args:
+        max_tokens: Token budget for the packed context (0 disables the budget)
+        duplicate_threshold: Share of a passage's shingles found in a better-ranked
+            passage above which it is dropped (1.0 disables near-duplicate removal)
+    """
+
+    def __init__(self, max_tokens: int = 2000, duplicate_threshold: float = 0.8):
+        self.max_tokens = max_tokens
+        self.duplicate_threshold = duplicate_threshold
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.chunks_merged = 0
+        self.duplicates_dropped = 0
+        self.passages_truncated = 0
+
+    def _merge(self, documents: List[Document]) -> List[_Passage]:
+        """Merge chunks of the same file with overlapping or touching ranges, ordered by best rank."""
+        passages = []
+        mergeable = []
+        for rank, document in enumerate(documents):
+            if document.metadata.get("source") is None or document.metadata.get("start_index") is None:
+                passages.append(_Passage(document, rank))
+            else:
+                mergeable.append((document.metadata["source"], document.metadata["start_index"], rank, document))
+
+        current: Optional[_Passage] = None
+        for source, start, rank, document in sorted(mergeable, key=lambda item: item[:3]):
+            if current is not None and current.source == source and start <= current.end + MERGE_GAP_CHARS:
+                current.extend(document, rank)
+            else:
+                current = _Passage(document, rank)
+                passages.append(current)
+        return sorted(passages, key=lambda passage: passage.rank)
+
+    def _drop_duplicates(self, passages: List[_Passage]) -> List[_Passage]:
+        """Drop passages whose text is mostly contained in a better-ranked passage."""
+        if self.duplicate_threshold >= 1.0:
+            return passages
+        kept, kept_shingles = [], []
+        for passage in passages:
+            shingles = _shingles(passage.text)
+            if any(len(shingles & other) / len(shingles) >= self.duplicate_threshold for other in kept_shingles):
+                continue
+            kept.append(passage)
+            kept_shingles.append(shingles)
+        return kept
+
+    def _fit_budget(self, passages: List[_Passage]) -> List[_Passage]:
+        """Keep passages in rank order until the token budget is used up."""
+        if self.max_tokens <= 0:
+            return passages
+        packed = []
+        remaining = self.max_tokens
+        for passage in passages:
+            tokens = estimate_tokens(passage.text)
+            if tokens <= remaining:
+                packed.append(passage)
+                remaining -= tokens
+            elif remaining >= MIN_TRUNCATED_TOKENS:
+                cut = passage.text[:remaining * CHARS_PER_TOKEN]
+                passage.text = cut[:cut.rfind(" ")] if " " in cut else cut
+                packed.append(passage)
+                self.passages_truncated += 1
+                break
+            else:
+                break
+        return packed
+
+    def pack(self, documents: List[Document]) -> List[Document]:
+        """
+        Assemble the context for one request.
+
+        Args:
+            documents: Retrieved chunks, best first
+
+        Returns:
+            Merged, deduplicated passages within the token budget, best first
+        """
+        input_tokens = sum(estimate_tokens(document.page_content) for document in documents)
+        with self._lock:
+            merged = self._merge(documents)
+            deduplicated = self._drop_duplicates(merged)
+            packed = self._fit_budget(deduplicated)
+
+            output_tokens = sum(estimate_tokens(passage.text) for passage in packed)
+            self.requests += 1
+            self.input_tokens += input_tokens
+            self.output_tokens += output_tokens
+            self.chunks_merged += len(documents) - len(merged)
+            self.duplicates_dropped += len(merged) - len(deduplicated)
+
+        logger.info(
+            f"Packed {len(documents)} chunks into {len(packed)} passages "
+            f"(~{input_tokens} -> ~{output_tokens} tokens)"
+        )
+        return [passage.to_document() for passage in packed]
+
+    def stats(self) -> dict:
+        """Return cumulative packing counters, including the estimated tokens saved."""
+        return {
+            "requests": self.requests,
+            "input_tokens": self.input_tokens,
+            "packed_tokens": self.output_tokens,
+            "tokens_saved": self.input_tokens - self.output_tokens,
+            "chunks_merged": self.chunks_merged,
+            "duplicates_dropped": self.duplicates_dropped,
+            "passages_truncated": self.passages_truncated,
+        }
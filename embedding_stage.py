@@ -0,0 +1,309 @@
+"""
+Embedding stage for document ingestion.
+
+Embeds chunks in fixed-size batches with a bounded number of requests in
+flight, a token-bucket rate limit and retries with jittered exponential
+backoff, so a transient error or a rate-limit response only delays the batch it
+hit. Errors that cannot succeed on retry (authentication, invalid requests, an
+exhausted daily quota) fail the batch immediately.
+
+Retrieval queries go through `CachedQueryEmbeddings`, an LRU cache that lets
+repeated queries skip the embedding call.
+
+Three backends are available:
+- `google`: Google's text embedding model (used in production)
+- `hashing`: a deterministic, dependency-free feature-hashing embedding that runs
+  locally, for benchmarking ingestion throughput and testing without API access
+- `fake`: the hashing embedding with the request latency of a remote API (see
+  `fake_models.py`), for load tests
+"""
+
+import hashlib
+import logging
+import math
+import random
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from langchain_core.embeddings import Embeddings
+
+from metrics import EMBEDDING_BATCH_DURATION, EMBEDDING_BATCH_ERRORS, record_count, trace_stage
+
+logger = logging.getLogger(__name__)
+
+GOOGLE_EMBEDDING_MODEL = "models/text-embedding-004"  # Google embedding model used for indexing and retrieval
+HASHING_EMBEDDING_DIMENSIONS = 768
+EMBEDDING_BACKENDS = ["google", "hashing", "fake"]
+
+# HTTP statuses of embedding errors worth retrying: timeouts, rate limits and server errors
+TRANSIENT_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+# gRPC status names with the same meaning
+TRANSIENT_GRPC_CODES = {"DEADLINE_EXCEEDED", "RESOURCE_EXHAUSTED", "UNAVAILABLE", "INTERNAL", "ABORTED"}
+# A 429 whose message names a daily quota will not succeed until the quota resets
+DAILY_QUOTA_PATTERN = re.compile(r"per ?day|daily", re.IGNORECASE)
+
+def _status_code(error: BaseException) -> Optional[object]:
+    """Return the HTTP status (int) or gRPC status name (str) carried by `error`, if any."""
+    for value in (getattr(error, "code", None), getattr(error, "status_code", None),
+                  getattr(getattr(error, "response", None), "status_code", None)):
+        if callable(value):
+            # grpc.RpcError exposes its status as a method returning a StatusCode enum
+            try:
+                value = getattr(value(), "name", None)
+            except Exception:
+                value = None
+        if isinstance(value, (int, str)) and not isinstance(value, bool):
+            return value
+    return None
+
+def is_transient_error(error: BaseException) -> bool:
+    """
+    Return whether an embedding call that raised `error` may succeed if retried.
+
+    Timeouts, connection errors, rate limits (429) and server errors (5xx) are
+    transient. Everything else, including authentication and permission errors,
+    invalid arguments and exhausted daily quotas, is not. Client libraries often
+    wrap the original error, so the chain of causes is inspected as well.
+    """
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        if isinstance(error, (TimeoutError, ConnectionError)):
+            return True
+        # e.g. httpx.ConnectError/ReadTimeout and requests.ConnectionError, which do not
+        # derive from the builtin exceptions
+        name = type(error).__name__
+        if "Timeout" in name or name.startswith("Connect"):
+            return True
+        code = _status_code(error)
+        if code is not None:
+            if code in (429, "RESOURCE_EXHAUSTED") and DAILY_QUOTA_PATTERN.search(str(error)):
+                return False
+            return code in TRANSIENT_STATUS_CODES or code in TRANSIENT_GRPC_CODES
+        error = error.__cause__ or error.__context__
+    return False
+
+class HashingEmbeddings(Embeddings):
+    """
+    Deterministic local embeddings based on feature hashing.
+
+    Every word and word bigram is hashed to one of `dimensions` buckets with a
+    random-looking sign, and the resulting vector is L2-normalized. Texts that
+    share vocabulary end up close together, which is enough for offline tests and
+    throughput benchmarks. The same text always maps to the same vector.
+    """
+
+    def __init__(self, dimensions: int = HASHING_EMBEDDING_DIMENSIONS):
+        self.dimensions = dimensions
+
+    def _embed(self, text: str) -> List[float]:
+        vector = [0.0] * self.dimensions
+        words = re.findall(r"\w+", text.casefold())
+        features = words + [f"{first} {second}" for first, second in zip(words, words[1:])]
+        for feature in features:
+            digest = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "big")
+            sign = 1.0 if digest >> 63 else -1.0
+            vector[digest % self.dimensions] += sign
+
+        norm = math.sqrt(sum(value * value for value in vector))
+        if norm == 0:
+            return vector
+        return [value / norm for value in vector]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+class CachedQueryEmbeddings(Embeddings):
+    """
+    Wraps an embedding backend with an LRU cache for query embeddings.
+    Repeated retrieval queries skip the embedding call entirely. Document
+    embeddings are passed through uncached.
+    """
+
+    def __init__(self, embeddings: Embeddings, max_entries: int = 1024):
+        self.embeddings = embeddings
+        self.max_entries = max(1, max_entries)
+        self._cache: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _lookup(self, text: str) -> Optional[List[float]]:
+        with self._lock:
+            vector = self._cache.get(text)
+            if vector is None:
+                self.misses += 1
+                return None
+            self._cache.move_to_end(text)
+            self.hits += 1
+            return vector
+
+    def _store(self, text: str, vector: List[float]):
+        with self._lock:
+            self._cache[text] = vector
+            self._cache.move_to_end(text)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embeddings.embed_documents(texts)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await self.embeddings.aembed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        vector = self._lookup(text)
+        if vector is None:
+            with trace_stage("query_embedding"):
+                vector = self.embeddings.embed_query(text)
+            self._store(text, vector)
+        else:
+            record_count("query_embedding_cache_hits")
+        return vector
+
+    async def aembed_query(self, text: str) -> List[float]:
+        vector = self._lookup(text)
+        if vector is None:
+            with trace_stage("query_embedding"):
+                vector = await self.embeddings.aembed_query(text)
+            self._store(text, vector)
+        else:
+            record_count("query_embedding_cache_hits")
+        return vector
+
+    def stats(self) -> dict:
+        """Return hit/miss counters and the number of cached query embeddings."""
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self._cache)}
+
+def create_embeddings(backend: str = "google") -> Tuple[Embeddings, str]:
+    """
+    Create the embedding client for the given backend.
+    Returns the embeddings and the model name recorded in the index manifest.
+    """
+    if backend == "google":
+        from langchain_google_genai import GoogleGenerativeAIEmbeddings
+        return GoogleGenerativeAIEmbeddings(model=GOOGLE_EMBEDDING_MODEL), GOOGLE_EMBEDDING_MODEL
+    if backend == "hashing":
+        return HashingEmbeddings(), f"hashing-{HASHING_EMBEDDING_DIMENSIONS}"
+    if backend == "fake":
+        # Same vectors as the hashing backend, so both share one index version
+        from fake_models import FakeEmbeddings
+        return FakeEmbeddings(), f"hashing-{HASHING_EMBEDDING_DIMENSIONS}"
+    raise ValueError(f"Unknown embedding backend '{backend}'. Expected one of: {', '.join(EMBEDDING_BACKENDS)}")
+
+class TokenBucket:
+    """
+    Thread-safe token bucket rate limiter.
+    Allows bursts of up to `capacity` requests and refills at `rate` tokens per second.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a token is available, then take it."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait_time = (1 - self._tokens) / self.rate
+            time.sleep(wait_time)
+
+class EmbeddingStage:
+    """
+    Embeds batches of texts concurrently with rate limiting and retries.
+
+    Args:
+        embeddings: The embedding backend
+        batch_size: Number of texts sent per embedding request
+        max_in_flight: Maximum number of concurrent embedding requests
+        requests_per_minute: Rate limit for embedding requests (0 disables it)
+        max_retries: Number of retries of transient errors before a batch is given up
+        base_delay: Initial backoff delay in seconds
+        max_delay: Maximum backoff delay in seconds
+    """
+
+    def __init__(self, embeddings: Embeddings, batch_size: int = 100, max_in_flight: int = 4,
+                 requests_per_minute: float = 0, max_retries: int = 5,
+                 base_delay: float = 1.0, max_delay: float = 60.0):
+        self.embeddings = embeddings
+        self.batch_size = max(1, batch_size)
+        self.max_in_flight = max(1, max_in_flight)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._rate_limiter: Optional[TokenBucket] = None
+        if requests_per_minute > 0:
+            self._rate_limiter = TokenBucket(rate=requests_per_minute / 60.0, capacity=self.max_in_flight)
+
+    def embed_batch(self, texts: List[str]) -> List[List[float]]:
+        """Embed one batch, retrying transient errors with full-jitter exponential backoff."""
+        with EMBEDDING_BATCH_DURATION.time():
+            return self._embed_batch_with_retries(texts)
+
+    def _embed_batch_with_retries(self, texts: List[str]) -> List[List[float]]:
+        attempt = 0
+        while True:
+            if self._rate_limiter is not None:
+                self._rate_limiter.acquire()
+            try:
+                return self.embeddings.embed_documents(texts)
+            except Exception as e:
+                EMBEDDING_BATCH_ERRORS.inc()
+                if not is_transient_error(e):
+                    logger.error(f"Embedding batch of {len(texts)} failed with a non-retryable error: {str(e)}")
+                    raise
+                if attempt >= self.max_retries:
+                    raise
+                delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+                attempt += 1
+                logger.warning(
+                    f"Embedding batch of {len(texts)} failed ({str(e)}), "
+                    f"retry {attempt}/{self.max_retries} in {delay:.1f}s"
+                )
+                time.sleep(delay)
+
+    def embed_batches(self, batches: Iterable[Tuple[object, List[str]]]) -> Iterator[Tuple[object, List[List[float]]]]:
+        """
+        Embed `(key, texts)` batches with at most `max_in_flight` requests running.
+
+        Batches are pulled from the iterable lazily, only when a request slot is
+        free, and `(key, vectors)` pairs are yielded in completion order.
+        A batch that fails with a non-transient error, or still fails after all
+        retries, raises its last error.
+        """
+        batches = iter(batches)
+        with ThreadPoolExecutor(max_workers=self.max_in_flight) as executor:
+            pending = {}
+            for key, texts in batches:
+                pending[executor.submit(self.embed_batch, texts)] = key
+                if len(pending) >= self.max_in_flight:
+                    break
+
+            try:
+                while pending:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        key = pending.pop(future)
+                        for next_key, texts in batches:
+                            pending[executor.submit(self.embed_batch, texts)] = next_key
+                            break
+                        yield key, future.result()
+            finally:
+                for future in pending:
+                    future.cancel()
@@ -0,0 +1,163 @@
+"""
+Offline stand-ins for the Google embedding and chat models.
+
+Benchmarks and load tests need the latency profile of the real models without
+spending API quota. `FakeEmbeddings` returns the same vectors as the local
+hashing backend after an artificial per-request delay; `FakeChatModel` answers
+with deterministic text after a time-to-first-token delay and then emits tokens
+at a fixed rate, streamed or not. A share of its calls can be made to stall,
+to reproduce the tail latency that hedging and fallback are meant to cut.
+
+The defaults can be set with environment variables, so a server started with
+`EMBEDDING_BACKEND=fake LLM_BACKEND=fake` behaves like one talking to Gemini.
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+import random
+import time
+from typing import Any, AsyncIterator, Iterator, List, Optional
+
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from context_packing import estimate_tokens
+from embedding_stage import HASHING_EMBEDDING_DIMENSIONS, HashingEmbeddings
+
+logger = logging.getLogger(__name__)
+
+FAKE_EMBEDDING_LATENCY_SECONDS = float(os.getenv("FAKE_EMBEDDING_LATENCY_SECONDS", 0.05))  # Per embedding request
+FAKE_EMBEDDING_SECONDS_PER_TEXT = float(os.getenv("FAKE_EMBEDDING_SECONDS_PER_TEXT", 0.002))  # Added per embedded text
+FAKE_LLM_LATENCY_SECONDS = float(os.getenv("FAKE_LLM_LATENCY_SECONDS", 0.8))  # Time to first token
+FAKE_LLM_TOKENS_PER_SECOND = float(os.getenv("FAKE_LLM_TOKENS_PER_SECOND", 60))  # Output rate (0 = instant)
+FAKE_LLM_RESPONSE_TOKENS = int(os.getenv("FAKE_LLM_RESPONSE_TOKENS", 300))  # Tokens per answer
+FAKE_LLM_STALL_PROBABILITY = float(os.getenv("FAKE_LLM_STALL_PROBABILITY", 0))  # Share of calls that stall
+FAKE_LLM_STALL_SECONDS = float(os.getenv("FAKE_LLM_STALL_SECONDS", 30))  # Extra delay of a stalled call
+FAKE_FALLBACK_LLM_LATENCY_SECONDS = float(os.getenv("FAKE_FALLBACK_LLM_LATENCY_SECONDS", 0.3))  # Fallback time to first token
+FAKE_FALLBACK_LLM_TOKENS_PER_SECOND = float(os.getenv("FAKE_FALLBACK_LLM_TOKENS_PER_SECOND", 150))  # Fallback output rate
+
+# Words the fake answers are built from
+VOCABULARY = [
+    "şema", "terapi", "çocukluk", "ihtiyaç", "duygusal", "ilişki", "kişi", "davranış", "örüntü", "başa",
+    "çıkma", "mod", "farkındalık", "değişim", "bağlanma", "güven", "kendini", "hisseder", "genellikle",
+    "bu", "ve", "ile", "için", "olarak", "daha", "çok", "zamanla", "anlamak", "önemlidir",
+]
+
+class FakeEmbeddings(HashingEmbeddings):
+    """
+    Hashing embeddings with the request latency of a remote embedding API.
+
+    Vectors are identical to the `hashing` backend, so indexes built with either
+    backend are interchangeable.
+
+    Args:
+        latency_seconds: Delay of every embedding request
+        seconds_per_text: Additional delay per text in a batch
+        dimensions: Embedding dimensions
+    """
+
+    def __init__(self, latency_seconds: float = FAKE_EMBEDDING_LATENCY_SECONDS,
+                 seconds_per_text: float = FAKE_EMBEDDING_SECONDS_PER_TEXT,
+                 dimensions: int = HASHING_EMBEDDING_DIMENSIONS):
+        super().__init__(dimensions)
+        self.latency_seconds = latency_seconds
+        self.seconds_per_text = seconds_per_text
+
+    def _delay(self, count: int) -> float:
+        return self.latency_seconds + self.seconds_per_text * count
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        time.sleep(self._delay(len(texts)))
+        return super().embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        time.sleep(self._delay(1))
+        return super().embed_query(text)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        await asyncio.sleep(self._delay(len(texts)))
+        return super().embed_documents(texts)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        await asyncio.sleep(self._delay(1))
+        return super().embed_query(text)
+
+class FakeChatModel(BaseChatModel):
+    """
+    Chat model that answers deterministically with a configurable latency profile.
+
+    The answer depends only on the prompt, so repeated runs produce identical
+    output. Token usage is reported like Gemini does, with the prompt tokens
+    estimated from its length. Stalls are random per call, so a repeated
+    (hedged) call of a stalled prompt usually answers on time.
+    """
+
+    latency_seconds: float = FAKE_LLM_LATENCY_SECONDS
+    tokens_per_second: float = FAKE_LLM_TOKENS_PER_SECOND
+    response_tokens: int = FAKE_LLM_RESPONSE_TOKENS
+    stall_probability: float = FAKE_LLM_STALL_PROBABILITY
+    stall_seconds: float = FAKE_LLM_STALL_SECONDS
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    def _tokens(self, messages: List[BaseMessage]) -> List[str]:
+        prompt = "\n".join(str(message.content) for message in messages)
+        seed = int.from_bytes(hashlib.blake2b(prompt.encode("utf-8"), digest_size=8).digest(), "big")
+        rng = random.Random(seed)
+        return [rng.choice(VOCABULARY) + " " for _ in range(self.response_tokens)]
+
+    def _usage(self, messages: List[BaseMessage]) -> dict:
+        input_tokens = sum(estimate_tokens(str(message.content)) for message in messages)
+        return {
+            "input_tokens": input_tokens,
+            "output_tokens": self.response_tokens,
+            "total_tokens": input_tokens + self.response_tokens,
+        }
+
+    def _first_token_delay(self) -> float:
+        stalled = self.stall_probability > 0 and random.random() < self.stall_probability
+        return self.latency_seconds + (self.stall_seconds if stalled else 0.0)
+
+    def _token_delay(self) -> float:
+        return 1.0 / self.tokens_per_second if self.tokens_per_second > 0 else 0.0
+
+    def _result(self, messages: List[BaseMessage]) -> ChatResult:
+        message = AIMessage(content="".join(self._tokens(messages)).strip(), usage_metadata=self._usage(messages))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        time.sleep(self._first_token_delay() + self._token_delay() * self.response_tokens)
+        return self._result(messages)
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        await asyncio.sleep(self._first_token_delay() + self._token_delay() * self.response_tokens)
+        return self._result(messages)
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        time.sleep(self._first_token_delay())
+        tokens = self._tokens(messages)
+        for index, token in enumerate(tokens):
+            if index:
+                time.sleep(self._token_delay())
+            usage = self._usage(messages) if index == len(tokens) - 1 else None
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token, usage_metadata=usage))
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+                       **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        await asyncio.sleep(self._first_token_delay())
+        tokens = self._tokens(messages)
+        for index, token in enumerate(tokens):
+            if index:
+                await asyncio.sleep(self._token_delay())
+            usage = self._usage(messages) if index == len(tokens) - 1 else None
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token, usage_metadata=usage))
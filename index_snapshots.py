@@ -0,0 +1,186 @@
+"""
+Versioned, atomically published index snapshots.
+
+An index build writes a complete vector database, with its manifest, into a
+temporary directory next to the snapshots. Only after the build has succeeded
+is the directory renamed to its index version and the `CURRENT` pointer
+replaced, both with atomic renames. Readers therefore only ever see complete
+snapshots, and a crashed build leaves nothing that looks valid.
+
+A failed build keeps its directory, with the chunks it already embedded. The
+next build continues in the newest compatible build directory instead of
+starting over from the published snapshot; builds abandoned for longer than
+`STALE_BUILD_SECONDS` are removed by `prune_snapshots`.
+
+Layout:
+
+    index_snapshots/
+    ├── CURRENT                 # Name of the published snapshot
+    ├── 3f2a9c0d1e4b5a6f/       # One directory per index version
+    │   ├── manifest.json       # Corpus hash, chunk params, embedding model, files
+    │   ├── numpy_index/        # Memory-mapped export of the embeddings (see vector_index)
+    │   ├── lexical_index.json  # BM25 inverted index (see lexical_index)
+    │   ├── schema_index.json   # Precomputed chunks per canonical schema (see schema_index)
+    │   └── ...                 # ChromaDB files
+    └── .build-*/               # In-progress builds (never loaded)
+"""
+
+import logging
+import os
+import shutil
+import tempfile
+import time
+from typing import Optional
+
+from embedding_stage import EmbeddingStage
+from ingestion import load_manifest, manifest_is_compatible, plan_sync, save_manifest, sync_vector_database
+from lexical_index import build_lexical_index
+from schema_index import build_schema_index
+from vector_index import export_numpy_index
+
+logger = logging.getLogger(__name__)
+
+CURRENT_POINTER = "CURRENT"
+BUILD_PREFIX = ".build-"
+STALE_BUILD_SECONDS = 24 * 3600  # Build directories older than this are considered abandoned
+
+def get_current_snapshot(snapshots_dir: str) -> Optional[str]:
+    """
+    Return the path of the published snapshot, or None if nothing has been published.
+    """
+    pointer_path = os.path.join(snapshots_dir, CURRENT_POINTER)
+    if not os.path.exists(pointer_path):
+        return None
+    with open(pointer_path, 'r', encoding='utf-8') as file:
+        name = file.read().strip()
+    snapshot_path = os.path.join(snapshots_dir, name)
+    if not name or load_manifest(snapshot_path) is None:
+        logger.error(f"Published snapshot '{name}' in '{snapshots_dir}' is missing or has no manifest")
+        return None
+    return snapshot_path
+
+def publish_snapshot(snapshots_dir: str, name: str):
+    """Point CURRENT at a snapshot with an atomic rename."""
+    pointer_path = os.path.join(snapshots_dir, CURRENT_POINTER)
+    tmp_path = f"{pointer_path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as file:
+        file.write(name + "\n")
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp_path, pointer_path)
+    logger.info(f"Published index snapshot '{name}'")
+
+def prune_snapshots(snapshots_dir: str, keep: int):
+    """
+    Delete old snapshots, keeping the `keep` most recent and always the published one.
+    Abandoned directories of interrupted builds are removed too.
+    """
+    current = get_current_snapshot(snapshots_dir)
+    snapshots = []
+    for name in os.listdir(snapshots_dir):
+        path = os.path.join(snapshots_dir, name)
+        if not os.path.isdir(path):
+            continue
+        if name.startswith(BUILD_PREFIX):
+            if time.time() - os.path.getmtime(path) > STALE_BUILD_SECONDS:
+                logger.info(f"Removing abandoned build '{name}'")
+                shutil.rmtree(path, ignore_errors=True)
+        elif path != current:
+            snapshots.append((os.path.getmtime(path), path))
+
+    snapshots.sort(reverse=True)
+    for _, path in snapshots[max(0, keep - 1):]:
+        logger.info(f"Removing old index snapshot '{os.path.basename(path)}'")
+        shutil.rmtree(path, ignore_errors=True)
+
+def _find_resumable_build(snapshots_dir: str, embedding_model: str) -> Optional[str]:
+    """Return the newest build directory left by a failed build that can be continued, if any."""
+    builds = []
+    for name in os.listdir(snapshots_dir):
+        path = os.path.join(snapshots_dir, name)
+        if name.startswith(BUILD_PREFIX) and os.path.isdir(path):
+            manifest = load_manifest(path)
+            if manifest is not None and manifest_is_compatible(manifest, embedding_model):
+                builds.append((os.path.getmtime(path), path))
+    return max(builds)[1] if builds else None
+
+def build_index_snapshot(source_folder: str, snapshots_dir: str, embedding_stage: EmbeddingStage,
+                         embedding_model: str, workers: int = 1, base_path: Optional[str] = None,
+                         keep: int = 3, progress=None) -> Optional[str]:
+    """
+    Build an index snapshot for the source folder and publish it.
+
+    The build starts from a copy of the published snapshot (or `base_path` if
+    nothing is published yet), so only new or changed documents are embedded.
+    If an earlier build failed, it is continued instead, so the chunks it
+    embedded are not embedded again. If the source folder matches the
+    published snapshot, nothing is built.
+
+    Args:
+        source_folder: Folder containing PDF and DOCX files
+        snapshots_dir: Directory holding the snapshots and the CURRENT pointer
+        embedding_stage: Embedding stage used for new chunks
+        embedding_model: Name of the embedding model, recorded in the manifest
+        workers: Number of extraction worker processes
+        base_path: Existing vector database to start from when nothing is published
+        keep: Number of snapshots to keep
+        progress: Optional `progress(done, total)` callback for indexing progress
+
+    Returns:
+        The path of the published snapshot, or None if the build failed
+    """
+    os.makedirs(snapshots_dir, exist_ok=True)
+    current = get_current_snapshot(snapshots_dir)
+    base = current or base_path
+
+    base_manifest = load_manifest(base) if base else None
+    if base_manifest is None or not manifest_is_compatible(base_manifest, embedding_model):
+        base = None
+    elif current and not os.path.exists(source_folder):
+        logger.warning(f"Source folder '{source_folder}' does not exist!")
+        logger.warning(f"Keeping index snapshot '{os.path.basename(current)}'...")
+        return current
+    elif current and not plan_sync(source_folder, base_manifest).has_changes:
+        logger.info(f"Index snapshot '{os.path.basename(current)}' is up to date")
+        return current
+
+    build_path = _find_resumable_build(snapshots_dir, embedding_model)
+    try:
+        if build_path is not None:
+            logger.info(f"Resuming failed index build '{os.path.basename(build_path)}'")
+            # Keeps the directory from being pruned as abandoned while it is in use
+            os.utime(build_path)
+        else:
+            build_path = tempfile.mkdtemp(prefix=BUILD_PREFIX, dir=snapshots_dir)
+            if base:
+                logger.info(f"Starting index build from '{base}'")
+                shutil.rmtree(build_path)
+                shutil.copytree(base, build_path)
+
+        if not sync_vector_database(source_folder, build_path, embedding_stage, embedding_model,
+                                    workers=workers, progress=progress):
+            logger.error(f"Index build failed, keeping '{os.path.basename(build_path)}' to resume from")
+            return None
+
+        manifest = load_manifest(build_path)
+        export_numpy_index(build_path, manifest["index_version"])
+        build_lexical_index(build_path, manifest["index_version"])
+        build_schema_index(build_path, embedding_stage.embeddings, manifest["index_version"])
+        manifest["built_at"] = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+        save_manifest(build_path, manifest)
+
+        name = manifest["index_version"]
+        snapshot_path = os.path.join(snapshots_dir, name)
+        if os.path.exists(snapshot_path):
+            # The same corpus and settings were built before; reuse that snapshot
+            shutil.rmtree(build_path, ignore_errors=True)
+        else:
+            os.rename(build_path, snapshot_path)
+
+        publish_snapshot(snapshots_dir, name)
+        prune_snapshots(snapshots_dir, keep)
+        return snapshot_path
+
+    except Exception as e:
+        logger.error(f"Error building index snapshot: {str(e)}")
+        return None
@@ -0,0 +1,548 @@
+"""
+Document ingestion for the Schema Therapy RAG API.
+
+Extracts text from the PDF and DOCX files in the source folder, splits it into
+chunks and keeps the ChromaDB vector store in sync with the folder.
+
+Documents are extracted and chunked in a pool of worker processes and streamed
+back one document at a time, so memory use is bounded by the documents in
+flight rather than by the size of the whole corpus.
+
+A manifest stored next to the vector store records the content hash, mtime,
+chunk IDs and embedding model of every indexed file, so only new or changed
+files are extracted and embedded again and the chunks of removed files are
+deleted.
+"""
+
+import argparse
+import bisect
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional
+
+# Document processing imports
+import PyPDF2
+from docx import Document
+
+# LangChain imports
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_chroma import Chroma
+from langchain.schema import Document as LangChainDocument
+
+from embedding_stage import EMBEDDING_BACKENDS, EmbeddingStage, create_embeddings
+from metrics import INGESTION_CHUNKS, INGESTION_CHUNKS_PER_SECOND, INGESTION_FILES, INGESTION_FILES_PER_SECOND
+
+logger = logging.getLogger(__name__)
+
+SUPPORTED_EXTENSIONS = ['.pdf', '.docx']
+MANIFEST_FILENAME = "manifest.json"
+MANIFEST_FORMAT_VERSION = 2
+
+# Text chunking parameters
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
+
+def extract_pages_from_pdf(pdf_path: str) -> List[str]:
+    """Extract the text of each page of a PDF file."""
+    try:
+        with open(pdf_path, 'rb') as file:
+            pdf_reader = PyPDF2.PdfReader(file)
+            return [page.extract_text() or "" for page in pdf_reader.pages]
+    except Exception as e:
+        logger.error(f"Error reading PDF {pdf_path}: {str(e)}")
+        return []
+
+def extract_pages_from_docx(docx_path: str) -> List[str]:
+    """Extract text from a DOCX file. DOCX files have no pages, so the text is returned as a single page."""
+    try:
+        doc = Document(docx_path)
+        return ["\n".join(paragraph.text for paragraph in doc.paragraphs)]
+    except Exception as e:
+        logger.error(f"Error reading DOCX {docx_path}: {str(e)}")
+        return []
+
+def extract_pages_from_file(file_path: str) -> List[str]:
+    """Extract the page texts of a supported document based on its extension."""
+    file_extension = Path(file_path).suffix.lower()
+    if file_extension == '.pdf':
+        return extract_pages_from_pdf(file_path)
+    if file_extension == '.docx':
+        return extract_pages_from_docx(file_path)
+    return []
+
+def scan_source_folder(folder_path: str) -> Dict[str, str]:
+    """
+    Find all supported documents in the source folder.
+    Returns a mapping of filename to file path, sorted by filename.
+    """
+    files = {}
+    for filename in sorted(os.listdir(folder_path)):
+        file_path = os.path.join(folder_path, filename)
+        if Path(filename).suffix.lower() in SUPPORTED_EXTENSIONS and os.path.isfile(file_path):
+            files[filename] = file_path
+    return files
+
+def compute_file_hash(file_path: str) -> str:
+    """Compute the SHA-256 hash of a file's content."""
+    sha256 = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        for block in iter(lambda: file.read(1024 * 1024), b""):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+def make_chunk_ids(filename: str, content_hash: str, count: int) -> List[str]:
+    """
+    Build deterministic vector store IDs for the chunks of a file.
+    IDs depend on the filename and content, so identical files stored under
+    different names never share chunks.
+    """
+    name_digest = hashlib.sha1(filename.encode("utf-8")).hexdigest()[:8]
+    return [f"{name_digest}-{content_hash[:16]}-{index:05d}" for index in range(count)]
+
+def split_document(filename: str, pages: List[str]) -> List[LangChainDocument]:
+    """
+    Split the pages of a single document into chunks.
+    Each chunk is tagged with its source file, the page it starts on and its
+    character offset within the document.
+    """
+    text_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=CHUNK_SIZE,
+        chunk_overlap=CHUNK_OVERLAP,
+        length_function=len,
+        add_start_index=True,
+    )
+
+    header = f"\n--- Content from {filename} ---\n"
+    page_offsets = []
+    offset = len(header)
+    for page in pages:
+        page_offsets.append(offset)
+        offset += len(page) + 1
+    content = header + "\n".join(pages) + "\n"
+
+    documents = text_splitter.create_documents([content], metadatas=[{"source": filename}])
+    for index, document in enumerate(documents):
+        page_number = max(bisect.bisect_right(page_offsets, document.metadata["start_index"]), 1)
+        document.metadata["page"] = page_number
+        document.metadata["chunk_index"] = index
+    return documents
+
+class ExtractedDocument(NamedTuple):
+    """The chunks extracted from one source file."""
+    filename: str
+    chunks: List[LangChainDocument]
+
+def extract_document(filename: str, file_path: str) -> ExtractedDocument:
+    """Extract and chunk a single document. Runs inside the worker processes."""
+    pages = extract_pages_from_file(file_path)
+    if not any(page.strip() for page in pages):
+        return ExtractedDocument(filename, [])
+    return ExtractedDocument(filename, split_document(filename, pages))
+
+def iter_extracted_documents(files: Dict[str, str], workers: int = 1) -> Iterator[ExtractedDocument]:
+    """
+    Extract and chunk documents, yielding each one as soon as it is ready.
+
+    With more than one worker the documents are processed in a process pool.
+    At most two documents per worker are in flight at any time, so memory use
+    stays bounded however large the corpus is. Documents are yielded in
+    completion order.
+    """
+    tasks = iter(files.items())
+
+    if workers <= 1:
+        for filename, file_path in tasks:
+            yield extract_document(filename, file_path)
+        return
+
+    # Workers are not forked: this runs in threads of a server whose gRPC clients
+    # have live threads, and forking a process with running threads can deadlock
+    start_method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(start_method))
+    try:
+        pending = set()
+        for filename, file_path in tasks:
+            pending.add(pool.submit(extract_document, filename, file_path))
+            if len(pending) >= workers * 2:
+                break
+
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                for filename, file_path in tasks:
+                    pending.add(pool.submit(extract_document, filename, file_path))
+                    break
+                yield future.result()
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+def get_manifest_path(db_path: str) -> str:
+    """Return the path of the ingestion manifest stored next to the vector store."""
+    return os.path.join(db_path, MANIFEST_FILENAME)
+
+def load_manifest(db_path: str) -> Optional[dict]:
+    """
+    Load the ingestion manifest for a vector store.
+    Returns None if the manifest is missing or unreadable.
+    """
+    path = get_manifest_path(db_path)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'r', encoding='utf-8') as file:
+            return json.load(file)
+    except (OSError, ValueError) as e:
+        logger.error(f"Error reading manifest {path}: {str(e)}")
+        return None
+
+def save_manifest(db_path: str, manifest: dict):
+    """Write the ingestion manifest atomically, so a crash never leaves it half-written."""
+    path = get_manifest_path(db_path)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as file:
+        json.dump(manifest, file, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+def new_manifest(embedding_model: str) -> dict:
+    """Create an empty manifest for the given embedding model and chunking parameters."""
+    return {
+        "format_version": MANIFEST_FORMAT_VERSION,
+        "embedding_model": embedding_model,
+        "chunk_size": CHUNK_SIZE,
+        "chunk_overlap": CHUNK_OVERLAP,
+        "files": {},
+    }
+
+def compute_corpus_hash(manifest: dict) -> str:
+    """Hash the names and contents of all indexed files."""
+    files = {filename: entry["sha256"] for filename, entry in manifest.get("files", {}).items()}
+    return hashlib.sha256(json.dumps(files, sort_keys=True).encode("utf-8")).hexdigest()
+
+def compute_index_version(manifest: dict) -> str:
+    """
+    Fingerprint the indexed corpus and the settings it was indexed with.
+    Any added, changed or removed file, or a different embedding model or
+    chunking, yields a different version.
+    """
+    fingerprint = {
+        "format_version": manifest.get("format_version"),
+        "embedding_model": manifest.get("embedding_model"),
+        "chunk_size": manifest.get("chunk_size"),
+        "chunk_overlap": manifest.get("chunk_overlap"),
+        "corpus_hash": compute_corpus_hash(manifest),
+    }
+    payload = json.dumps(fingerprint, sort_keys=True).encode("utf-8")
+    return hashlib.sha256(payload).hexdigest()[:16]
+
+def get_index_version(db_path: str) -> Optional[str]:
+    """Return the version of the index stored at `db_path`, or None if it has no manifest."""
+    manifest = load_manifest(db_path)
+    if manifest is None:
+        return None
+    return manifest.get("index_version") or compute_index_version(manifest)
+
+def manifest_is_compatible(manifest: dict, embedding_model: str) -> bool:
+    """Check whether existing chunks can be reused with the current settings."""
+    return (
+        manifest.get("format_version") == MANIFEST_FORMAT_VERSION
+        and manifest.get("embedding_model") == embedding_model
+        and manifest.get("chunk_size") == CHUNK_SIZE
+        and manifest.get("chunk_overlap") == CHUNK_OVERLAP
+    )
+
+class SyncPlan(NamedTuple):
+    """Differences between the source folder and an index manifest."""
+    to_index: Dict[str, tuple]  # filename -> (file path, content hash, stat result)
+    removed: List[str]
+    unchanged: int
+
+    @property
+    def has_changes(self) -> bool:
+        return bool(self.to_index or self.removed)
+
+def plan_sync(folder_path: str, manifest: dict) -> SyncPlan:
+    """
+    Compare the source folder with a manifest.
+    Files whose size and mtime match the manifest are not hashed. Files that were
+    only touched keep their entry, with the new mtime recorded in `manifest`.
+    """
+    source_files = scan_source_folder(folder_path)
+    indexed_files = manifest["files"]
+
+    removed = [filename for filename in indexed_files if filename not in source_files]
+    to_index = {}
+    unchanged = 0
+
+    for filename, file_path in source_files.items():
+        stat = os.stat(file_path)
+        entry = indexed_files.get(filename)
+
+        # Unchanged size and mtime: trust the manifest without hashing
+        if entry and entry["mtime"] == stat.st_mtime and entry["size"] == stat.st_size:
+            unchanged += 1
+            continue
+
+        content_hash = compute_file_hash(file_path)
+        if entry and entry["sha256"] == content_hash:
+            entry["mtime"] = stat.st_mtime
+            entry["size"] = stat.st_size
+            unchanged += 1
+            continue
+
+        to_index[filename] = (file_path, content_hash, stat)
+
+    return SyncPlan(to_index, removed, unchanged)
+
+def sync_vector_database(folder_path: str, db_path: str, embedding_stage: EmbeddingStage,
+                         embedding_model: str, workers: int = 1,
+                         progress: Optional[Callable[[int, int], None]] = None) -> bool:
+    """
+    Bring the ChromaDB vector database in line with the documents in the source folder.
+
+    Only new or changed files are extracted, chunked and embedded; the chunks of
+    changed and removed files are deleted. Extraction runs in `workers`
+    processes and embedding runs through the batched, rate-limited embedding stage.
+
+    Completed batches are written to the vector store straight away and a file is
+    recorded in the manifest once all of its chunks are stored. Chunk IDs are
+    derived from the file content, so a failed run resumes where it stopped:
+    chunks that are already in the store are not embedded again.
+    `progress(done, total)` is called as new or changed files are completed.
+    Returns True if the database is ready to use, False otherwise.
+    """
+    manifest = load_manifest(db_path)
+
+    if not os.path.exists(folder_path):
+        if manifest is not None and manifest.get("files"):
+            logger.warning(f"Source folder '{folder_path}' does not exist!")
+            logger.warning("Using the existing vector database as is...")
+            return True
+        logger.error(f"Source folder '{folder_path}' does not exist!")
+        logger.error("Please create the folder and add your Schema Therapy documents.")
+        return False
+
+    # An empty directory (e.g. a new snapshot build) is a fresh database, not an incompatible one
+    has_data = os.path.isdir(db_path) and bool(os.listdir(db_path))
+    rebuild = has_data and (manifest is None or not manifest_is_compatible(manifest, embedding_model))
+    if rebuild:
+        logger.warning(f"Vector database at '{db_path}' has no compatible manifest")
+        logger.warning("Rebuilding the vector database from scratch...")
+        manifest = None
+
+    if manifest is None:
+        manifest = new_manifest(embedding_model)
+
+    try:
+        if rebuild:
+            # Cleared through Chroma rather than deleted from disk: Chroma caches its
+            # client per path, so a process that opened this database before would
+            # keep seeing the deleted chunks and skip embedding them again
+            Chroma(persist_directory=db_path, embedding_function=embedding_stage.embeddings).delete_collection()
+
+        logger.info(f"Synchronizing vector database with '{folder_path}'...")
+        indexed_files = manifest["files"]
+        to_index, removed, unchanged = plan_sync(folder_path, manifest)
+
+        logger.info(
+            f"Found {len(to_index)} new or changed, {len(removed)} removed "
+            f"and {unchanged} unchanged documents"
+        )
+
+        os.makedirs(db_path, exist_ok=True)
+        # Written before anything is embedded, so a failed run leaves a database
+        # that the next run recognizes and resumes
+        save_manifest(db_path, manifest)
+        vectorstore = Chroma(
+            persist_directory=db_path,
+            embedding_function=embedding_stage.embeddings
+        )
+        collection = vectorstore._collection
+
+        # Delete chunks of removed files and outdated chunks of changed files
+        for filename in removed + [name for name in to_index if name in indexed_files]:
+            chunk_ids = indexed_files[filename]["chunk_ids"]
+            if chunk_ids:
+                vectorstore.delete(ids=chunk_ids)
+            del indexed_files[filename]
+            save_manifest(db_path, manifest)
+
+        files_to_extract = {filename: file_path for filename, (file_path, _, _) in to_index.items()}
+        if files_to_extract:
+            logger.info(f"Extracting {len(files_to_extract)} documents with {workers} workers...")
+
+        # Manifest entries of files whose chunks are still being embedded,
+        # with the number of chunks left to store
+        pending_files = {}
+
+        files_done = 0
+        if progress is not None:
+            progress(0, len(to_index))
+
+        def commit_file(filename: str):
+            nonlocal files_done
+            indexed_files[filename] = pending_files.pop(filename)[0]
+            save_manifest(db_path, manifest)
+            files_done += 1
+            INGESTION_FILES.inc()
+            if progress is not None:
+                progress(files_done, len(to_index))
+
+        def iter_batches():
+            batch = []
+            for extracted in iter_extracted_documents(files_to_extract, workers):
+                filename = extracted.filename
+                _, content_hash, stat = to_index[filename]
+                chunk_ids = make_chunk_ids(filename, content_hash, len(extracted.chunks))
+
+                # Chunks stored by an interrupted run are not embedded again
+                existing_ids = set(collection.get(ids=chunk_ids, include=[])["ids"]) if chunk_ids else set()
+                missing = [
+                    (chunk_id, chunk) for chunk_id, chunk in zip(chunk_ids, extracted.chunks)
+                    if chunk_id not in existing_ids
+                ]
+                if not chunk_ids:
+                    logger.warning(f"No text extracted from {filename}")
+                elif existing_ids:
+                    logger.info(f"Resuming {filename}: {len(existing_ids)}/{len(chunk_ids)} chunks already stored")
+
+                pending_files[filename] = [{
+                    "sha256": content_hash,
+                    "mtime": stat.st_mtime,
+                    "size": stat.st_size,
+                    "chunk_ids": chunk_ids,
+                    "embedding_model": embedding_model,
+                }, len(missing)]
+                if not missing:
+                    commit_file(filename)
+                    continue
+
+                for chunk_id, chunk in missing:
+                    batch.append((filename, chunk_id, chunk))
+                    if len(batch) >= embedding_stage.batch_size:
+                        yield batch, [chunk.page_content for _, _, chunk in batch]
+                        batch = []
+            if batch:
+                yield batch, [chunk.page_content for _, _, chunk in batch]
+
+        embedded_chunks = 0
+        start_time = time.monotonic()
+        for batch, vectors in embedding_stage.embed_batches(iter_batches()):
+            collection.upsert(
+                ids=[chunk_id for _, chunk_id, _ in batch],
+                embeddings=vectors,
+                documents=[chunk.page_content for _, _, chunk in batch],
+                metadatas=[chunk.metadata for _, _, chunk in batch],
+            )
+            embedded_chunks += len(batch)
+            INGESTION_CHUNKS.inc(len(batch))
+
+            for filename, _, _ in batch:
+                pending_files[filename][1] -= 1
+            for filename in dict.fromkeys(filename for filename, _, _ in batch):
+                if pending_files[filename][1] == 0:
+                    logger.info(f"Indexed {len(pending_files[filename][0]['chunk_ids'])} chunks from {filename}")
+                    commit_file(filename)
+
+        elapsed = time.monotonic() - start_time
+        if files_done:
+            INGESTION_FILES_PER_SECOND.set(files_done / max(elapsed, 1e-9))
+            INGESTION_CHUNKS_PER_SECOND.set(embedded_chunks / max(elapsed, 1e-9))
+        if embedded_chunks:
+            logger.info(
+                f"Embedded {embedded_chunks} chunks in {elapsed:.1f}s "
+                f"({embedded_chunks / max(elapsed, 1e-9):.1f} chunks/s)"
+            )
+
+        # Remove chunks left behind by interrupted runs for files that are gone
+        if to_index or removed:
+            known_ids = {chunk_id for entry in indexed_files.values() for chunk_id in entry["chunk_ids"]}
+            orphan_ids = [chunk_id for chunk_id in collection.get(include=[])["ids"] if chunk_id not in known_ids]
+            if orphan_ids:
+                logger.info(f"Deleting {len(orphan_ids)} orphaned chunks")
+                collection.delete(ids=orphan_ids)
+
+        manifest["corpus_hash"] = compute_corpus_hash(manifest)
+        manifest["index_version"] = compute_index_version(manifest)
+        save_manifest(db_path, manifest)
+
+        total_chunks = sum(len(entry["chunk_ids"]) for entry in indexed_files.values())
+        if total_chunks == 0:
+            logger.error("No documents found or processed. Please check your source folder.")
+            return False
+
+        logger.info(
+            f"Vector database at '{db_path}' is up to date "
+            f"({total_chunks} chunks, index version {manifest['index_version']})"
+        )
+        return True
+
+    except Exception as e:
+        logger.error(f"Error synchronizing vector database: {str(e)}")
+        return False
+
+def main():
+    """
+    Command line entry point.
+
+    `python -m ingestion sync --workers 4` updates a vector database in place;
+    `python -m ingestion build-index --workers 4` builds and publishes a versioned snapshot.
+    """
+    from dotenv import load_dotenv
+
+    parser = argparse.ArgumentParser(description="Schema Therapy document ingestion")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    sync_parser = subparsers.add_parser("sync", help="Bring the vector database in line with the source folder")
+    sync_parser.add_argument("--db", default="chroma_db", help="Path of the persistent ChromaDB storage")
+
+    build_parser = subparsers.add_parser("build-index", help="Build a versioned index snapshot and publish it")
+    build_parser.add_argument("--snapshots", default="index_snapshots",
+                              help="Directory holding the index snapshots (default: index_snapshots)")
+    build_parser.add_argument("--base", default=None,
+                              help="Existing vector database to start from when no snapshot is published")
+    build_parser.add_argument("--keep", type=int, default=3, help="Number of snapshots to keep (default: 3)")
+
+    for command_parser in (sync_parser, build_parser):
+        command_parser.add_argument("--source", default="kaynaklarim", help="Folder containing PDF and DOCX files")
+        command_parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                                    help="Number of extraction worker processes (default: CPU count)")
+        command_parser.add_argument("--embedding-backend", choices=EMBEDDING_BACKENDS, default="google",
+                                    help="Embedding backend; 'hashing' runs locally without API calls")
+        command_parser.add_argument("--batch-size", type=int, default=100, help="Chunks per embedding request")
+        command_parser.add_argument("--max-in-flight", type=int, default=4,
+                                    help="Maximum concurrent embedding requests")
+        command_parser.add_argument("--requests-per-minute", type=float, default=0,
+                                    help="Embedding request rate limit (default: unlimited)")
+
+    args = parser.parse_args()
+
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO)
+
+    embeddings, embedding_model = create_embeddings(args.embedding_backend)
+    embedding_stage = EmbeddingStage(
+        embeddings,
+        batch_size=args.batch_size,
+        max_in_flight=args.max_in_flight,
+        requests_per_minute=args.requests_per_minute,
+    )
+
+    if args.command == "build-index":
+        from index_snapshots import build_index_snapshot
+        snapshot_path = build_index_snapshot(
+            args.source, args.snapshots, embedding_stage, embedding_model,
+            workers=args.workers, base_path=args.base, keep=args.keep,
+        )
+        success = snapshot_path is not None
+    else:
+        success = sync_vector_database(args.source, args.db, embedding_stage, embedding_model, workers=args.workers)
+    raise SystemExit(0 if success else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,427 @@
+"""
+Durable job queue for long-running analyses.
+
+Clients submit an analysis as a job, get a job ID back immediately and poll
+for the result (or receive it through a webhook), instead of holding an HTTP
+connection open for the whole generation.
+
+Jobs are stored in SQLite, so they survive restarts. Workers claim jobs in
+priority order and hold a lease that they renew while the job runs. A job
+whose lease expires, because its process died or was restarted, is claimed
+again. Finished jobs are kept for a retention period, during which a
+duplicate submission returns the existing job instead of creating a new one.
+
+Webhook URLs come from clients, so they are checked before a job is accepted
+and again before the POST: only http(s) URLs whose host resolves to public
+addresses (and, optionally, is on an allow-list) are called, and redirects
+are not followed.
+"""
+
+import asyncio
+import ipaddress
+import json
+import logging
+import random
+import socket
+import sqlite3
+import threading
+import time
+import urllib.parse
+import urllib.request
+import uuid
+from typing import AbstractSet, Awaitable, Callable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+JOB_STATUSES = ["queued", "running", "succeeded", "failed"]
+
+class JobQueue:
+    """
+    SQLite-backed job queue with priorities, leases, retries and retention.
+
+    Args:
+        db_path: Path of the SQLite database
+        retention_seconds: Time finished jobs are kept after they finish
+        lease_seconds: Time a claimed job stays reserved without a lease renewal
+        max_attempts: Number of attempts before a failing job is marked failed
+        max_requeue_seconds: Age after which a job that keeps being requeued
+            (see `requeue`) is marked failed
+    """
+
+    def __init__(self, db_path: str, retention_seconds: float = 7 * 86400,
+                 lease_seconds: float = 60, max_attempts: int = 3, max_requeue_seconds: float = 3600):
+        self.db_path = db_path
+        self.retention_seconds = retention_seconds
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max(1, max_attempts)
+        self.max_requeue_seconds = max_requeue_seconds
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, dedupe_key TEXT, payload TEXT NOT NULL, priority INTEGER NOT NULL, "
+            "status TEXT NOT NULL, result TEXT, error TEXT, webhook_url TEXT, attempts INTEGER NOT NULL DEFAULT 0, "
+            "created_at REAL NOT NULL, available_at REAL NOT NULL, started_at REAL, finished_at REAL, "
+            "lease_expires_at REAL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_dedupe ON jobs (dedupe_key)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_pending ON jobs (status, priority, available_at)")
+
+    def _job(self, row: Optional[sqlite3.Row]) -> Optional[dict]:
+        if row is None:
+            return None
+        job = dict(row)
+        job["payload"] = json.loads(job["payload"])
+        job["result"] = json.loads(job["result"]) if job["result"] is not None else None
+        return job
+
+    def submit(self, payload: dict, dedupe_key: Optional[str] = None, priority: int = 0,
+               webhook_url: Optional[str] = None) -> Tuple[dict, bool]:
+        """
+        Add a job, unless an equivalent one is queued, running or has succeeded
+        within the retention period.
+
+        Args:
+            payload: JSON-serializable job input
+            dedupe_key: Identity of the job; submissions with the same key share one job
+            priority: Higher priorities are claimed first
+            webhook_url: URL that receives the finished job as a JSON POST
+
+        Returns:
+            The job and whether it was newly created
+        """
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                if dedupe_key is not None:
+                    row = self._db.execute(
+                        "SELECT * FROM jobs WHERE dedupe_key = ? AND status != 'failed' "
+                        "ORDER BY created_at DESC LIMIT 1",
+                        (dedupe_key,),
+                    ).fetchone()
+                    if row is not None:
+                        self._db.execute("COMMIT")
+                        return self._job(row), False
+
+                job_id = uuid.uuid4().hex
+                self._db.execute(
+                    "INSERT INTO jobs (id, dedupe_key, payload, priority, status, webhook_url, created_at, available_at) "
+                    "VALUES (?, ?, ?, ?, 'queued', ?, ?, ?)",
+                    (job_id, dedupe_key, json.dumps(payload, ensure_ascii=False), priority, webhook_url, now, now),
+                )
+                row = self._db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+        return self._job(row), True
+
+    def get(self, job_id: str) -> Optional[dict]:
+        """Return a job by ID, or None if it does not exist or has been purged."""
+        with self._lock:
+            return self._job(self._db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone())
+
+    def claim(self) -> Optional[dict]:
+        """
+        Reserve the next job: the highest-priority, oldest queued job, or a
+        running job whose lease has expired. Returns None if there is none.
+        """
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._db.execute(
+                    "SELECT * FROM jobs WHERE (status = 'queued' AND available_at <= ?) "
+                    "OR (status = 'running' AND lease_expires_at < ?) "
+                    "ORDER BY priority DESC, created_at LIMIT 1",
+                    (now, now),
+                ).fetchone()
+                if row is None:
+                    self._db.execute("COMMIT")
+                    return None
+                if row["status"] == "running":
+                    logger.warning(f"Job {row['id']} lost its worker, running it again")
+                self._db.execute(
+                    "UPDATE jobs SET status = 'running', attempts = attempts + 1, started_at = ?, "
+                    "lease_expires_at = ? WHERE id = ?",
+                    (now, now + self.lease_seconds, row["id"]),
+                )
+                row = self._db.execute("SELECT * FROM jobs WHERE id = ?", (row["id"],)).fetchone()
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+        return self._job(row)
+
+    def renew(self, job_id: str):
+        """Extend the lease of a running job."""
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET lease_expires_at = ? WHERE id = ? AND status = 'running'",
+                (time.time() + self.lease_seconds, job_id),
+            )
+
+    def complete(self, job_id: str, result: dict):
+        """Mark a job as succeeded with its result."""
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET status = 'succeeded', result = ?, error = NULL, finished_at = ?, "
+                "lease_expires_at = NULL WHERE id = ?",
+                (json.dumps(result, ensure_ascii=False), time.time(), job_id),
+            )
+
+    def fail(self, job_id: str, error: str, retry_delay: Optional[float] = None) -> bool:
+        """
+        Record a failed attempt. The job is queued again after `retry_delay`
+        seconds (default: jittered exponential backoff) until it has used all
+        attempts, then marked failed.
+
+        Returns:
+            True if the job will be retried
+        """
+        with self._lock:
+            row = self._db.execute("SELECT attempts FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return False
+            now = time.time()
+            if row["attempts"] < self.max_attempts:
+                delay = retry_delay if retry_delay is not None else random.uniform(1, 2 ** row["attempts"] * 5)
+                self._db.execute(
+                    "UPDATE jobs SET status = 'queued', error = ?, available_at = ?, lease_expires_at = NULL "
+                    "WHERE id = ?",
+                    (error, now + delay, job_id),
+                )
+                return True
+            self._db.execute(
+                "UPDATE jobs SET status = 'failed', error = ?, finished_at = ?, lease_expires_at = NULL WHERE id = ?",
+                (error, now, job_id),
+            )
+            return False
+
+    def requeue(self, job_id: str, error: str, delay: float) -> bool:
+        """
+        Queue a running job again after `delay` seconds without counting the
+        attempt, e.g. when the server shed load. Jobs older than
+        `max_requeue_seconds` are marked failed instead.
+
+        Returns:
+            True if the job was queued again
+        """
+        with self._lock:
+            row = self._db.execute("SELECT created_at FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return False
+            now = time.time()
+            age = now - row["created_at"]
+            if age < self.max_requeue_seconds:
+                self._db.execute(
+                    "UPDATE jobs SET status = 'queued', attempts = MAX(attempts - 1, 0), error = ?, "
+                    "available_at = ?, lease_expires_at = NULL WHERE id = ?",
+                    (error, now + delay, job_id),
+                )
+                return True
+            self._db.execute(
+                "UPDATE jobs SET status = 'failed', error = ?, finished_at = ?, lease_expires_at = NULL WHERE id = ?",
+                (f"{error} (gave up after {age:.0f}s)", now, job_id),
+            )
+            return False
+
+    def release(self, job_id: str):
+        """Return a running job to the queue without counting the attempt, e.g. on shutdown."""
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET status = 'queued', attempts = MAX(attempts - 1, 0), lease_expires_at = NULL "
+                "WHERE id = ? AND status = 'running'",
+                (job_id,),
+            )
+
+    def purge(self) -> int:
+        """Delete finished jobs older than the retention period. Returns the number deleted."""
+        with self._lock:
+            cursor = self._db.execute(
+                "DELETE FROM jobs WHERE status IN ('succeeded', 'failed') AND finished_at < ?",
+                (time.time() - self.retention_seconds,),
+            )
+            return cursor.rowcount
+
+    def stats(self) -> dict:
+        """Return the number of jobs per status."""
+        with self._lock:
+            rows = self._db.execute("SELECT status, COUNT(*) AS count FROM jobs GROUP BY status").fetchall()
+        counts = {status: 0 for status in JOB_STATUSES}
+        counts.update({row["status"]: row["count"] for row in rows})
+        return counts
+
+class WebhookURLError(ValueError):
+    """Raised when a webhook URL must not be called."""
+
+def validate_webhook_url(url: str, allowed_hosts: Optional[AbstractSet[str]] = None):
+    """
+    Check that a webhook URL may be called: http or https, a host on the
+    allow-list (if one is given), and only public addresses for that host, so
+    clients cannot make the server call internal services or cloud metadata
+    endpoints.
+
+    Raises:
+        WebhookURLError: If the URL must not be called
+    """
+    try:
+        parsed = urllib.parse.urlsplit(url)
+        port = parsed.port or (443 if parsed.scheme == "https" else 80)
+    except ValueError:
+        raise WebhookURLError("webhook_url is not a valid URL.")
+    if parsed.scheme not in ("http", "https") or not parsed.hostname:
+        raise WebhookURLError("webhook_url must be an http or https URL.")
+
+    host = parsed.hostname.lower()
+    if allowed_hosts and host not in allowed_hosts:
+        raise WebhookURLError(f"webhook_url host '{host}' is not allowed.")
+    try:
+        addresses = {info[4][0] for info in socket.getaddrinfo(host, port, proto=socket.IPPROTO_TCP)}
+    except socket.gaierror:
+        raise WebhookURLError(f"webhook_url host '{host}' cannot be resolved.")
+    for address in addresses:
+        ip = ipaddress.ip_address(address.split("%")[0])
+        if not ip.is_global or ip.is_multicast:
+            raise WebhookURLError(f"webhook_url host '{host}' resolves to a non-public address.")
+
+class _NoRedirects(urllib.request.HTTPRedirectHandler):
+    """Treats redirects as errors, so a webhook cannot forward the POST to an internal address."""
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+_webhook_opener = urllib.request.build_opener(_NoRedirects)
+
+def post_webhook(url: str, payload: dict, attempts: int = 3, timeout: float = 10,
+                 allowed_hosts: Optional[AbstractSet[str]] = None) -> bool:
+    """POST a JSON payload to a webhook, retrying with backoff. Returns True on success."""
+    body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    for attempt in range(attempts):
+        try:
+            # Checked again before every POST, as the host may resolve differently by now
+            validate_webhook_url(url, allowed_hosts)
+            request = urllib.request.Request(
+                url, data=body, method="POST",
+                headers={"Content-Type": "application/json", "X-Job-Id": payload.get("job_id", "")},
+            )
+            with _webhook_opener.open(request, timeout=timeout) as response:
+                if 200 <= response.status < 300:
+                    return True
+                logger.warning(f"Webhook {url} answered {response.status}")
+        except WebhookURLError as e:
+            logger.warning(f"Webhook {url} not called: {str(e)}")
+            return False
+        except Exception as e:
+            logger.warning(f"Webhook {url} failed ({str(e)}), attempt {attempt + 1}/{attempts}")
+        time.sleep(2 ** attempt)
+    return False
+
+class JobWorkerPool:
+    """
+    Runs queued jobs with a fixed number of async workers.
+
+    Args:
+        queue: The job queue
+        handler: Coroutine function that takes a job payload and returns its result
+        concurrency: Number of jobs run at the same time
+        poll_interval: Seconds between queue polls when idle
+        retry_delay: Function returning the retry delay for an error, or None for
+            the queue's default backoff
+        requeue_delay: Function returning, for errors that should not count as a
+            failed attempt (e.g. load shedding), the delay before the job is
+            queued again; None counts the attempt
+        on_finish: Function called with each finished job, e.g. to build the webhook payload
+        webhook_allowed_hosts: Hosts webhooks may be sent to (empty = any public host)
+    """
+
+    def __init__(self, queue: JobQueue, handler: Callable[[dict], Awaitable[dict]], concurrency: int = 2,
+                 poll_interval: float = 1.0, retry_delay: Optional[Callable[[Exception], Optional[float]]] = None,
+                 requeue_delay: Optional[Callable[[Exception], Optional[float]]] = None,
+                 on_finish: Optional[Callable[[dict], dict]] = None,
+                 webhook_allowed_hosts: Optional[AbstractSet[str]] = None):
+        self.queue = queue
+        self.handler = handler
+        self.concurrency = max(1, concurrency)
+        self.poll_interval = poll_interval
+        self.retry_delay = retry_delay or (lambda error: None)
+        self.requeue_delay = requeue_delay or (lambda error: None)
+        self.on_finish = on_finish or (lambda job: job)
+        self.webhook_allowed_hosts = webhook_allowed_hosts
+        self._wakeup = asyncio.Event()
+        self._tasks: List[asyncio.Task] = []
+
+    def start(self):
+        """Start the workers and the retention task."""
+        self._tasks = [asyncio.create_task(self._worker(number)) for number in range(self.concurrency)]
+        self._tasks.append(asyncio.create_task(self._purge_periodically()))
+        logger.info(f"Started {self.concurrency} job workers")
+
+    def notify(self):
+        """Wake idle workers after a job has been submitted."""
+        self._wakeup.set()
+
+    async def stop(self):
+        """Stop the workers. Jobs they were running are returned to the queue."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _worker(self, number: int):
+        while True:
+            job = await asyncio.to_thread(self.queue.claim)
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._run(job)
+
+    async def _renew_lease(self, job_id: str):
+        while True:
+            await asyncio.sleep(self.queue.lease_seconds / 3)
+            await asyncio.to_thread(self.queue.renew, job_id)
+
+    async def _run(self, job: dict):
+        job_id = job["id"]
+        logger.info(f"Running job {job_id} (priority {job['priority']}, attempt {job['attempts']})")
+        lease = asyncio.create_task(self._renew_lease(job_id))
+        try:
+            result = await self.handler(job["payload"])
+        except asyncio.CancelledError:
+            await asyncio.to_thread(self.queue.release, job_id)
+            raise
+        except Exception as e:
+            requeue_delay = self.requeue_delay(e)
+            if requeue_delay is not None:
+                retried = await asyncio.to_thread(self.queue.requeue, job_id, str(e), requeue_delay)
+            else:
+                retried = await asyncio.to_thread(self.queue.fail, job_id, str(e), self.retry_delay(e))
+            logger.error(f"Job {job_id} failed ({str(e)}){', will retry' if retried else ''}")
+            if retried:
+                return
+        else:
+            await asyncio.to_thread(self.queue.complete, job_id, result)
+            logger.info(f"Job {job_id} succeeded")
+        finally:
+            lease.cancel()
+
+        finished = await asyncio.to_thread(self.queue.get, job_id)
+        if finished is not None and finished["webhook_url"]:
+            await asyncio.to_thread(
+                post_webhook, finished["webhook_url"], self.on_finish(finished),
+                allowed_hosts=self.webhook_allowed_hosts,
+            )
+
+    async def _purge_periodically(self):
+        while True:
+            deleted = await asyncio.to_thread(self.queue.purge)
+            if deleted:
+                logger.info(f"Purged {deleted} finished jobs past retention")
+            await asyncio.sleep(3600)
@@ -0,0 +1,227 @@
+"""
+BM25 lexical index and hybrid retrieval.
+
+Schema names and clinical terms are exact keywords that embedding similarity
+often ranks poorly. Each index build therefore also writes an inverted index
+of the chunks (`lexical_index.json`), built from the same export as the NumPy
+vector index, so both always describe the same chunks.
+
+Retrieval modes:
+- `vector`: similarity search only (Chroma or NumPy backend)
+- `hybrid`: vector and BM25 rankings merged with reciprocal rank fusion; if
+  the vector search fails or times out, the BM25 ranking is used alone
+- `lexical`: BM25 only, with no embedding call at all
+
+Tokens are case- and accent-folded and cut to their first five characters, a
+simple stemmer that works well for agglutinative Turkish ("kusurluluk",
+"kusurlu" and "kusurlar" all become "kusur").
+"""
+
+import asyncio
+import json
+import logging
+import math
+import os
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_core.callbacks import AsyncCallbackManagerForRetrieverRun, CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from schema_index import normalize_alias
+from vector_index import ensure_numpy_index, read_chunks
+
+logger = logging.getLogger(__name__)
+
+LEXICAL_INDEX_FILENAME = "lexical_index.json"
+LEXICAL_INDEX_FORMAT_VERSION = 1
+RETRIEVAL_MODES = ["vector", "hybrid", "lexical"]
+STEM_LENGTH = 5  # Tokens are truncated to this many characters
+BM25_K1 = 1.5
+BM25_B = 0.75
+RRF_K = 60  # Rank offset of reciprocal rank fusion; dampens the weight of the top ranks
+
+def tokenize(text: str) -> List[str]:
+    """Split text into case- and accent-folded, prefix-stemmed tokens."""
+    return [token[:STEM_LENGTH] for token in normalize_alias(text).split()]
+
+def build_lexical_index(db_path: str, index_version: Optional[str]) -> dict:
+    """
+    Build the BM25 inverted index of a vector database snapshot and store it in the snapshot.
+
+    Args:
+        db_path: Path of the vector database snapshot
+        index_version: Index version of the snapshot
+
+    Returns:
+        The lexical index data that was written
+    """
+    ids, texts, _ = read_chunks(ensure_numpy_index(db_path, index_version))
+
+    postings: Dict[str, List[List[int]]] = defaultdict(list)
+    doc_lengths = []
+    for row, text in enumerate(texts):
+        tokens = tokenize(text)
+        doc_lengths.append(len(tokens))
+        for term, frequency in Counter(tokens).items():
+            postings[term].append([row, frequency])
+
+    data = {
+        "format_version": LEXICAL_INDEX_FORMAT_VERSION,
+        "index_version": index_version,
+        "stem_length": STEM_LENGTH,
+        "ids": ids,
+        "doc_lengths": doc_lengths,
+        "postings": postings,
+    }
+    path = os.path.join(db_path, LEXICAL_INDEX_FILENAME)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as file:
+        json.dump(data, file, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp_path, path)
+    logger.info(f"Built lexical index with {len(postings)} terms over {len(ids)} chunks")
+    return data
+
+class LexicalIndex:
+    """
+    BM25 index over the chunks of a snapshot.
+
+    Args:
+        ids: Chunk ID of each row
+        texts: Chunk text of each row
+        metadatas: Chunk metadata of each row
+        doc_lengths: Token count of each row
+        postings: Term -> list of `[row, term frequency]`
+    """
+
+    def __init__(self, ids: List[str], texts: List[str], metadatas: List[dict],
+                 doc_lengths: List[int], postings: Dict[str, List[List[int]]]):
+        self.ids = ids
+        self.texts = texts
+        self.metadatas = metadatas
+        self.doc_lengths = np.asarray(doc_lengths, dtype=np.float32)
+        self.average_length = float(self.doc_lengths.mean()) if len(doc_lengths) else 0.0
+        self.postings = {
+            term: (np.asarray([row for row, _ in rows], dtype=np.int64),
+                   np.asarray([frequency for _, frequency in rows], dtype=np.float32))
+            for term, rows in postings.items()
+        }
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def search(self, query: str, k: int = 5) -> List[Tuple[int, float]]:
+        """Return the `(row, BM25 score)` pairs of the k best matching chunks, best first."""
+        terms = [term for term in set(tokenize(query)) if term in self.postings]
+        if not terms or len(self) == 0:
+            return []
+
+        scores = np.zeros(len(self), dtype=np.float32)
+        length_norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_lengths / max(self.average_length, 1.0))
+        for term in terms:
+            rows, frequencies = self.postings[term]
+            idf = math.log(1 + (len(self) - len(rows) + 0.5) / (len(rows) + 0.5))
+            scores[rows] += idf * frequencies * (BM25_K1 + 1) / (frequencies + length_norm[rows])
+
+        matched = np.flatnonzero(scores)
+        k = min(k, len(matched))
+        top = matched[np.argpartition(-scores[matched], k - 1)[:k]]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(int(row), float(scores[row])) for row in top]
+
+    def documents(self, rows: List[int]) -> List[Document]:
+        """Build LangChain documents for the given rows."""
+        return [
+            Document(page_content=self.texts[row], metadata=dict(self.metadatas[row]), id=self.ids[row])
+            for row in rows
+        ]
+
+def load_lexical_index(db_path: str, index_version: Optional[str]) -> LexicalIndex:
+    """
+    Load the lexical index of a snapshot, building it first if it is missing
+    or was built for a different index version.
+    """
+    path = os.path.join(db_path, LEXICAL_INDEX_FILENAME)
+    data = None
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as file:
+            data = json.load(file)
+
+    if data is None or data.get("format_version") != LEXICAL_INDEX_FORMAT_VERSION \
+            or data.get("index_version") != index_version or data.get("stem_length") != STEM_LENGTH:
+        logger.info(f"Lexical index in '{db_path}' is missing or outdated, building...")
+        data = build_lexical_index(db_path, index_version)
+
+    ids, texts, metadatas = read_chunks(ensure_numpy_index(db_path, index_version))
+    if ids != data["ids"]:
+        raise ValueError(f"Lexical index in '{db_path}' does not match the exported chunks")
+    index = LexicalIndex(ids, texts, metadatas, data["doc_lengths"], data["postings"])
+    logger.info(f"Loaded lexical index with {len(index.postings)} terms over {len(index)} chunks")
+    return index
+
+def reciprocal_rank_fusion(rankings: Sequence[List[Document]], k: int) -> List[Document]:
+    """
+    Merge ranked document lists: each document scores `1 / (RRF_K + rank)` per
+    list it appears in, and the k best-scoring documents are returned.
+    """
+    scores: Dict[str, float] = defaultdict(float)
+    documents: Dict[str, Document] = {}
+    for ranking in rankings:
+        for rank, document in enumerate(ranking, start=1):
+            key = document.id or document.page_content
+            scores[key] += 1.0 / (RRF_K + rank)
+            documents.setdefault(key, document)
+    best = sorted(scores, key=scores.get, reverse=True)[:k]
+    return [documents[key] for key in best]
+
+class LexicalRetriever(BaseRetriever):
+    """Retriever that answers queries from the BM25 index alone, without embeddings."""
+
+    index: LexicalIndex
+    k: int = 5
+
+    model_config = {"arbitrary_types_allowed": True}
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        return self.index.documents([row for row, _ in self.index.search(query, self.k)])
+
+class HybridRetriever(BaseRetriever):
+    """
+    Retriever that fuses a vector retriever's ranking with the BM25 ranking.
+
+    The vector retriever should return `candidates` documents; both rankings
+    are cut to that depth and fused into the final `k`. If the vector search
+    raises or takes longer than `vector_timeout` seconds, the BM25 ranking is
+    used on its own.
+    """
+
+    vector_retriever: BaseRetriever
+    index: LexicalIndex
+    k: int = 5
+    candidates: int = 20
+    vector_timeout: float = 5.0
+
+    model_config = {"arbitrary_types_allowed": True}
+
+    def _lexical_ranking(self, query: str) -> List[Document]:
+        return self.index.documents([row for row, _ in self.index.search(query, self.candidates)])
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        try:
+            vector_ranking = self.vector_retriever.invoke(query)
+        except Exception as e:
+            logger.warning(f"Vector search failed ({str(e)}), using lexical ranking only")
+            vector_ranking = []
+        return reciprocal_rank_fusion([vector_ranking, self._lexical_ranking(query)], self.k)
+
+    async def _aget_relevant_documents(self, query: str, *,
+                                       run_manager: AsyncCallbackManagerForRetrieverRun) -> List[Document]:
+        try:
+            vector_ranking = await asyncio.wait_for(self.vector_retriever.ainvoke(query), self.vector_timeout)
+        except Exception as e:
+            reason = "timed out" if isinstance(e, asyncio.TimeoutError) else f"failed ({str(e)})"
+            logger.warning(f"Vector search {reason}, using lexical ranking only")
+            vector_ranking = []
+        return reciprocal_rank_fusion([vector_ranking, self._lexical_ranking(query)], self.k)
@@ -0,0 +1,324 @@
+"""
+Deadline-aware, hedged LLM calls.
+
+A Gemini call that stalls would otherwise hold its request until the client
+gives up, and a few of those dominate the tail latency. `DeadlineLLM` wraps the
+chat model with:
+
+- Adaptive timeouts: each attempt is cut off after a multiple of the observed
+  p99 latency (within fixed bounds) instead of a single static value.
+- Per-request deadlines: a request can carry a deadline (set with
+  `set_deadline`), and no attempt runs past it.
+- Hedging: if the first attempt has not finished after the observed p95
+  latency, a second identical request is sent and whichever finishes first
+  is used; the other is cancelled.
+- Fallback: if the remaining time is shorter than the primary model usually
+  needs, or the primary model times out or fails, a faster model (e.g. Gemini
+  Flash) answers instead.
+
+For streamed answers the same rules apply to the time to the first chunk;
+once a stream has started, it is not switched.
+
+Which path served each generation (`primary`, `hedge` or `fallback`) is
+counted in Prometheus and in the request trace.
+"""
+
+import asyncio
+import contextvars
+import logging
+import threading
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Callable, Optional, Tuple
+
+from metrics import record_generation_path, record_llm_timeout
+
+logger = logging.getLogger(__name__)
+
+# Latency samples needed before percentiles replace the static timeout
+MIN_LATENCY_SAMPLES = 20
+
+class GenerationTimeoutError(asyncio.TimeoutError):
+    """Raised when no model answered within the attempt timeout or the request deadline."""
+
+_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("request_deadline", default=None)
+
+def set_deadline(seconds: float) -> contextvars.Token:
+    """
+    Set the deadline of the request handled in the current context, `seconds`
+    from now (0 or less = no deadline). Tasks created from this context inherit it.
+    """
+    return _deadline.set(time.monotonic() + seconds if seconds > 0 else None)
+
+def clear_deadline(token: contextvars.Token):
+    """Remove the deadline set with `token` from the current context."""
+    _deadline.reset(token)
+
+def remaining_time() -> Optional[float]:
+    """Return the seconds left until the current request's deadline, or None without a deadline."""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+class LatencyTracker:
+    """
+    Sliding window of observed call latencies.
+
+    Args:
+        window: Number of most recent latencies kept
+        min_samples: Latencies needed before percentiles are reported
+    """
+
+    def __init__(self, window: int = 200, min_samples: int = MIN_LATENCY_SAMPLES):
+        self.min_samples = min_samples
+        self._samples = deque(maxlen=max(1, window))
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, q: float) -> Optional[float]:
+        """Return the q-th percentile latency, or None until enough samples are observed."""
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * q / 100))]
+
+    def stats(self) -> dict:
+        """Return the sample count and the p50/p95/p99 latencies in seconds."""
+        return {
+            "samples": len(self._samples),
+            **{f"p{q}": self.percentile(q) for q in (50, 95, 99)},
+        }
+
+class _Model:
+    """A chat model with the latency trackers of its complete answers and first streamed chunks."""
+
+    def __init__(self, llm, window: int):
+        self.llm = llm
+        self.latency = LatencyTracker(window)
+        self.first_chunk_latency = LatencyTracker(window)
+
+class DeadlineLLM:
+    """
+    Chat model wrapper with adaptive timeouts, hedging, deadlines and fallback.
+
+    Exposes `ainvoke` and `astream` like a LangChain chat model, so it can be
+    used as the LLM of a `SchemaQAChain`.
+
+    Args:
+        llm: Primary chat model
+        fallback_llm: Faster chat model used when the deadline is at risk or the
+            primary model fails (None = no fallback)
+        max_timeout: Upper bound of one attempt, and the timeout used until
+            enough latencies are observed
+        min_timeout: Lower bound of the adaptive timeout
+        timeout_multiplier: The adaptive timeout is this multiple of the p99 latency
+        hedge: Whether to send a second request when the first is slow
+        hedge_percentile: Latency percentile after which the second request is sent
+        window: Latencies kept per model for the percentiles
+    """
+
+    def __init__(self, llm, fallback_llm=None, max_timeout: float = 120, min_timeout: float = 10,
+                 timeout_multiplier: float = 2.0, hedge: bool = True, hedge_percentile: float = 95,
+                 window: int = 200):
+        self.primary = _Model(llm, window)
+        self.fallback = _Model(fallback_llm, window) if fallback_llm is not None else None
+        self.max_timeout = max_timeout
+        self.min_timeout = min(min_timeout, max_timeout)
+        self.timeout_multiplier = timeout_multiplier
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+
+    @property
+    def llm(self):
+        """The primary chat model."""
+        return self.primary.llm
+
+    @staticmethod
+    def _tracker(model: _Model, first_chunk: bool) -> LatencyTracker:
+        return model.first_chunk_latency if first_chunk else model.latency
+
+    def _timeout(self, tracker: LatencyTracker, budget: Optional[float]) -> float:
+        """Return the attempt timeout: a multiple of the p99 latency, bounded, and within the budget."""
+        timeout = self.max_timeout
+        p99 = tracker.percentile(99)
+        if p99 is not None:
+            timeout = min(max(p99 * self.timeout_multiplier, self.min_timeout), self.max_timeout)
+        return timeout if budget is None else min(timeout, budget)
+
+    def _plan(self, first_chunk: bool) -> Tuple[Optional[float], bool]:
+        """
+        Return the time budget of the primary model and whether the deadline is at risk.
+
+        With a fallback model, the time it usually needs is kept in reserve, and
+        the deadline is at risk if the rest is shorter than the primary model's
+        hedge-percentile latency.
+        """
+        remaining = remaining_time()
+        if remaining is None:
+            return None, False
+        if remaining <= 0:
+            raise GenerationTimeoutError("The request deadline passed before generation started")
+        if self.fallback is None:
+            return remaining, False
+
+        budget = remaining - (self._tracker(self.fallback, first_chunk).percentile(self.hedge_percentile) or 0)
+        expected = self._tracker(self.primary, first_chunk).percentile(self.hedge_percentile)
+        return budget, budget <= 0 or (expected is not None and budget < expected)
+
+    async def _race(self, model: _Model, tracker: LatencyTracker, attempt: Callable[[Any], Any],
+                    timeout: float, hedge: bool, discard: Optional[Callable[[Any], Any]] = None) -> Tuple[Any, bool]:
+        """
+        Run `attempt(llm)` with a timeout, hedged by a second attempt after the
+        hedge-percentile latency.
+
+        Args:
+            model: Model to call
+            tracker: Tracker that records the latency of the attempts
+            attempt: Coroutine function taking the chat model
+            timeout: Time allowed for the attempts together
+            hedge: Whether a second attempt may be sent
+            discard: Called with the result of an attempt that finished but lost the race
+
+        Returns:
+            The result of the first successful attempt, and whether it was the hedge
+
+        Raises:
+            GenerationTimeoutError: If no attempt succeeded in time
+            Exception: The error of the last failed attempt, if all attempts failed
+        """
+        started = time.monotonic()
+        deadline = started + timeout
+        hedge_delay = tracker.percentile(self.hedge_percentile) if hedge and self.hedge else None
+
+        async def timed(task_started: float):
+            result = await attempt(model.llm)
+            tracker.observe(time.monotonic() - task_started)
+            return result
+
+        attempts = {asyncio.ensure_future(timed(started)): (False, started)}
+        error = None
+        try:
+            if hedge_delay is not None and hedge_delay < timeout:
+                done, _ = await asyncio.wait(attempts, timeout=hedge_delay)
+                if not done:
+                    logger.info(f"LLM call slower than p{self.hedge_percentile:g} ({hedge_delay:.2f}s), sending a hedged request")
+                    hedge_started = time.monotonic()
+                    attempts[asyncio.ensure_future(timed(hedge_started))] = (True, hedge_started)
+
+            while attempts:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                done, _ = await asyncio.wait(attempts, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    break
+                results = []
+                for task in done:
+                    is_hedge, _ = attempts.pop(task)
+                    if task.exception() is None:
+                        results.append((task.result(), is_hedge))
+                    else:
+                        error = task.exception()
+                        logger.warning(f"LLM {'hedged ' if is_hedge else ''}call failed: {str(error)}")
+                if results:
+                    for result, _ in results[1:]:
+                        if discard is not None:
+                            await discard(result)
+                    return results[0]
+        finally:
+            for task, (_, task_started) in attempts.items():
+                if not task.done():
+                    # A cancelled attempt took at least this long; recording it keeps
+                    # the percentiles from drifting down while slow calls are cut off
+                    tracker.observe(time.monotonic() - task_started)
+                    task.cancel()
+            if attempts:
+                outcomes = await asyncio.gather(*attempts, return_exceptions=True)
+                for outcome in outcomes:
+                    if discard is not None and not isinstance(outcome, BaseException):
+                        await discard(outcome)
+
+        if error is not None:
+            raise error
+        raise GenerationTimeoutError(f"No LLM response within {timeout:.1f}s")
+
+    async def _serve(self, first_chunk: bool, attempt: Callable[[Any], Any],
+                     discard: Optional[Callable[[Any], Any]] = None) -> Tuple[Any, str]:
+        """Run `attempt` on the primary model (hedged) or the fallback model. Returns the result and the path."""
+        budget, at_risk = self._plan(first_chunk)
+        if not at_risk:
+            try:
+                tracker = self._tracker(self.primary, first_chunk)
+                result, hedged = await self._race(
+                    self.primary, tracker, attempt, self._timeout(tracker, budget), True, discard
+                )
+                return result, "hedge" if hedged else "primary"
+            except Exception as e:
+                if isinstance(e, asyncio.TimeoutError):
+                    record_llm_timeout("primary")
+                if self.fallback is None:
+                    raise
+                logger.warning(f"Primary LLM did not answer ({type(e).__name__}: {str(e)}), using the fallback model")
+        else:
+            logger.info(f"Deadline at risk ({remaining_time():.2f}s left), using the fallback model")
+
+        remaining = remaining_time()
+        if remaining is not None and remaining <= 0:
+            raise GenerationTimeoutError("The request deadline passed before the fallback model was called")
+        try:
+            tracker = self._tracker(self.fallback, first_chunk)
+            result, _ = await self._race(
+                self.fallback, tracker, attempt, self._timeout(tracker, remaining), False, discard
+            )
+        except asyncio.TimeoutError:
+            record_llm_timeout("fallback")
+            raise
+        return result, "fallback"
+
+    async def ainvoke(self, messages, **kwargs):
+        """Generate a complete answer. Returns the model's message."""
+        message, path = await self._serve(False, lambda llm: llm.ainvoke(messages, **kwargs))
+        record_generation_path(path)
+        return message
+
+    async def astream(self, messages, **kwargs) -> AsyncIterator[Any]:
+        """
+        Stream an answer. The model is chosen by the time to its first chunk;
+        later chunks must each arrive within `max_timeout`.
+        """
+        async def first_chunk(llm):
+            stream = llm.astream(messages, **kwargs)
+            try:
+                return stream, await anext(stream, None)
+            except BaseException:
+                await stream.aclose()
+                raise
+
+        async def discard(result):
+            await result[0].aclose()
+
+        (stream, chunk), path = await self._serve(True, first_chunk, discard)
+        record_generation_path(path)
+        try:
+            while chunk is not None:
+                yield chunk
+                try:
+                    chunk = await asyncio.wait_for(anext(stream, None), self.max_timeout)
+                except asyncio.TimeoutError:
+                    record_llm_timeout("fallback" if path == "fallback" else "primary")
+                    raise GenerationTimeoutError(f"The LLM stream stalled for {self.max_timeout:.1f}s")
+        finally:
+            await stream.aclose()
+
+    def stats(self) -> dict:
+        """Return the latency percentiles of the primary and fallback models."""
+        models = {"primary": self.primary, "fallback": self.fallback}
+        stats = {}
+        for name, model in models.items():
+            if model is not None:
+                stats[name] = model.latency.stats()
+                stats[f"{name}_first_chunk"] = model.first_chunk_latency.stats()
+        return stats
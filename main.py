@@ -3,31 +3,53 @@
 
 import os
 import sys
-from pathlib import Path
-from typing import List, Optional
+import asyncio
+import json
+import time
+from typing import TYPE_CHECKING, AsyncIterator, List, Literal, Optional, Tuple
 import logging
 
 # FastAPI imports
-from fastapi import FastAPI, HTTPException, status, Header, Depends
+from fastapi import FastAPI, HTTPException, status, Header, Depends, Request
+from fastapi.encoders import jsonable_encoder
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from fastapi.security import APIKeyHeader
 from pydantic import BaseModel
 
 # Environment variables
 from dotenv import load_dotenv
 
-# Document processing imports
-import PyPDF2
-from docx import Document
+# Admission control
+from concurrency import ConcurrencyLimiter, ServerOverloadedError, SingleFlight
 
-# LangChain and AI imports
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_google_genai import GoogleGenerativeAIEmbeddings, ChatGoogleGenerativeAI
-from langchain_chroma import Chroma
+# Response caching
+from response_cache import ResponseCache, make_cache_key, normalize_schemas
 
+# Startup readiness tracking
+from readiness import ReadinessTracker
 
-from langchain.chains import RetrievalQA
-from langchain.schema import Document as LangChainDocument
+# Session-scoped context for follow-up chat
+from chat_sessions import ChatSessionStore
+
+# Durable job queue for submit/poll analyses
+from job_queue import JobQueue, JobWorkerPool, WebhookURLError, validate_webhook_url
+
+# Prometheus metrics and per-request stage tracing
+from metrics import (
+    clear_multiprocess_dir, detach_trace, finish_trace, record_count, register_stats_collector, render_metrics,
+    start_trace,
+)
+
+# Deadline-aware, hedged LLM calls
+from llm_dispatch import DeadlineLLM, GenerationTimeoutError, clear_deadline, set_deadline
+
+# LangChain, Chroma and Google client imports are deferred to the background
+# startup task (see initialize_system) so the server binds within seconds.
+if TYPE_CHECKING:
+    from langchain_core.documents import Document
+    from rag_chain import SchemaQAChain
+    from schema_index import SchemaIndex
 
 # Load environment variables from .env file
 load_dotenv()
@@ -36,7 +58,63 @@ load_dotenv()
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")  # Load from environment variable
 MY_APP_SECRET_KEY = os.getenv("MY_APP_SECRET_KEY")  # Load API secret key from environment
 SOURCE_FOLDER = "kaynaklarim"  # Folder containing PDF and DOCX files
-VECTOR_DB_PATH = "chroma_db"  # Path for persistent ChromaDB storage
+VECTOR_DB_PATH = "chroma_db"  # Legacy ChromaDB storage, used to seed the first index snapshot
+INDEX_SNAPSHOT_DIR = os.getenv("INDEX_SNAPSHOT_DIR", "index_snapshots")  # Versioned index snapshots
+INDEX_BUILD_ON_STARTUP = os.getenv("INDEX_BUILD_ON_STARTUP", "false").lower() == "true"  # true = build from SOURCE_FOLDER (local development)
+INDEX_KEEP_SNAPSHOTS = int(os.getenv("INDEX_KEEP_SNAPSHOTS", 3))  # Snapshots kept after a build
+INDEX_WATCH_INTERVAL_SECONDS = float(os.getenv("INDEX_WATCH_INTERVAL_SECONDS", 0))  # Poll for index changes and hot reload (0 = off)
+RELOAD_DRAIN_TIMEOUT_SECONDS = float(os.getenv("RELOAD_DRAIN_TIMEOUT_SECONDS", 120))  # Wait for requests on a replaced chain
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", os.cpu_count() or 1))  # Document extraction worker processes
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "google")  # "google", "hashing" (local, offline) or "fake" (offline, API-like latency)
+LLM_BACKEND = os.getenv("LLM_BACKEND", "google")  # "google" (Gemini) or "fake" (offline stand-in for benchmarks)
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", 100))  # Chunks per embedding request
+EMBEDDING_MAX_IN_FLIGHT = int(os.getenv("EMBEDDING_MAX_IN_FLIGHT", 4))  # Concurrent embedding requests
+EMBEDDING_REQUESTS_PER_MINUTE = float(os.getenv("EMBEDDING_REQUESTS_PER_MINUTE", 0))  # 0 = no rate limit
+MAX_CONCURRENT_REQUESTS = int(os.getenv("MAX_CONCURRENT_REQUESTS", 8))  # LLM-backed requests running at once
+MAX_QUEUED_REQUESTS = int(os.getenv("MAX_QUEUED_REQUESTS", 32))  # Requests allowed to wait for a slot
+QUEUE_TIMEOUT_SECONDS = float(os.getenv("QUEUE_TIMEOUT_SECONDS", 10))  # Maximum wait for a slot before 503
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", 1000))  # Schema sets accepted per batch request
+JOB_QUEUE_DB = os.getenv("JOB_QUEUE_DB", "jobs.sqlite3")  # SQLite file of the analysis job queue
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", 2))  # Analysis jobs run at the same time
+JOB_RETENTION_SECONDS = float(os.getenv("JOB_RETENTION_SECONDS", 7 * 24 * 3600))  # Finished jobs kept for polling
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", 3))  # Attempts before a job is marked failed
+JOB_WEBHOOK_ALLOWED_HOSTS = {  # Comma-separated hosts webhooks may be sent to (empty = any public host)
+    host.strip().lower() for host in os.getenv("JOB_WEBHOOK_ALLOWED_HOSTS", "").split(",") if host.strip()
+}
+JOB_MAX_REQUEUE_SECONDS = float(os.getenv("JOB_MAX_REQUEUE_SECONDS", 3600))  # Age after which a job requeued on overload fails
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", 4))  # Unique schema sets generated at once per batch
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", 256))  # Analyses kept in memory
+RESPONSE_CACHE_TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", 7 * 24 * 3600))  # Cached analysis lifetime
+RESPONSE_CACHE_DB = os.getenv("RESPONSE_CACHE_DB") or None  # Optional SQLite file for a persistent cache tier
+VECTOR_INDEX_BACKEND = os.getenv("VECTOR_INDEX_BACKEND", "chroma")  # "chroma" or "numpy" (memory-mapped matrix)
+VECTOR_INDEX_DTYPE = os.getenv("VECTOR_INDEX_DTYPE", "float32")  # NumPy index precision: "float32" or "float16"
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "vector")  # "vector", "hybrid" (vector + BM25) or "lexical" (BM25 only)
+RETRIEVAL_K = int(os.getenv("RETRIEVAL_K", 5))  # Context chunks passed to the LLM
+RETRIEVAL_CANDIDATES = int(os.getenv("RETRIEVAL_CANDIDATES", 20))  # Chunks per ranking before hybrid fusion
+HYBRID_VECTOR_TIMEOUT_SECONDS = float(os.getenv("HYBRID_VECTOR_TIMEOUT_SECONDS", 5))  # Hybrid falls back to BM25 after this
+CONTEXT_MAX_TOKENS = int(os.getenv("CONTEXT_MAX_TOKENS", 2000))  # Estimated token budget for retrieved context (0 = none)
+CONTEXT_DUPLICATE_THRESHOLD = float(os.getenv("CONTEXT_DUPLICATE_THRESHOLD", 0.8))  # Overlap share that marks a near-duplicate
+QUERY_EMBEDDING_CACHE_SIZE = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", 1024))  # Cached retrieval query embeddings
+CHAT_SESSION_MAX = int(os.getenv("CHAT_SESSION_MAX", 1000))  # Chat sessions whose context is kept
+CHAT_SESSION_TTL_SECONDS = float(os.getenv("CHAT_SESSION_TTL_SECONDS", 1800))  # Idle time before a chat session expires
+CHAT_SESSION_MIN_OVERLAP = float(os.getenv("CHAT_SESSION_MIN_OVERLAP", 0.5))  # Share of a follow-up's terms the session context must contain
+CHAT_SESSION_MAX_CHUNKS = int(os.getenv("CHAT_SESSION_MAX_CHUNKS", 20))  # Chunks kept per chat session after merging fresh ones
+ANALYSIS_MODE = os.getenv("ANALYSIS_MODE", "combined")  # "combined" (one prompt) or "per_schema" (parallel sections)
+SCHEMA_INDEX_ENABLED = os.getenv("SCHEMA_INDEX_ENABLED", "true").lower() == "true"  # Precomputed context for known schemas
+SERVER_MODE = os.getenv("SERVER_MODE", "development")  # "development" (auto-reload) or "production" (WEB_WORKERS processes)
+WEB_WORKERS = int(os.getenv("WEB_WORKERS", os.cpu_count() or 1))  # Server processes in production mode
+WEB_KEEPALIVE_SECONDS = int(os.getenv("WEB_KEEPALIVE_SECONDS", 5))  # Idle HTTP keep-alive timeout
+WEB_LIMIT_CONCURRENCY = int(os.getenv("WEB_LIMIT_CONCURRENCY", 0))  # Open connections per worker before 503 (0 = unlimited)
+WEB_BACKLOG = int(os.getenv("WEB_BACKLOG", 2048))  # Pending connections queued by the OS
+SLOW_REQUEST_SECONDS = float(os.getenv("SLOW_REQUEST_SECONDS", 0))  # Log the stage breakdown of slower requests (0 = off)
+REQUEST_DEADLINE_SECONDS = float(os.getenv("REQUEST_DEADLINE_SECONDS", 0))  # Deadline of API requests (0 = none unless X-Request-Deadline is sent)
+LLM_FALLBACK_MODEL = os.getenv("LLM_FALLBACK_MODEL", "gemini-1.5-flash-latest")  # Faster model used when the deadline is at risk ("" = none)
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", 120))  # Longest LLM attempt; used until latencies are observed
+LLM_MIN_TIMEOUT_SECONDS = float(os.getenv("LLM_MIN_TIMEOUT_SECONDS", 10))  # Shortest adaptive LLM attempt timeout
+LLM_TIMEOUT_MULTIPLIER = float(os.getenv("LLM_TIMEOUT_MULTIPLIER", 2))  # Adaptive attempt timeout as a multiple of the p99 latency
+LLM_HEDGE_ENABLED = os.getenv("LLM_HEDGE_ENABLED", "true").lower() == "true"  # Send a second request when the first is slow
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", 95))  # Latency percentile after which the hedged request is sent
+LLM_LATENCY_WINDOW = int(os.getenv("LLM_LATENCY_WINDOW", 200))  # Recent LLM latencies the percentiles are computed from
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -52,8 +130,13 @@ app = FastAPI(
     Protected endpoints require an API key to be sent in the `X-API-Key` header.
 
     ## Endpoints
-    - **Public**: `/` (root), `/health` (health check)
+    - **Public**: `/` (root), `/health` (health check), `/ready` (readiness check)
     - **Protected**: `/analyze-schemas/`, `/chat-with-results/` (require API key)
+    - **Streaming**: `/analyze-schemas/stream`, `/chat-with-results/stream` (Server-Sent Events, require API key)
+    - **Batch**: `/analyze-schemas/batch`, `/analyze-schemas/batch/stream` (many schema sets per call, require API key)
+    - **Jobs**: `/jobs/analyze-schemas` (submit), `/jobs/{job_id}` (poll) for long-running analyses (require API key)
+    - **Monitoring**: `/metrics` (Prometheus metrics, public)
+    - **Admin**: `/admin/reload` (rebuild or reload the index without downtime, requires API key)
     """,
     version="1.0.0"
 )
@@ -67,6 +150,62 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+def request_deadline(request: Request) -> float:
+    """
+    Return the deadline of a request in seconds (0 = none): the X-Request-Deadline
+    header if sent, but no longer than REQUEST_DEADLINE_SECONDS.
+    """
+    try:
+        seconds = float(request.headers.get("X-Request-Deadline", 0))
+    except ValueError:
+        seconds = 0
+    if seconds > 0 and REQUEST_DEADLINE_SECONDS > 0:
+        return min(seconds, REQUEST_DEADLINE_SECONDS)
+    return seconds if seconds > 0 else REQUEST_DEADLINE_SECONDS
+
+def route_label(request: Request) -> str:
+    """
+    Return the route template of a request (so /jobs/{job_id} is one endpoint),
+    or "unmatched" if no route handled it. Raw URL paths are never used as metric
+    labels, so 404s and probes cannot create new series.
+    """
+    route = request.scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+# Trace every request except metric scrapes. The trace follows streaming
+# responses until their last event is sent. LLM calls made for the request
+# respect its deadline.
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    if request.url.path == "/metrics":
+        return await call_next(request)
+
+    trace, token = start_trace("unmatched")
+    deadline_token = set_deadline(request_deadline(request))
+    try:
+        response = await call_next(request)
+    except Exception:
+        clear_deadline(deadline_token)
+        detach_trace(token)
+        trace.endpoint = route_label(request)
+        finish_trace(trace, status.HTTP_500_INTERNAL_SERVER_ERROR, SLOW_REQUEST_SECONDS)
+        raise
+    clear_deadline(deadline_token)
+    detach_trace(token)
+
+    trace.endpoint = route_label(request)
+    body_iterator = response.body_iterator
+
+    async def traced_body():
+        try:
+            async for chunk in body_iterator:
+                yield chunk
+        finally:
+            finish_trace(trace, response.status_code, SLOW_REQUEST_SECONDS)
+
+    response.body_iterator = traced_body()
+    return response
+
 # API Key Security Configuration
 api_key_header = APIKeyHeader(name="X-API-Key", auto_error=False)
 
@@ -110,22 +249,238 @@ async def verify_api_key(api_key: str = Depends(api_key_header)):
 # Pydantic models for API requests/responses
 class SchemaAnalysisRequest(BaseModel):
     schemas: List[str]
+    mode: Optional[Literal["combined", "per_schema"]] = None  # Defaults to ANALYSIS_MODE
+    session_id: Optional[str] = None  # Follow-up chat turns with this ID reuse the analysis context
 
 class SchemaAnalysisResponse(BaseModel):
     analysis: str
     schemas_analyzed: List[str]
 
+class BatchAnalysisRequest(BaseModel):
+    schema_sets: List[List[str]]
+    mode: Optional[Literal["combined", "per_schema"]] = None  # Defaults to ANALYSIS_MODE
+
+class BatchAnalysisResult(BaseModel):
+    index: int  # Position of the schema set in the request
+    schemas_analyzed: List[str]
+    analysis: Optional[str] = None
+    error: Optional[str] = None
+
+class BatchAnalysisResponse(BaseModel):
+    results: List[BatchAnalysisResult]  # In request order
+    unique_sets: int
+
+class AnalysisJobRequest(BaseModel):
+    schemas: List[str]
+    mode: Optional[Literal["combined", "per_schema"]] = None  # Defaults to ANALYSIS_MODE
+    priority: int = 0  # Higher priorities run first
+    webhook_url: Optional[str] = None  # Receives the finished job as a JSON POST
+
+class JobResponse(BaseModel):
+    job_id: str
+    status: Literal["queued", "running", "succeeded", "failed"]
+    priority: int
+    attempts: int
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    result: Optional[SchemaAnalysisResponse] = None
+    error: Optional[str] = None
+    duplicate: bool = False  # True if the submission matched an existing job
+
 class ChatRequest(BaseModel):
     schemas: List[str]
     question: str
+    session_id: Optional[str] = None  # Turns with the same ID reuse the context of the first turn
 
 class ChatResponse(BaseModel):
     answer: str
     schemas_context: List[str]
     question: str
+    session_id: Optional[str] = None
+
+# Prompt for /analyze-schemas/. Bump ANALYSIS_PROMPT_VERSION whenever the
+# template changes so cached analyses generated from the old one are not reused.
+ANALYSIS_PROMPT_VERSION = "2"
+ANALYSIS_PROMPT_TEMPLATE = """
+ROLE: You are an expert Schema Therapy assistant. Your tone must be supportive, educational, and non-judgmental. You MUST base your entire analysis strictly on the context provided from the user's uploaded documents. Never use external knowledge. Do not act as a therapist or provide a clinical diagnosis.
+
+CONTEXT: [Your system will automatically place the relevant text snippets from the user's documents here based on the schemas below. You don't need to write anything here.]
+
+USER DATA: A user has completed a questionnaire, and their most dominant schemas have been identified as: **{schema_list}**.
+
+TASK: Based ONLY on the provided CONTEXT, generate a personalized and structured educational report for the user. Structure your response using Markdown for clear formatting. For each schema listed in the USER DATA, create a dedicated section. Follow this exact format for each schema:
+
+## ▶️ {{Schema Name}}: General Overview
+(Provide a detailed definition and core concept of this schema based on the provided texts.)
+
+### Potential Effects on Your Life
+(Based on the texts, explain how this schema might manifest in the user's daily life, thoughts, feelings, and relationships.)
+
+### Next Steps (According to the Sources)
+(Summarize the suggestions, strategies, or steps for change related to this schema that are mentioned in the source documents. Always frame this as educational information from the texts, not as direct advice.)
+
+---
+(If there is more than one schema, repeat the above structure for the next schema.)
+
+If you cannot find sufficient information for any of the requested schemas in the provided CONTEXT, you must clearly state: "Sağlanan dokümanlarda '{{Schema Name}}' hakkında detaylı bilgi bulunamadı."
+"""
+
+# Prompt for a single schema section in "per_schema" analysis mode. Sections are
+# cached individually, keyed on SECTION_PROMPT_VERSION.
+SECTION_PROMPT_VERSION = "2"
+SECTION_PROMPT_TEMPLATE = """
+ROLE: You are an expert Schema Therapy assistant. Your tone must be supportive, educational, and non-judgmental. You MUST base your entire analysis strictly on the context provided from the user's uploaded documents. Never use external knowledge. Do not act as a therapist or provide a clinical diagnosis.
+
+CONTEXT: [Your system will automatically place the relevant text snippets from the user's documents here based on the schema below. You don't need to write anything here.]
+
+USER DATA: A user has completed a questionnaire, and one of their most dominant schemas has been identified as: **{schema}**.
+
+TASK: Based ONLY on the provided CONTEXT, generate a personalized and structured educational section about this schema for the user. Structure your response using Markdown for clear formatting. Follow this exact format:
+
+## ▶️ {schema}: General Overview
+(Provide a detailed definition and core concept of this schema based on the provided texts.)
+
+### Potential Effects on Your Life
+(Based on the texts, explain how this schema might manifest in the user's daily life, thoughts, feelings, and relationships.)
+
+### Next Steps (According to the Sources)
+(Summarize the suggestions, strategies, or steps for change related to this schema that are mentioned in the source documents. Always frame this as educational information from the texts, not as direct advice.)
+
+If you cannot find sufficient information for this schema in the provided CONTEXT, you must clearly state: "Sağlanan dokümanlarda '{schema}' hakkında detaylı bilgi bulunamadı."
+"""
+
+# Prompt for /chat-with-results/
+CHAT_PROMPT_TEMPLATE = """
+You are an expert Schema Therapy assistant providing contextual support and education. Your tone must be supportive, educational, and non-judgmental. You MUST base your entire response strictly on the context provided from the user's uploaded documents. Never use external knowledge.
+
+CONTEXT: [Your system will automatically place the relevant text snippets from the user's documents here based on the user's schemas and question. You don't need to write anything here.]
+
+USER CONTEXT: The user has been identified with these dominant schemas: **{schemas}**.
+
+USER QUESTION: "{question}"
+
+TASK: Based ONLY on the provided CONTEXT, provide a helpful, personalized response that:
+
+1. **Directly addresses the user's specific question** in relation to their identified schemas
+2. **Provides educational information** from the source documents that relates to both their schemas and their question
+3. **Maintains a supportive, non-judgmental tone** throughout the response
+4. **Explains concepts clearly** using language that is accessible and understandable
+5. **Connects the answer to their specific schema context** when relevant
+6. **Avoids providing clinical diagnoses or therapeutic advice** - focus on educational information only
+7. **If the source material doesn't contain enough information** to answer the question, clearly state this limitation
+
+Structure your response in a conversational yet informative way. Use the retrieved context to provide accurate, source-based information while keeping the user's specific schemas in mind.
+
+If you cannot find sufficient information in the provided CONTEXT to answer the question, you must clearly state: "Sağlanan dokümanlarda bu sorunuza yeterli bilgi bulunamadı, ancak mevcut bilgiler ışığında şunları söyleyebilirim..."
+"""
 
 # Global variables for the QA chain
 qa_chain = None
+readiness = ReadinessTracker()  # Startup stage, indexing progress and timings
+initialization_task = None  # Background task running initialize_system
+query_embeddings = None  # Query embedding cache used by the retriever
+deadline_llm = None  # Chat models with the latency statistics behind timeouts, hedging and fallback
+schema_index = None  # Precomputed context chunks for the canonical schemas
+context_packer = None  # Merges, deduplicates and budgets context chunks
+index_version = None  # Version of the loaded vector database; cache keys depend on it
+index_path = None  # Path of the loaded index snapshot
+reload_lock = asyncio.Lock()  # Only one index reload runs at a time
+reload_task = None  # Reload started from /admin/reload
+watcher_task = None  # Background task polling for index changes
+close_tasks = set()  # Tasks closing replaced chains whose requests outlived the reload drain
+reload_status = {"state": "idle", "reason": None, "started_at": None, "finished_at": None, "error": None}
+
+# Cache of generated analyses, keyed on the normalized schema set
+response_cache = ResponseCache(
+    max_entries=RESPONSE_CACHE_SIZE,
+    ttl_seconds=RESPONSE_CACHE_TTL_SECONDS,
+    sqlite_path=RESPONSE_CACHE_DB,
+)
+
+# Limits concurrent LLM-backed requests; excess requests get a fast 503
+request_limiter = ConcurrencyLimiter(
+    max_concurrent=MAX_CONCURRENT_REQUESTS,
+    max_queued=MAX_QUEUED_REQUESTS,
+    queue_timeout=QUEUE_TIMEOUT_SECONDS,
+)
+
+# Coalesces identical analyses that are generated at the same time
+analysis_flights = SingleFlight()
+
+# Context chunks of chat sessions, reused by follow-up turns
+chat_sessions = ChatSessionStore(
+    max_sessions=CHAT_SESSION_MAX,
+    ttl_seconds=CHAT_SESSION_TTL_SECONDS,
+    min_overlap=CHAT_SESSION_MIN_OVERLAP,
+    max_documents=CHAT_SESSION_MAX_CHUNKS,
+)
+
+# Durable queue of submitted analyses, opened at startup so importing this
+# module does not create the database; workers start once the QA chain is ready
+job_queue = None
+job_workers = None
+
+def collect_stats() -> List[tuple]:
+    """Counters kept by the caches, indexes, limiter and job queue, exported on /metrics."""
+    stats = [
+        ("rag_ready", "1 once the QA chain is ready", "gauge", {}, 1 if readiness.ready else 0),
+        ("rag_requests_in_flight", "LLM-backed requests holding a slot", "gauge", {}, request_limiter.active),
+        ("rag_requests_queued", "Requests waiting for a slot", "gauge", {}, request_limiter.waiting),
+        ("rag_single_flight_coalesced_total", "Analyses that joined an identical in-flight generation", "counter",
+         {}, analysis_flights.stats()["coalesced"]),
+    ]
+    cache_stats = response_cache.stats()
+    for result in ("hits", "disk_hits", "misses"):
+        stats.append(("rag_response_cache_lookups_total", "Response cache lookups by result", "counter",
+                      {"result": result}, cache_stats[result]))
+    session_stats = chat_sessions.stats()
+    for result in ("hits", "misses"):
+        stats.append(("rag_chat_session_lookups_total", "Chat session context lookups by result", "counter",
+                      {"result": result}, session_stats[result]))
+    stats.append(("rag_chat_session_refreshes_total", "Follow-ups whose session context was retrieved again", "counter",
+                  {}, session_stats["refreshes"]))
+    if job_queue is not None:
+        for job_status, count in job_queue.stats().items():
+            stats.append(("rag_jobs", "Analysis jobs by status", "gauge", {"status": job_status}, count))
+    if query_embeddings is not None:
+        embedding_stats = query_embeddings.stats()
+        for result in ("hits", "misses"):
+            stats.append(("rag_query_embedding_cache_lookups_total", "Query embedding cache lookups by result",
+                          "counter", {"result": result}, embedding_stats[result]))
+    if schema_index is not None:
+        index_stats = schema_index.stats()
+        for result in ("hits", "fallbacks"):
+            stats.append(("rag_schema_index_lookups_total", "Schema index lookups by result", "counter",
+                          {"result": result}, index_stats[result]))
+    if context_packer is not None:
+        packing_stats = context_packer.stats()
+        stats.extend([
+            ("rag_context_input_tokens_total", "Estimated tokens of retrieved chunks before packing", "counter",
+             {}, packing_stats["input_tokens"]),
+            ("rag_context_packed_tokens_total", "Estimated tokens of packed context", "counter",
+             {}, packing_stats["packed_tokens"]),
+        ])
+    return stats
+
+register_stats_collector(collect_stats)
+
+def deadline_exception(error: GenerationTimeoutError) -> HTTPException:
+    """Build the 504 response returned when no model answered within the deadline."""
+    logger.warning(f"Generation timed out: {str(error)}")
+    return HTTPException(
+        status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+        detail=f"The language model did not answer in time, please retry. {str(error)}",
+    )
+
+def overloaded_exception(error: ServerOverloadedError) -> HTTPException:
+    """Build the 503 response returned when a request cannot be admitted."""
+    logger.warning(f"Rejecting request: {str(error)}")
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail=f"Server is busy, please retry shortly. {str(error)}",
+        headers={"Retry-After": "1"},
+    )
 
 def setup_environment():
     """Set up the environment with the Google API key and app secret key."""
@@ -145,210 +500,729 @@ def setup_environment():
     logger.info("Environment variables configured successfully")
     return True
 
-def extract_text_from_pdf(pdf_path: str) -> str:
-    """Extract text from a PDF file."""
-    try:
-        with open(pdf_path, 'rb') as file:
-            pdf_reader = PyPDF2.PdfReader(file)
-            text = ""
-            for page in pdf_reader.pages:
-                text += page.extract_text() + "\n"
-        return text
-    except Exception as e:
-        logger.error(f"Error reading PDF {pdf_path}: {str(e)}")
-        return ""
-
-def extract_text_from_docx(docx_path: str) -> str:
-    """Extract text from a DOCX file."""
-    try:
-        doc = Document(docx_path)
-        text = ""
-        for paragraph in doc.paragraphs:
-            text += paragraph.text + "\n"
-        return text
-    except Exception as e:
-        logger.error(f"Error reading DOCX {docx_path}: {str(e)}")
-        return ""
+def create_llm() -> DeadlineLLM:
+    """Create the primary and fallback chat models behind deadline-aware, hedged calls."""
+    fallback_llm = None
+    if LLM_BACKEND == "fake":
+        from fake_models import FAKE_FALLBACK_LLM_LATENCY_SECONDS, FAKE_FALLBACK_LLM_TOKENS_PER_SECOND, FakeChatModel
+        logger.info("Initializing offline fake chat model...")
+        llm = FakeChatModel()
+        if LLM_FALLBACK_MODEL:
+            fallback_llm = FakeChatModel(
+                latency_seconds=FAKE_FALLBACK_LLM_LATENCY_SECONDS,
+                tokens_per_second=FAKE_FALLBACK_LLM_TOKENS_PER_SECOND,
+                stall_probability=0,
+            )
+    else:
+        from langchain_google_genai import ChatGoogleGenerativeAI
+        logger.info("Initializing Gemini model...")
+        llm = ChatGoogleGenerativeAI(
+            model="gemini-1.5-pro-latest",
+            temperature=0.3,
+            convert_system_message_to_human=True
+        )
+        if LLM_FALLBACK_MODEL:
+            logger.info(f"Initializing fallback model {LLM_FALLBACK_MODEL}...")
+            fallback_llm = ChatGoogleGenerativeAI(
+                model=LLM_FALLBACK_MODEL,
+                temperature=0.3,
+                convert_system_message_to_human=True
+            )
+
+    return DeadlineLLM(
+        llm,
+        fallback_llm,
+        max_timeout=LLM_TIMEOUT_SECONDS,
+        min_timeout=LLM_MIN_TIMEOUT_SECONDS,
+        timeout_multiplier=LLM_TIMEOUT_MULTIPLIER,
+        hedge=LLM_HEDGE_ENABLED,
+        hedge_percentile=LLM_HEDGE_PERCENTILE,
+        window=LLM_LATENCY_WINDOW,
+    )
+
+def close_vectorstore(vectorstore):
+    """Close the Chroma client of a vector store, releasing its SQLite connections."""
+    client = vectorstore._client
+    close = getattr(client, "close", None)
+    if close is not None:
+        close()
+    else:
+        # chromadb releases without Client.close() only stop the client's system
+        client._system.stop()
 
-def load_documents_from_folder(folder_path: str) -> str:
+def setup_qa_chain(db_path: str, version: Optional[str]) -> Optional[Tuple["SchemaQAChain", Optional["SchemaIndex"]]]:
     """
-    Load and extract text from all PDF and DOCX files in the specified folder.
-    Returns concatenated text from all documents.
+    Set up the Question-Answering chain and the schema index for an index snapshot.
+    Nothing that serves requests is replaced here, so the current chain keeps
+    serving while a reloaded snapshot is set up (see activate_index).
+    Returns the QA chain and schema index if successful, None otherwise.
     """
-    if not os.path.exists(folder_path):
-        logger.error(f"Source folder '{folder_path}' does not exist!")
-        logger.error(f"Please create the folder and add your Schema Therapy documents.")
-        return ""
-    
-    all_text = ""
-    supported_extensions = ['.pdf', '.docx']
-    files_processed = 0
-    
-    logger.info(f"Loading documents from '{folder_path}'...")
-    
-    for filename in os.listdir(folder_path):
-        file_path = os.path.join(folder_path, filename)
-        file_extension = Path(filename).suffix.lower()
-        
-        if file_extension in supported_extensions and os.path.isfile(file_path):
-            logger.info(f"Processing: {filename}")
-            
-            if file_extension == '.pdf':
-                text = extract_text_from_pdf(file_path)
-            elif file_extension == '.docx':
-                text = extract_text_from_docx(file_path)
-            
-            if text.strip():
-                all_text += f"\n--- Content from {filename} ---\n{text}\n"
-                files_processed += 1
-            else:
-                logger.warning(f"No text extracted from {filename}")
-    
-    logger.info(f"Successfully processed {files_processed} documents")
-    logger.info(f"Total text length: {len(all_text)} characters")
-    
-    return all_text
+    global query_embeddings, deadline_llm, context_packer
 
-def create_vector_database(text_content: str, db_path: str) -> bool:
-    """
-    Create a ChromaDB vector database from the provided text content.
-    Returns True if successful, False otherwise.
-    """
-    if not text_content.strip():
-        logger.error("No text content provided for vector database creation!")
-        return False
-    
+    on_close = None
     try:
-        logger.info("Creating vector database...")
-        
-        # Split text into chunks
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000,
-            chunk_overlap=200,
-            length_function=len,
-        )
-        
-        logger.info("Splitting text into chunks...")
-        chunks = text_splitter.split_text(text_content)
-        logger.info(f"Created {len(chunks)} text chunks")
+        logger.info("Setting up QA chain...")
+
+        from langchain_chroma import Chroma
+        from context_packing import ContextPacker
+        from embedding_stage import CachedQueryEmbeddings, create_embeddings
+        from rag_chain import SchemaQAChain
         
-        # Create LangChain documents
-        documents = [LangChainDocument(page_content=chunk) for chunk in chunks]
+        # Initialize embeddings; repeated retrieval queries are served from the cache.
+        # The embedding model does not change on reload, so the cache is kept.
+        if query_embeddings is None:
+            embeddings, _ = create_embeddings(EMBEDDING_BACKEND)
+            query_embeddings = CachedQueryEmbeddings(embeddings, max_entries=QUERY_EMBEDDING_CACHE_SIZE)
+        embeddings = query_embeddings.embeddings
         
-        # Initialize embeddings
-        logger.info("Initializing Google embeddings...")
-        embeddings = GoogleGenerativeAIEmbeddings(model="models/text-embedding-004")
+        # Analyses of known schemas take their context from the precomputed schema index
+        snapshot_schema_index = None
+        if SCHEMA_INDEX_ENABLED:
+            from schema_index import load_schema_index
+            snapshot_schema_index = load_schema_index(db_path, embeddings, version)
         
-        # Create and persist vector store
-        logger.info("Creating and saving vector database...")
-        Chroma.from_documents(
-            documents=documents,
-            embedding=embeddings,
-            persist_directory=db_path
+        # Create retriever over the index snapshot
+        logger.info(
+            f"Loading vector database from '{db_path}' "
+            f"({VECTOR_INDEX_BACKEND} backend, {RETRIEVAL_MODE} retrieval)..."
         )
+        vector_k = RETRIEVAL_CANDIDATES if RETRIEVAL_MODE == "hybrid" else RETRIEVAL_K
+        if RETRIEVAL_MODE == "lexical":
+            retriever = None
+        elif VECTOR_INDEX_BACKEND == "numpy":
+            from vector_index import NumpyRetriever, load_numpy_index
+            numpy_index = load_numpy_index(db_path, version, dtype=VECTOR_INDEX_DTYPE)
+            retriever = NumpyRetriever(index=numpy_index, embeddings=query_embeddings, k=vector_k)
+        else:
+            vectorstore = Chroma(
+                persist_directory=db_path,
+                embedding_function=query_embeddings
+            )
+            retriever = vectorstore.as_retriever(
+                search_type="similarity",
+                search_kwargs={"k": vector_k}
+            )
+            on_close = lambda: close_vectorstore(vectorstore)
         
-        logger.info(f"Vector database created successfully at '{db_path}'")
-        return True
-        
-    except Exception as e:
-        logger.error(f"Error creating vector database: {str(e)}")
-        return False
-
-def setup_qa_chain(db_path: str) -> Optional[RetrievalQA]:
-    """
-    Set up the Question-Answering chain with the vector database.
-    Returns the QA chain if successful, None otherwise.
-    """
-    try:
-        logger.info("Setting up QA chain...")
-        
-        # Initialize embeddings
-        embeddings = GoogleGenerativeAIEmbeddings(model="models/text-embedding-004")
+        # Exact keyword matches come from the BM25 index
+        if RETRIEVAL_MODE in ("hybrid", "lexical"):
+            from lexical_index import HybridRetriever, LexicalRetriever, load_lexical_index
+            lexical_index = load_lexical_index(db_path, version)
+            if retriever is None:
+                retriever = LexicalRetriever(index=lexical_index, k=RETRIEVAL_K)
+            else:
+                retriever = HybridRetriever(
+                    vector_retriever=retriever,
+                    index=lexical_index,
+                    k=RETRIEVAL_K,
+                    candidates=RETRIEVAL_CANDIDATES,
+                    vector_timeout=HYBRID_VECTOR_TIMEOUT_SECONDS,
+                )
         
-        # Load existing vector store
-        logger.info(f"Loading vector database from '{db_path}'...")
-        vectorstore = Chroma(
-            persist_directory=db_path,
-            embedding_function=embeddings
-        )
+        # Initialize the language models; their observed latencies set the
+        # timeouts and hedging delay, so they are kept across reloads
+        if deadline_llm is None:
+            deadline_llm = create_llm()
         
-        # Initialize the language model
-        logger.info("Initializing Gemini model...")
-        llm = ChatGoogleGenerativeAI(
-            model="gemini-1.5-pro-latest",
-            temperature=0.3,
-            convert_system_message_to_human=True
-        )
+        # Overlapping chunks are merged and the context is packed to a token budget
+        if context_packer is None:
+            context_packer = ContextPacker(
+                max_tokens=CONTEXT_MAX_TOKENS,
+                duplicate_threshold=CONTEXT_DUPLICATE_THRESHOLD,
+            )
         
-        # Create retriever
-        retriever = vectorstore.as_retriever(
-            search_type="similarity",
-            search_kwargs={"k": 5}
-        )
-        
-        # Create QA chain
-        qa_chain = RetrievalQA.from_chain_type(
-            llm=llm,
-            chain_type="stuff",
-            retriever=retriever,
-            return_source_documents=False
+        # Create QA chain: the retriever gets a compact query, the LLM the full instructions
+        qa_chain = SchemaQAChain(
+            retriever=retriever, llm=deadline_llm, context_packer=context_packer, on_close=on_close
         )
         
         logger.info("QA chain setup complete!")
-        return qa_chain
+        return qa_chain, snapshot_schema_index
         
     except Exception as e:
         logger.error(f"Error setting up QA chain: {str(e)}")
+        if on_close is not None:
+            on_close()
         return None
 
+async def resolve_index_snapshot(keep: int, progress=None) -> Optional[str]:
+    """
+    Return the path of the index snapshot to serve, or None if there is none.
+
+    With INDEX_BUILD_ON_STARTUP, a snapshot of the source folder is built first
+    if the folder changed (only new or changed documents are embedded).
+    Otherwise the snapshot published by `python -m ingestion build-index` is used.
+    """
+    def import_ingestion():
+        from embedding_stage import EmbeddingStage, create_embeddings
+        from index_snapshots import build_index_snapshot, get_current_snapshot
+        return EmbeddingStage, create_embeddings, build_index_snapshot, get_current_snapshot
+
+    EmbeddingStage, create_embeddings, build_index_snapshot, get_current_snapshot = \
+        await asyncio.to_thread(import_ingestion)
+
+    if not INDEX_BUILD_ON_STARTUP:
+        return get_current_snapshot(INDEX_SNAPSHOT_DIR)
+
+    embeddings, embedding_model = create_embeddings(EMBEDDING_BACKEND)
+    embedding_stage = EmbeddingStage(
+        embeddings,
+        batch_size=EMBEDDING_BATCH_SIZE,
+        max_in_flight=EMBEDDING_MAX_IN_FLIGHT,
+        requests_per_minute=EMBEDDING_REQUESTS_PER_MINUTE,
+    )
+    return await asyncio.to_thread(
+        build_index_snapshot, SOURCE_FOLDER, INDEX_SNAPSHOT_DIR, embedding_stage, embedding_model,
+        workers=INGEST_WORKERS, base_path=VECTOR_DB_PATH, keep=keep, progress=progress,
+    )
+
+def activate_index(path: str, version: Optional[str], chain: "SchemaQAChain",
+                   snapshot_schema_index: Optional["SchemaIndex"]):
+    """
+    Start serving an index snapshot.
+    All references are replaced without yielding to the event loop, so every
+    request sees either the old or the new index, never a mix.
+    """
+    global qa_chain, schema_index, index_version, index_path
+
+    qa_chain = chain
+    schema_index = snapshot_schema_index
+    index_path = path
+    index_version = version
+    # Cached analyses from a different index version are no longer valid
+    response_cache.set_index_version(version)
+
 async def initialize_system():
-    """Initialize the RAG system on startup."""
-    global qa_chain
-    
+    """
+    Initialize the RAG system in the background after the server has started.
+    Heavy imports, indexing and QA chain setup run in worker threads so the event
+    loop keeps serving `/health` and `/ready` meanwhile.
+    """
     logger.info("Initializing Schema Therapy RAG system...")
+    readiness.enter("loading")
     
     # Setup environment
     if not setup_environment():
         logger.error("Environment setup failed. Please configure your Google API key.")
+        readiness.fail("Environment setup failed")
         return False
-    
-    # Check if vector database already exists
-    if os.path.exists(VECTOR_DB_PATH):
-        logger.info(f"Found existing vector database at '{VECTOR_DB_PATH}'")
-        logger.info("Skipping document processing and using existing database...")
-    else:
-        logger.info(f"Vector database not found at '{VECTOR_DB_PATH}'")
-        logger.info("Creating new vector database...")
-        
-        # Load documents
-        combined_text = load_documents_from_folder(SOURCE_FOLDER)
-        
-        if not combined_text.strip():
-            logger.error("No documents found or processed. Please check your source folder.")
-            return False
-        
-        # Create vector database
-        if not create_vector_database(combined_text, VECTOR_DB_PATH):
-            logger.error("Failed to create vector database.")
-            return False
-    
+
+    if INDEX_BUILD_ON_STARTUP:
+        # Build a new snapshot if the source folder changed, then load it.
+        readiness.enter("indexing")
+    snapshot_path = await resolve_index_snapshot(INDEX_KEEP_SNAPSHOTS, progress=readiness.progress)
+
+    if snapshot_path is None and INDEX_BUILD_ON_STARTUP:
+        logger.error("Failed to build index snapshot.")
+        readiness.fail("Failed to build index snapshot")
+        return False
+    if snapshot_path is None:
+        logger.error(f"No index snapshot published in '{INDEX_SNAPSHOT_DIR}'.")
+        logger.error(
+            "Run `python -m ingestion build-index` first, "
+            "or set INDEX_BUILD_ON_STARTUP=true to build it at startup (local development)."
+        )
+        readiness.fail("No index snapshot published")
+        return False
+    if not INDEX_BUILD_ON_STARTUP:
+        # Default: load the snapshot published by `python -m ingestion build-index`
+        logger.info(f"Using prebuilt index snapshot '{snapshot_path}'")
+
+    from ingestion import get_index_version
+    version = get_index_version(snapshot_path)
+
     # Setup QA chain
-    qa_chain = setup_qa_chain(VECTOR_DB_PATH)
+    readiness.enter("loading_qa_chain")
+    setup = await asyncio.to_thread(setup_qa_chain, snapshot_path, version)
     
-    if qa_chain is None:
+    if setup is None:
         logger.error("Failed to setup QA chain.")
+        readiness.fail("Failed to setup QA chain")
         return False
     
-    logger.info("Schema Therapy RAG system initialized successfully!")
+    activate_index(snapshot_path, version, *setup)
+    start_job_workers()
+    readiness.enter("ready")
+    logger.info(
+        f"Schema Therapy RAG system initialized successfully "
+        f"in {readiness.snapshot()['ready_after_seconds']}s!"
+    )
     return True
 
+async def close_when_drained(chain: "SchemaQAChain", version: Optional[str]):
+    """Close a replaced chain once the requests that outlived the reload drain have finished."""
+    try:
+        while not await chain.drain(RELOAD_DRAIN_TIMEOUT_SECONDS):
+            pass
+        await asyncio.to_thread(chain.close)
+        logger.info(f"Closed the QA chain of index {version}")
+    finally:
+        close_tasks.discard(asyncio.current_task())
+
+async def reload_index(reason: str) -> bool:
+    """
+    Pick up a changed corpus or a newly published snapshot without downtime.
+
+    The new snapshot is built (or, without INDEX_BUILD_ON_STARTUP, read from
+    CURRENT) and its chain set up in the background while the current chain
+    keeps serving. The chain, schema index and index version are then swapped
+    in one step. Requests still running on the old chain are drained before
+    the old chain is closed and old snapshots are pruned.
+
+    Returns:
+        True if a new index is being served
+    """
+    from ingestion import get_index_version
+    from index_snapshots import prune_snapshots
+
+    async with reload_lock:
+        reload_status.update(state="running", reason=reason, started_at=time.time(), finished_at=None, error=None)
+        logger.info(f"Reloading index ({reason})...")
+        try:
+            # Keep the serving snapshot while the old chain may still read from it
+            snapshot_path = await resolve_index_snapshot(max(INDEX_KEEP_SNAPSHOTS, 2))
+            if snapshot_path is None:
+                raise RuntimeError("No index snapshot could be built or found")
+
+            version = get_index_version(snapshot_path)
+            if snapshot_path == index_path and version == index_version:
+                logger.info(f"Index {version} is already being served")
+                reload_status.update(state="unchanged", finished_at=time.time())
+                return False
+
+            setup = await asyncio.to_thread(setup_qa_chain, snapshot_path, version)
+            if setup is None:
+                raise RuntimeError("Failed to set up the QA chain for the new index")
+
+            old_chain, old_version = qa_chain, index_version
+            activate_index(snapshot_path, version, *setup)
+            logger.info(f"Serving index {version} (was {old_version})")
+
+            if old_chain is not None and not await old_chain.drain(RELOAD_DRAIN_TIMEOUT_SECONDS):
+                logger.warning(f"{old_chain.active} requests still running on index {old_version} after draining")
+                close_tasks.add(asyncio.create_task(close_when_drained(old_chain, old_version)))
+            else:
+                if old_chain is not None:
+                    await asyncio.to_thread(old_chain.close)
+                if INDEX_BUILD_ON_STARTUP:
+                    await asyncio.to_thread(prune_snapshots, INDEX_SNAPSHOT_DIR, INDEX_KEEP_SNAPSHOTS)
+
+            reload_status.update(state="succeeded", finished_at=time.time())
+            return True
+        except Exception as e:
+            logger.error(f"Index reload failed, still serving index {index_version}: {str(e)}")
+            reload_status.update(state="failed", finished_at=time.time(), error=str(e))
+            return False
+
+async def watch_index():
+    """
+    Reload the index when the source folder changes (or, without
+    INDEX_BUILD_ON_STARTUP, when a new snapshot is published).
+    """
+    from ingestion import load_manifest, plan_sync
+    from index_snapshots import get_current_snapshot
+
+    # The manifest of the served snapshot, kept between polls so plan_sync
+    # only hashes files that were touched since the last poll
+    watched_path, watched_manifest = None, None
+
+    def has_changes() -> bool:
+        nonlocal watched_path, watched_manifest
+        if not INDEX_BUILD_ON_STARTUP:
+            return get_current_snapshot(INDEX_SNAPSHOT_DIR) != index_path
+        if not os.path.exists(SOURCE_FOLDER):
+            return False
+        if watched_path != index_path:
+            watched_path, watched_manifest = index_path, load_manifest(index_path)
+        return watched_manifest is None or plan_sync(SOURCE_FOLDER, watched_manifest).has_changes
+
+    logger.info(f"Watching for index changes every {INDEX_WATCH_INTERVAL_SECONDS}s")
+    while True:
+        await asyncio.sleep(INDEX_WATCH_INTERVAL_SECONDS)
+        try:
+            if not reload_lock.locked() and await asyncio.to_thread(has_changes):
+                await reload_index("source change detected")
+        except Exception as e:
+            logger.error(f"Error while watching for index changes: {str(e)}")
+
+SECTION_SEPARATOR = "\n\n---\n\n"
+
+def analysis_cache_key(schemas: List[str]) -> str:
+    """Cache key of a combined analysis for a schema set."""
+    return make_cache_key("analysis", normalize_schemas(schemas), ANALYSIS_PROMPT_VERSION, index_version)
+
+def section_cache_key(schema: str) -> str:
+    """Cache key of a single schema section."""
+    return make_cache_key("analysis-section", normalize_schemas([schema]), SECTION_PROMPT_VERSION, index_version)
+
+def dedupe_schemas(schemas: List[str]) -> List[str]:
+    """Drop blanks and duplicates that only differ in case or whitespace, keeping the first spelling."""
+    unique_schemas = []
+    seen = set()
+    for schema in schemas:
+        normalized = normalize_schemas([schema])
+        if normalized and normalized[0] not in seen:
+            seen.add(normalized[0])
+            unique_schemas.append(schema.strip())
+    return unique_schemas
+
+def schema_context(schemas: List[str]) -> Optional[List["Document"]]:
+    """
+    Look up the precomputed context chunks for a schema set.
+    Returns None if any schema is unknown, in which case the chain retrieves live.
+    """
+    if schema_index is None:
+        return None
+    documents = schema_index.lookup(schemas, k=RETRIEVAL_K)
+    if documents is not None:
+        record_count("schema_index_hits")
+    return documents
+
+def build_contextual_query(schemas: List[str], question: str) -> str:
+    """Build the retrieval query for a chat question."""
+    return f"Regarding the schemas '{', '.join(schemas)}', the user asks: {question}"
+
+def start_chat_session(session_id: str, schemas: List[str]):
+    """
+    Tie a chat session to an analysis: follow-up turns reuse the precomputed
+    context of the analyzed schemas. If the schemas are not in the schema
+    index, the first chat turn retrieves the session context instead.
+    """
+    documents = schema_context(schemas)
+    if documents is not None:
+        chat_sessions.set(session_id, schemas, index_version, documents)
+
+async def chat_context(session_id: Optional[str], schemas: List[str], question: str,
+                       retrieval_query: str) -> Optional[List["Document"]]:
+    """
+    Return the context chunks of a chat turn from its session, retrieving and
+    storing them on the first turn. A follow-up the session context does not
+    cover retrieves again, and the fresh chunks are merged into the session.
+    Without a session ID, returns None and the chain retrieves for every turn.
+    """
+    if session_id is None:
+        return None
+    # A reload may swap the chain meanwhile; the retrieval is counted on the chain
+    # it runs on, so that chain's snapshot is not pruned under it
+    chain, version = qa_chain, index_version
+    documents = chat_sessions.get(session_id, schemas, version)
+    if documents is not None and chat_sessions.covers(documents, schemas, question):
+        logger.info(f"Reusing {len(documents)} context chunks of chat session {session_id}")
+        record_count("chat_session_hits")
+        return documents
+    async with request_limiter.slot():
+        fresh = await chain.aretrieve(retrieval_query)
+    if documents is not None:
+        fresh = chat_sessions.merge(fresh, documents)
+    chat_sessions.set(session_id, schemas, version, fresh)
+    return fresh
+
+async def generate_combined_analysis(schemas: List[str]) -> str:
+    """Generate the analysis for all schemas with a single prompt, using the response cache."""
+    schema_list_str = ", ".join(schemas)
+
+    # Identical schema sets against the same index and prompt reuse the cached analysis
+    cache_key = analysis_cache_key(schemas)
+    cached_analysis = response_cache.get(cache_key)
+    if cached_analysis is not None:
+        logger.info(f"Serving cached analysis for schemas: {schema_list_str}")
+        record_count("response_cache_hits")
+        return cached_analysis
+
+    # Create the analysis prompt with your specified format
+    prompt = ANALYSIS_PROMPT_TEMPLATE.format(schema_list=schema_list_str)
+
+    logger.info(f"Analyzing schemas: {schema_list_str}")
+
+    # Retrieve with the schema names only; the instructions go to the LLM alone
+    async def generate() -> str:
+        async with request_limiter.slot():
+            analysis_text = await qa_chain.arun(schema_list_str, prompt, documents=schema_context(schemas))
+        response_cache.set(cache_key, analysis_text)
+        return analysis_text
+
+    # Concurrent requests for the same schema set share one generation
+    return await analysis_flights.run(cache_key, generate)
+
+async def generate_analysis_section(schema: str) -> str:
+    """Generate the report section for a single schema, using the response cache."""
+    cache_key = section_cache_key(schema)
+    cached_section = response_cache.get(cache_key)
+    if cached_section is not None:
+        logger.info(f"Serving cached section for schema: {schema}")
+        record_count("response_cache_hits")
+        return cached_section
+
+    prompt = SECTION_PROMPT_TEMPLATE.format(schema=schema)
+
+    async def generate() -> str:
+        async with request_limiter.slot():
+            section_text = (await qa_chain.arun(schema, prompt, documents=schema_context([schema]))).strip()
+        response_cache.set(cache_key, section_text)
+        return section_text
+
+    return await analysis_flights.run(cache_key, generate)
+
+async def generate_per_schema_analysis(schemas: List[str]) -> str:
+    """
+    Generate one section per schema concurrently and assemble them in the requested order.
+    Each section does its own retrieval and is cached on its own, so sections are
+    shared between requests for different schema sets.
+    """
+    unique_schemas = dedupe_schemas(schemas)
+
+    logger.info(f"Analyzing schemas per section: {', '.join(unique_schemas)}")
+    sections = await asyncio.gather(*(generate_analysis_section(schema) for schema in unique_schemas))
+    return SECTION_SEPARATOR.join(sections)
+
+async def generate_analysis(schemas: List[str], mode: str) -> str:
+    """Generate the analysis of a schema set in the given mode."""
+    if mode == "per_schema":
+        return await generate_per_schema_analysis(schemas)
+    return await generate_combined_analysis(schemas)
+
+async def iter_batch_results(request: BatchAnalysisRequest) -> AsyncIterator[List[BatchAnalysisResult]]:
+    """
+    Generate the analyses of a batch, yielding results as they complete.
+
+    Schema sets that are identical after normalization are generated once, and
+    at most BATCH_MAX_CONCURRENCY unique sets are generated at the same time.
+    Each yielded list holds the results of every request position that shares
+    one unique set. Failures are reported per set instead of failing the batch.
+    """
+    mode = request.mode or ANALYSIS_MODE
+    groups = {}
+    for index, schemas in enumerate(request.schema_sets):
+        groups.setdefault(make_cache_key(mode, normalize_schemas(schemas)), []).append(index)
+    logger.info(f"Processing batch of {len(request.schema_sets)} schema sets ({len(groups)} unique)")
+
+    semaphore = asyncio.Semaphore(max(1, BATCH_MAX_CONCURRENCY))
+
+    async def process(indices: List[int]) -> List[BatchAnalysisResult]:
+        schemas = request.schema_sets[indices[0]]
+        analysis_text, error = None, None
+        if not normalize_schemas(schemas):
+            error = "No schemas provided for analysis."
+        else:
+            async with semaphore:
+                try:
+                    analysis_text = await generate_analysis(schemas, mode)
+                except Exception as e:
+                    logger.error(f"Error during batch analysis of {', '.join(schemas)}: {str(e)}")
+                    error = str(e)
+        return [
+            BatchAnalysisResult(
+                index=index,
+                schemas_analyzed=request.schema_sets[index],
+                analysis=analysis_text,
+                error=error,
+            )
+            for index in indices
+        ]
+
+    tasks = [asyncio.create_task(process(indices)) for indices in groups.values()]
+    try:
+        for next_result in asyncio.as_completed(tasks):
+            yield await next_result
+    finally:
+        for task in tasks:
+            task.cancel()
+
+def job_response(job: dict, duplicate: bool = False) -> JobResponse:
+    """Build the public view of a job."""
+    return JobResponse(
+        job_id=job["id"],
+        status=job["status"],
+        priority=job["priority"],
+        attempts=job["attempts"],
+        created_at=job["created_at"],
+        started_at=job["started_at"],
+        finished_at=job["finished_at"],
+        result=job["result"],
+        error=job["error"] if job["status"] == "failed" else None,
+        duplicate=duplicate,
+    )
+
+async def run_analysis_job(payload: dict) -> dict:
+    """Job handler: generate the analysis described by a job payload."""
+    analysis_text = await generate_analysis(payload["schemas"], payload["mode"])
+    return {"analysis": analysis_text, "schemas_analyzed": payload["schemas"]}
+
+def start_job_workers():
+    """Start the job worker pool. Jobs left over from a previous run are picked up again."""
+    global job_workers
+
+    job_workers = JobWorkerPool(
+        job_queue,
+        run_analysis_job,
+        concurrency=JOB_WORKERS,
+        # Load shedding is not the job's fault: requeue it shortly without using up an attempt
+        requeue_delay=lambda error: 5.0 if isinstance(error, ServerOverloadedError) else None,
+        on_finish=lambda job: jsonable_encoder(job_response(job)),
+        webhook_allowed_hosts=JOB_WEBHOOK_ALLOWED_HOSTS,
+    )
+    job_workers.start()
+
+def validate_batch(request: BatchAnalysisRequest):
+    """Reject batch requests that cannot be processed."""
+    if qa_chain is None:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"QA system not ready (stage: {readiness.stage}). Please retry shortly or check server logs."
+        )
+
+    if not request.schema_sets:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="No schema sets provided for analysis."
+        )
+
+    if len(request.schema_sets) > BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Too many schema sets: {len(request.schema_sets)} (maximum {BATCH_MAX_ITEMS} per batch)."
+        )
+
+async def stream_answer(retrieval_query: str, instructions: str, cache_key: Optional[str] = None,
+                        documents: Optional[List["Document"]] = None) -> AsyncIterator[str]:
+    """
+    Stream an answer from the QA chain, holding a concurrency slot while generating.
+    With a cache key, a cached answer is replayed at once and a newly generated
+    answer is cached when the stream completes. Precomputed `documents` skip retrieval.
+    """
+    if cache_key is not None:
+        cached_text = response_cache.get(cache_key)
+        if cached_text is not None:
+            record_count("response_cache_hits")
+            yield cached_text
+            return
+
+    parts = []
+    async with request_limiter.slot():
+        async for chunk in qa_chain.astream(retrieval_query, instructions, documents=documents):
+            parts.append(chunk)
+            yield chunk
+
+    if cache_key is not None:
+        response_cache.set(cache_key, "".join(parts).strip())
+
+async def stream_per_schema_analysis(schemas: List[str]) -> AsyncIterator[str]:
+    """
+    Stream one section per schema in the requested order.
+    All sections are generated concurrently: the current section streams live
+    while the following ones are buffered until it is their turn.
+    """
+    unique_schemas = dedupe_schemas(schemas)
+    queues = [asyncio.Queue() for _ in unique_schemas]
+
+    async def produce(schema: str, queue: asyncio.Queue):
+        try:
+            prompt = SECTION_PROMPT_TEMPLATE.format(schema=schema)
+            async for chunk in stream_answer(schema, prompt, section_cache_key(schema), schema_context([schema])):
+                queue.put_nowait(chunk)
+            queue.put_nowait(None)
+        except Exception as e:
+            queue.put_nowait(e)
+
+    logger.info(f"Streaming analysis per section: {', '.join(unique_schemas)}")
+    tasks = [asyncio.create_task(produce(schema, queue)) for schema, queue in zip(unique_schemas, queues)]
+    try:
+        for index, queue in enumerate(queues):
+            if index:
+                yield SECTION_SEPARATOR
+            while True:
+                item = await queue.get()
+                if item is None:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+    finally:
+        for task in tasks:
+            task.cancel()
+
+def format_sse(event: str, data: dict) -> str:
+    """Format one Server-Sent Events message."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+async def open_stream(stream: AsyncIterator[str]) -> Optional[str]:
+    """
+    Wait for the first chunk of a stream before the response starts, so
+    overload, setup and generation timeout errors can still be returned as HTTP errors.
+    Returns None if the stream is empty.
+    """
+    try:
+        return await anext(stream, None)
+    except ServerOverloadedError as e:
+        await stream.aclose()
+        raise overloaded_exception(e)
+    except GenerationTimeoutError as e:
+        await stream.aclose()
+        raise deadline_exception(e)
+
+async def sse_events(first_chunk: Optional[str], stream: AsyncIterator[str], done_data: dict) -> AsyncIterator[str]:
+    """
+    Convert a text stream into SSE messages: one `token` event per chunk, then
+    `done`, or `error` if generation fails after the response has started.
+    """
+    try:
+        if first_chunk is not None:
+            yield format_sse("token", {"text": first_chunk})
+            async for chunk in stream:
+                yield format_sse("token", {"text": chunk})
+        yield format_sse("done", done_data)
+    except Exception as e:
+        logger.error(f"Error during streaming: {str(e)}")
+        yield format_sse("error", {"detail": str(e)})
+    finally:
+        await stream.aclose()
+
+def sse_response(events: AsyncIterator[str]) -> StreamingResponse:
+    """Wrap SSE messages in a streaming response that proxies do not buffer."""
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 # FastAPI Events
 @app.on_event("startup")
 async def startup_event():
-    """Initialize the system when the API starts."""
-    success = await initialize_system()
-    if not success:
-        logger.error("Failed to initialize system. API may not function properly.")
+    """
+    Open the job queue and start initializing the system in the background.
+    The server accepts connections right away; `/ready` reports when it can serve requests.
+    """
+    global initialization_task, job_queue
+
+    job_queue = JobQueue(
+        JOB_QUEUE_DB,
+        retention_seconds=JOB_RETENTION_SECONDS,
+        max_attempts=JOB_MAX_ATTEMPTS,
+        max_requeue_seconds=JOB_MAX_REQUEUE_SECONDS,
+    )
+
+    async def run_initialization():
+        global watcher_task
+        try:
+            success = await initialize_system()
+        except Exception as e:
+            logger.error(f"Error during initialization: {str(e)}")
+            readiness.fail(str(e))
+            success = False
+        if not success:
+            logger.error("Failed to initialize system. API may not function properly.")
+        elif INDEX_WATCH_INTERVAL_SECONDS > 0:
+            watcher_task = asyncio.create_task(watch_index())
+
+    initialization_task = asyncio.create_task(run_initialization())
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop the index watcher and the job workers; jobs they were running go back to the queue."""
+    if watcher_task is not None:
+        watcher_task.cancel()
+    if job_workers is not None:
+        await job_workers.stop()
 
 # API Endpoints
 @app.get("/")
@@ -362,12 +1236,17 @@ async def root():
         "endpoints": {
             "public": {
                 "/": "GET - API information (this endpoint)",
-                "/health": "GET - Health check endpoint",
+                "/health": "GET - Health check endpoint (liveness, startup stage and timings)",
+                "/ready": "GET - Readiness check (503 until the QA system is ready)",
+                "/metrics": "GET - Prometheus metrics (stage latencies, tokens, caches, jobs)",
                 "/docs": "GET - Interactive API documentation"
             },
             "protected": {
                 "/analyze-schemas/": "POST - Analyze schemas and generate personalized reports (requires API key)",
-                "/chat-with-results/": "POST - Chat about specific schemas and ask follow-up questions (requires API key)"
+                "/chat-with-results/": "POST - Chat about specific schemas and ask follow-up questions (requires API key)",
+                "/analyze-schemas/stream": "POST - Stream the analysis as Server-Sent Events (requires API key)",
+                "/chat-with-results/stream": "POST - Stream the chat answer as Server-Sent Events (requires API key)",
+                "/admin/reload": "POST - Rebuild or reload the index while the current one keeps serving (requires API key)"
             }
         },
         "security": {
@@ -378,14 +1257,69 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    """Health check endpoint."""
+    """
+    Health check endpoint.
+    Always answers while the process is alive; `startup` reports the readiness
+    stage (loading, indexing n/m files, ready) with timings.
+    """
     global qa_chain
     return {
         "status": "healthy" if qa_chain is not None else "unhealthy",
         "qa_chain_ready": qa_chain is not None,
-        "vector_db_exists": os.path.exists(VECTOR_DB_PATH)
+        "startup": readiness.snapshot(),
+        "vector_db_exists": index_path is not None and os.path.exists(index_path),
+        "index_path": index_path,
+        "requests_in_flight": request_limiter.active,
+        "requests_queued": request_limiter.waiting,
+        "single_flight": analysis_flights.stats(),
+        "jobs": job_queue.stats() if job_queue is not None else None,
+        "index_version": index_version,
+        "reload": reload_status,
+        "response_cache": response_cache.stats(),
+        "query_embedding_cache": query_embeddings.stats() if query_embeddings is not None else None,
+        "llm_latency": deadline_llm.stats() if deadline_llm is not None else None,
+        "chat_sessions": chat_sessions.stats(),
+        "schema_index": schema_index.stats() if schema_index is not None else None,
+        "context_packing": context_packer.stats() if context_packer is not None else None
     }
 
+@app.get("/ready")
+async def readiness_check():
+    """
+    Readiness endpoint for orchestrators.
+    Returns 200 once the QA chain is ready, 503 while starting up or after a failed startup.
+    """
+    snapshot = readiness.snapshot()
+    if not readiness.ready:
+        return JSONResponse(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, content=snapshot)
+    return snapshot
+
+@app.post("/admin/reload", status_code=status.HTTP_202_ACCEPTED)
+async def trigger_reload(api_key: str = Depends(verify_api_key)):
+    """
+    Rebuild the index from the source folder (or load the newly published
+    snapshot) in the background. The current index keeps serving until the new
+    one is swapped in; progress is reported by `/health` under `reload`.
+    """
+    global reload_task
+
+    if not readiness.ready:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"QA system not ready (stage: {readiness.stage}). Please retry shortly or check server logs."
+        )
+    if reload_lock.locked() or (reload_task is not None and not reload_task.done()):
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="An index reload is already running.")
+
+    reload_task = asyncio.create_task(reload_index("admin request"))
+    return {"status": "reloading", "index_version": index_version}
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus scrape endpoint."""
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
 @app.post("/analyze-schemas/", response_model=SchemaAnalysisResponse)
 async def analyze_schemas(request: SchemaAnalysisRequest, api_key: str = Depends(verify_api_key)):
     """
@@ -402,7 +1336,7 @@ async def analyze_schemas(request: SchemaAnalysisRequest, api_key: str = Depends
     if qa_chain is None:
         raise HTTPException(
             status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-            detail="QA system not initialized. Please check server logs."
+            detail=f"QA system not ready (stage: {readiness.stage}). Please retry shortly or check server logs."
         )
 
     if not request.schemas:
@@ -411,55 +1345,132 @@ async def analyze_schemas(request: SchemaAnalysisRequest, api_key: str = Depends
             detail="No schemas provided for analysis."
         )
 
+    if request.session_id:
+        start_chat_session(request.session_id, request.schemas)
+
     try:
-        # Create schema list string for the prompt
-        schema_list_str = ", ".join(request.schemas)
+        analysis_text = await generate_analysis(request.schemas, request.mode or ANALYSIS_MODE)
 
-        # Create the analysis prompt with your specified format
-        prompt = f"""
-ROLE: You are an expert Schema Therapy assistant. Your tone must be supportive, educational, and non-judgmental. You MUST base your entire analysis strictly on the context provided from the user's uploaded documents. Never use external knowledge. Do not act as a therapist or provide a clinical diagnosis.
+        logger.info("Schema analysis completed successfully")
 
-CONTEXT: [Your system will automatically place the relevant text snippets from the user's documents here based on the schemas below. You don't need to write anything here.]
+        return SchemaAnalysisResponse(
+            analysis=analysis_text,
+            schemas_analyzed=request.schemas
+        )
 
-USER DATA: A user has completed a questionnaire, and their most dominant schemas have been identified as: **{schema_list_str}**.
+    except ServerOverloadedError as e:
+        raise overloaded_exception(e)
 
-TASK: Based ONLY on the provided CONTEXT, generate a personalized and structured educational report for the user. Structure your response using Markdown for clear formatting. For each schema listed in the USER DATA, create a dedicated section. Follow this exact format for each schema:
+    except GenerationTimeoutError as e:
+        raise deadline_exception(e)
 
-## ▶️ {{Schema Name}}: General Overview
-(Provide a detailed definition and core concept of this schema based on the provided texts.)
+    except Exception as e:
+        logger.error(f"Error during schema analysis: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error during analysis: {str(e)}"
+        )
 
-### Potential Effects on Your Life
-(Based on the texts, explain how this schema might manifest in the user's daily life, thoughts, feelings, and relationships.)
+@app.post("/analyze-schemas/batch", response_model=BatchAnalysisResponse)
+async def analyze_schemas_batch(request: BatchAnalysisRequest, api_key: str = Depends(verify_api_key)):
+    """
+    Analyze many schema sets in one call.
 
-### Next Steps (According to the Sources)
-(Summarize the suggestions, strategies, or steps for change related to this schema that are mentioned in the source documents. Always frame this as educational information from the texts, not as direct advice.)
+    Identical schema sets (ignoring order, case and whitespace) are generated
+    once. Results are returned in request order; a set that fails carries an
+    `error` instead of an `analysis`.
 
----
-(If there is more than one schema, repeat the above structure for the next schema.)
+    Args:
+        request: BatchAnalysisRequest containing the schema sets to analyze
 
-If you cannot find sufficient information for any of the requested schemas in the provided CONTEXT, you must clearly state: "Sağlanan dokümanlarda '{{Schema Name}}' hakkında detaylı bilgi bulunamadı."
-"""
+    Returns:
+        BatchAnalysisResponse with one result per schema set
+    """
+    validate_batch(request)
 
-        logger.info(f"Analyzing schemas: {schema_list_str}")
+    results = []
+    unique_sets = 0
+    async for group_results in iter_batch_results(request):
+        results.extend(group_results)
+        unique_sets += 1
 
-        # Get AI response
-        result = qa_chain.invoke(prompt)
-        analysis_text = result['result']
+    results.sort(key=lambda result: result.index)
+    logger.info(f"Batch analysis completed: {len(results)} results, {unique_sets} unique sets")
+    return BatchAnalysisResponse(results=results, unique_sets=unique_sets)
 
-        logger.info("Schema analysis completed successfully")
+@app.post("/jobs/analyze-schemas", response_model=JobResponse, status_code=status.HTTP_202_ACCEPTED)
+async def submit_analysis_job(request: AnalysisJobRequest, api_key: str = Depends(verify_api_key)):
+    """
+    Submit a schema analysis as a background job and return its job ID immediately.
 
-        return SchemaAnalysisResponse(
-            analysis=analysis_text,
-            schemas_analyzed=request.schemas
+    Poll `/jobs/{job_id}` for the result, or pass `webhook_url` to receive the
+    finished job as a JSON POST. Submitting the same schema set again while its
+    job is queued, running or retained returns the existing job.
+
+    Args:
+        request: AnalysisJobRequest with the schemas, mode, priority and optional webhook
+
+    Returns:
+        JobResponse describing the queued (or existing) job
+    """
+    # The job's identity depends on the index version, which is only known once ready
+    if qa_chain is None:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"QA system not ready (stage: {readiness.stage}). Please retry shortly or check server logs."
         )
 
-    except Exception as e:
-        logger.error(f"Error during schema analysis: {str(e)}")
+    if not request.schemas:
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Error during analysis: {str(e)}"
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="No schemas provided for analysis."
         )
 
+    if request.webhook_url:
+        try:
+            await asyncio.to_thread(validate_webhook_url, request.webhook_url, JOB_WEBHOOK_ALLOWED_HOSTS)
+        except WebhookURLError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    mode = request.mode or ANALYSIS_MODE
+    prompt_version = SECTION_PROMPT_VERSION if mode == "per_schema" else ANALYSIS_PROMPT_VERSION
+    dedupe_key = make_cache_key("analysis-job", mode, normalize_schemas(request.schemas), prompt_version, index_version)
+    job, created = await asyncio.to_thread(
+        job_queue.submit,
+        {"schemas": request.schemas, "mode": mode},
+        dedupe_key=dedupe_key,
+        priority=request.priority,
+        webhook_url=request.webhook_url,
+    )
+
+    if created:
+        logger.info(f"Queued analysis job {job['id']} for schemas: {', '.join(request.schemas)}")
+        if job_workers is not None:
+            job_workers.notify()
+    else:
+        logger.info(f"Duplicate submission, returning existing job {job['id']}")
+
+    return job_response(job, duplicate=not created)
+
+@app.get("/jobs/{job_id}", response_model=JobResponse)
+async def get_analysis_job(job_id: str, api_key: str = Depends(verify_api_key)):
+    """
+    Return the status of an analysis job, with the result once it has succeeded.
+
+    Args:
+        job_id: ID returned when the job was submitted
+
+    Returns:
+        JobResponse with the current status
+    """
+    job = await asyncio.to_thread(job_queue.get, job_id)
+    if job is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Job not found. It may have expired after the retention period."
+        )
+    return job_response(job)
+
 @app.post("/chat-with-results/", response_model=ChatResponse)
 async def chat_with_results(request: ChatRequest, api_key: str = Depends(verify_api_key)):
     """
@@ -476,7 +1487,7 @@ async def chat_with_results(request: ChatRequest, api_key: str = Depends(verify_
     if qa_chain is None:
         raise HTTPException(
             status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-            detail="QA system not initialized. Please check server logs."
+            detail=f"QA system not ready (stage: {readiness.stage}). Please retry shortly or check server logs."
         )
 
     if not request.schemas:
@@ -494,50 +1505,149 @@ async def chat_with_results(request: ChatRequest, api_key: str = Depends(verify_
     try:
         # Create contextual search query combining schemas and question
         schemas_str = ", ".join(request.schemas)
-        contextual_query = f"Regarding the schemas '{schemas_str}', the user asks: {request.question}"
+        contextual_query = build_contextual_query(request.schemas, request.question)
 
         logger.info(f"Processing chat request about schemas: {schemas_str}")
         logger.info(f"User question: {request.question}")
 
         # Create detailed prompt for contextual chat
-        chat_prompt = f"""
-You are an expert Schema Therapy assistant providing contextual support and education. Your tone must be supportive, educational, and non-judgmental. You MUST base your entire response strictly on the context provided from the user's uploaded documents. Never use external knowledge.
+        chat_prompt = CHAT_PROMPT_TEMPLATE.format(schemas=schemas_str, question=request.question)
 
-CONTEXT: [Your system will automatically place the relevant text snippets from the user's documents here based on the contextual query below. You don't need to write anything here.]
+        # Retrieve with the contextual query (or reuse the session context);
+        # the chat instructions go to the LLM alone
+        documents = await chat_context(request.session_id, request.schemas, request.question, contextual_query)
+        async with request_limiter.slot():
+            answer_text = await qa_chain.arun(contextual_query, chat_prompt, documents=documents)
 
-USER CONTEXT: The user has been identified with these dominant schemas: **{schemas_str}**.
+        logger.info("Chat response generated successfully")
 
-USER QUESTION: "{request.question}"
+        return ChatResponse(
+            answer=answer_text,
+            schemas_context=request.schemas,
+            question=request.question,
+            session_id=request.session_id
+        )
 
-CONTEXTUAL QUERY FOR RETRIEVAL: {contextual_query}
+    except ServerOverloadedError as e:
+        raise overloaded_exception(e)
 
-TASK: Based ONLY on the provided CONTEXT, provide a helpful, personalized response that:
+    except GenerationTimeoutError as e:
+        raise deadline_exception(e)
 
-1. **Directly addresses the user's specific question** in relation to their identified schemas
-2. **Provides educational information** from the source documents that relates to both their schemas and their question
-3. **Maintains a supportive, non-judgmental tone** throughout the response
-4. **Explains concepts clearly** using language that is accessible and understandable
-5. **Connects the answer to their specific schema context** when relevant
-6. **Avoids providing clinical diagnoses or therapeutic advice** - focus on educational information only
-7. **If the source material doesn't contain enough information** to answer the question, clearly state this limitation
+    except Exception as e:
+        logger.error(f"Error during chat processing: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error during chat processing: {str(e)}"
+        )
 
-Structure your response in a conversational yet informative way. Use the retrieved context to provide accurate, source-based information while keeping the user's specific schemas in mind.
+@app.post("/analyze-schemas/stream")
+async def analyze_schemas_stream(request: SchemaAnalysisRequest, api_key: str = Depends(verify_api_key)):
+    """
+    Analyze schemas and stream the report as Server-Sent Events.
 
-If you cannot find sufficient information in the provided CONTEXT to answer the question, you must clearly state: "Sağlanan dokümanlarda bu sorunuza yeterli bilgi bulunamadı, ancak mevcut bilgiler ışığında şunları söyleyebilirim..."
-"""
+    Emits `token` events with `{"text": ...}` as the model generates, then a
+    `done` event with the analyzed schemas, or an `error` event. Cached
+    analyses are replayed immediately through the same events.
 
-        # Get AI response using the contextual prompt
-        result = qa_chain.invoke(chat_prompt)
-        answer_text = result['result']
+    Args:
+        request: SchemaAnalysisRequest containing list of schemas to analyze
 
-        logger.info("Chat response generated successfully")
+    Returns:
+        A text/event-stream response
+    """
+    global qa_chain
 
-        return ChatResponse(
-            answer=answer_text,
-            schemas_context=request.schemas,
-            question=request.question
+    if qa_chain is None:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"QA system not ready (stage: {readiness.stage}). Please retry shortly or check server logs."
         )
 
+    if not request.schemas:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="No schemas provided for analysis."
+        )
+
+    if request.session_id:
+        start_chat_session(request.session_id, request.schemas)
+
+    mode = request.mode or ANALYSIS_MODE
+    if mode == "per_schema":
+        stream = stream_per_schema_analysis(request.schemas)
+    else:
+        schema_list_str = ", ".join(request.schemas)
+        logger.info(f"Streaming analysis of schemas: {schema_list_str}")
+        stream = stream_answer(
+            schema_list_str,
+            ANALYSIS_PROMPT_TEMPLATE.format(schema_list=schema_list_str),
+            analysis_cache_key(request.schemas),
+            schema_context(request.schemas),
+        )
+
+    try:
+        first_chunk = await open_stream(stream)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error during schema analysis: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error during analysis: {str(e)}"
+        )
+
+    return sse_response(sse_events(first_chunk, stream, {"schemas_analyzed": request.schemas}))
+
+@app.post("/chat-with-results/stream")
+async def chat_with_results_stream(request: ChatRequest, api_key: str = Depends(verify_api_key)):
+    """
+    Chat about specific schemas and stream the answer as Server-Sent Events.
+
+    Emits `token` events with `{"text": ...}` as the model generates, then a
+    `done` event with the schemas and question, or an `error` event.
+
+    Args:
+        request: ChatRequest containing user's schemas and follow-up question
+
+    Returns:
+        A text/event-stream response
+    """
+    global qa_chain
+
+    if qa_chain is None:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"QA system not ready (stage: {readiness.stage}). Please retry shortly or check server logs."
+        )
+
+    if not request.schemas:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="No schemas provided for context."
+        )
+
+    if not request.question.strip():
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="No question provided."
+        )
+
+    schemas_str = ", ".join(request.schemas)
+    contextual_query = build_contextual_query(request.schemas, request.question)
+    logger.info(f"Streaming chat response about schemas: {schemas_str}")
+
+    try:
+        stream = stream_answer(
+            contextual_query,
+            CHAT_PROMPT_TEMPLATE.format(schemas=schemas_str, question=request.question),
+            documents=await chat_context(request.session_id, request.schemas, request.question, contextual_query),
+        )
+        first_chunk = await open_stream(stream)
+    except HTTPException:
+        raise
+    except ServerOverloadedError as e:
+        raise overloaded_exception(e)
     except Exception as e:
         logger.error(f"Error during chat processing: {str(e)}")
         raise HTTPException(
@@ -545,6 +1655,92 @@ If you cannot find sufficient information in the provided CONTEXT to answer the
             detail=f"Error during chat processing: {str(e)}"
         )
 
+    done_data = {"schemas_context": request.schemas, "question": request.question, "session_id": request.session_id}
+    return sse_response(sse_events(first_chunk, stream, done_data))
+
+@app.post("/analyze-schemas/batch/stream")
+async def analyze_schemas_batch_stream(request: BatchAnalysisRequest, api_key: str = Depends(verify_api_key)):
+    """
+    Analyze many schema sets and stream each result as soon as it completes.
+
+    Emits one `result` event per schema set, in completion order, with the same
+    fields as a BatchAnalysisResult, then a `done` event with the totals.
+
+    Args:
+        request: BatchAnalysisRequest containing the schema sets to analyze
+
+    Returns:
+        A text/event-stream response
+    """
+    validate_batch(request)
+
+    async def events() -> AsyncIterator[str]:
+        unique_sets = 0
+        async for group_results in iter_batch_results(request):
+            unique_sets += 1
+            for result in group_results:
+                yield format_sse("result", jsonable_encoder(result))
+        yield format_sse("done", {"results": len(request.schema_sets), "unique_sets": unique_sets})
+
+    return sse_response(events())
+
+# Production serving
+def preload_index() -> bool:
+    """
+    Build (if enabled) and check the index snapshot once, before the workers start.
+
+    Workers then only load the published snapshot instead of racing to build
+    it. Missing derived indexes are created here rather than by every worker,
+    and with the NumPy backend the matrix is read into the OS page cache, where
+    the read-only memory maps of all workers share its pages.
+    """
+    if not setup_environment():
+        return False
+
+    snapshot_path = asyncio.run(resolve_index_snapshot(INDEX_KEEP_SNAPSHOTS))
+    if snapshot_path is None:
+        logger.error(f"No index snapshot could be built or found in '{INDEX_SNAPSHOT_DIR}'.")
+        return False
+
+    from ingestion import get_index_version
+    version = get_index_version(snapshot_path)
+    if setup_qa_chain(snapshot_path, version) is None:
+        return False
+
+    if VECTOR_INDEX_BACKEND == "numpy":
+        from vector_index import load_numpy_index
+        load_numpy_index(snapshot_path, version, dtype=VECTOR_INDEX_DTYPE).warm()
+    elif WEB_WORKERS > 1:
+        logger.warning(
+            "Every worker keeps its own copy of the Chroma index in memory; "
+            "set VECTOR_INDEX_BACKEND=numpy to share one memory-mapped copy."
+        )
+    logger.info(f"Preloaded index snapshot '{snapshot_path}' for {WEB_WORKERS} workers")
+    return True
+
+def run_production_server(port: int):
+    """Serve with WEB_WORKERS processes and no reloader."""
+    import uvicorn
+
+    if not preload_index():
+        sys.exit(1)
+
+    # Workers load the snapshot published above; with INDEX_WATCH_INTERVAL_SECONDS
+    # they pick up snapshots published later by `python -m ingestion build-index`
+    os.environ["INDEX_BUILD_ON_STARTUP"] = "false"
+    clear_multiprocess_dir()
+
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=port,
+        workers=WEB_WORKERS,
+        reload=False,
+        timeout_keep_alive=WEB_KEEPALIVE_SECONDS,
+        limit_concurrency=WEB_LIMIT_CONCURRENCY or None,
+        backlog=WEB_BACKLOG,
+    )
+
 # Run the application
 if __name__ == "__main__":
     print("🚀 Starting API Server...")
@@ -557,4 +1753,8 @@ if __name__ == "__main__":
 
     # Run the Uvicorn server.
     # Host '0.0.0.0' is necessary for the service to be accessible from outside its container.
-    uvicorn.run("main:app", host="0.0.0.0", port=port, reload=True)
+    if SERVER_MODE == "production":
+        run_production_server(port)
+    else:
+        # Development: one process that restarts when the code changes
+        uvicorn.run("main:app", host="0.0.0.0", port=port, reload=True)
@@ -0,0 +1,238 @@
+"""
+Prometheus metrics and per-request stage tracing.
+
+Every stage of the QA pipeline (query embedding, retrieval, context packing,
+prompt assembly, generation) is timed with `trace_stage`. Each measurement is
+recorded in a Prometheus histogram and, while a request is being traced, in
+that request's `RequestTrace`. Requests slower than a threshold can be logged
+with their full stage breakdown.
+
+Counters that other components already keep (response cache, query embedding
+cache, schema index, context packing, job queue) are exported at scrape time
+by a `StatsCollector` instead of being counted twice.
+
+Ingestion reports processed files, embedded chunks, embedding batch latency
+and the throughput of the last run.
+
+With several server processes, set `PROMETHEUS_MULTIPROC_DIR`: every process
+then writes its metrics to files in that directory and `/metrics` aggregates
+them, so a scrape covers all workers. Component counters are reported by the
+process that answers the scrape, labelled with its `pid`.
+"""
+
+import contextvars
+import glob
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess,
+)
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+logger = logging.getLogger(__name__)
+
+MULTIPROCESS_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")  # Set for multi-worker servers
+if MULTIPROCESS_DIR:
+    # Metric files are created as soon as the metrics below are defined
+    os.makedirs(MULTIPROCESS_DIR, exist_ok=True)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+
+STAGE_DURATION = Histogram(
+    "rag_stage_duration_seconds", "Duration of QA pipeline stages", ["stage"], buckets=LATENCY_BUCKETS
+)
+REQUEST_DURATION = Histogram(
+    "rag_request_duration_seconds", "Duration of traced API requests", ["endpoint", "status"], buckets=LATENCY_BUCKETS
+)
+TIME_TO_FIRST_TOKEN = Histogram(
+    "rag_time_to_first_token_seconds", "Time from generation start to the first streamed token", buckets=LATENCY_BUCKETS
+)
+RETRIEVED_CHUNKS = Histogram(
+    "rag_retrieved_chunks", "Chunks placed into the prompt per generation", buckets=(0, 1, 2, 3, 4, 5, 6, 8, 10, 15, 20)
+)
+PROMPT_TOKENS = Counter("rag_prompt_tokens_total", "Prompt tokens sent to the LLM")
+COMPLETION_TOKENS = Counter("rag_completion_tokens_total", "Completion tokens generated by the LLM")
+SLOW_REQUESTS = Counter("rag_slow_requests_total", "Requests slower than the slow-request threshold", ["endpoint"])
+GENERATION_PATH = Counter(
+    "rag_generation_path_total", "Generations by the path that served them (primary, hedge or fallback)", ["path"]
+)
+LLM_TIMEOUTS = Counter("rag_llm_timeouts_total", "LLM calls cut off by the attempt timeout or deadline", ["model"])
+
+INGESTION_FILES = Counter("ingestion_files_total", "Documents extracted and indexed")
+INGESTION_CHUNKS = Counter("ingestion_chunks_total", "Chunks embedded and stored")
+EMBEDDING_BATCH_DURATION = Histogram(
+    "ingestion_embedding_batch_seconds", "Duration of one embedding batch request, including retries",
+    buckets=LATENCY_BUCKETS,
+)
+EMBEDDING_BATCH_ERRORS = Counter("ingestion_embedding_batch_errors_total", "Failed embedding batch attempts")
+INGESTION_FILES_PER_SECOND = Gauge("ingestion_files_per_second", "Document throughput of the last index sync")
+INGESTION_CHUNKS_PER_SECOND = Gauge("ingestion_chunks_per_second", "Chunk throughput of the last index sync")
+
+class RequestTrace:
+    """
+    Stage timings and counts of one request.
+
+    Stages that run concurrently (e.g. per-schema sections) add up, so the
+    stage total can exceed the wall-clock duration.
+    """
+
+    def __init__(self, endpoint: str):
+        self.endpoint = endpoint
+        self.started_at = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+        self.counts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def add_stage(self, stage: str, seconds: float):
+        with self._lock:
+            self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def add_count(self, name: str, value: int = 1):
+        with self._lock:
+            self.counts[name] = self.counts.get(name, 0) + value
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started_at
+
+    def breakdown(self) -> dict:
+        """Return the stage durations in milliseconds and the counts."""
+        with self._lock:
+            return {
+                "endpoint": self.endpoint,
+                "total_ms": round(self.elapsed() * 1000, 1),
+                "stages_ms": {stage: round(seconds * 1000, 1) for stage, seconds in self.stages.items()},
+                **self.counts,
+            }
+
+_current_trace: contextvars.ContextVar[Optional[RequestTrace]] = contextvars.ContextVar("request_trace", default=None)
+
+def current_trace() -> Optional[RequestTrace]:
+    """Return the trace of the request being handled, if any."""
+    return _current_trace.get()
+
+def start_trace(endpoint: str) -> Tuple[RequestTrace, contextvars.Token]:
+    """
+    Start tracing a request in the current context.
+
+    Tasks created from this context (including a streaming response body) keep
+    recording into the trace after `detach_trace` is called.
+    """
+    trace = RequestTrace(endpoint)
+    return trace, _current_trace.set(trace)
+
+def detach_trace(token: contextvars.Token):
+    """Stop recording into the trace started with `token` in the current context."""
+    _current_trace.reset(token)
+
+def finish_trace(trace: RequestTrace, status_code: int, slow_request_seconds: float = 0):
+    """Record the request duration and log the breakdown if the request was slow."""
+    elapsed = trace.elapsed()
+    REQUEST_DURATION.labels(endpoint=trace.endpoint, status=str(status_code)).observe(elapsed)
+    if slow_request_seconds > 0 and elapsed >= slow_request_seconds:
+        SLOW_REQUESTS.labels(endpoint=trace.endpoint).inc()
+        logger.warning(f"Slow request: {trace.breakdown()}")
+
+def record_stage(stage: str, seconds: float):
+    """Record a measured stage duration in the stage histogram and the current request trace."""
+    STAGE_DURATION.labels(stage=stage).observe(seconds)
+    trace = current_trace()
+    if trace is not None:
+        trace.add_stage(stage, seconds)
+
+@contextmanager
+def trace_stage(stage: str) -> Iterator[None]:
+    """Time a pipeline stage into the stage histogram and the current request trace."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - started)
+
+def record_count(name: str, value: int = 1):
+    """Add a count (e.g. cache hits) to the current request trace."""
+    trace = current_trace()
+    if trace is not None:
+        trace.add_count(name, value)
+
+def record_generation(chunks: int, prompt_tokens: int, completion_tokens: int):
+    """Record the context size and token usage of one LLM generation."""
+    RETRIEVED_CHUNKS.observe(chunks)
+    PROMPT_TOKENS.inc(prompt_tokens)
+    COMPLETION_TOKENS.inc(completion_tokens)
+    record_count("chunks", chunks)
+    record_count("prompt_tokens", prompt_tokens)
+    record_count("completion_tokens", completion_tokens)
+
+def record_generation_path(path: str):
+    """Record which path (primary, hedge or fallback) served a generation."""
+    GENERATION_PATH.labels(path=path).inc()
+    record_count(f"{path}_generations")
+
+def record_llm_timeout(model: str):
+    """Record an LLM call of the primary or fallback model that timed out."""
+    LLM_TIMEOUTS.labels(model=model).inc()
+    record_count(f"{model}_llm_timeouts")
+
+class StatsCollector:
+    """
+    Exports counters that components already keep as Prometheus metrics at scrape time.
+
+    Args:
+        collect_stats: Function returning `(name, documentation, type, labels, value)`
+            tuples, where type is "counter" or "gauge"
+    """
+
+    def __init__(self, collect_stats: Callable[[], List[tuple]]):
+        self.collect_stats = collect_stats
+
+    def collect(self):
+        families = {}
+        for name, documentation, metric_type, labels, value in self.collect_stats():
+            if MULTIPROCESS_DIR:
+                labels = {**labels, "pid": str(os.getpid())}
+            family = families.get(name)
+            if family is None:
+                family_class = CounterMetricFamily if metric_type == "counter" else GaugeMetricFamily
+                family = family_class(name, documentation, labels=list(labels))
+                families[name] = family
+            family.add_metric(list(labels.values()), value)
+        return list(families.values())
+
+_stats_collectors: Dict[str, StatsCollector] = {}
+
+def register_stats_collector(collect_stats: Callable[[], List[tuple]]) -> StatsCollector:
+    """
+    Register a StatsCollector with the default registry.
+
+    A collector registered under the same function name is replaced, since a
+    module can be executed twice in one process (as `__main__` or
+    `__mp_main__` and again when the server imports it).
+    """
+    previous = _stats_collectors.get(collect_stats.__name__)
+    if previous is not None:
+        REGISTRY.unregister(previous)
+    collector = StatsCollector(collect_stats)
+    REGISTRY.register(collector)
+    _stats_collectors[collect_stats.__name__] = collector
+    return collector
+
+def clear_multiprocess_dir():
+    """Remove the metric files of earlier runs. Call before the workers start."""
+    if MULTIPROCESS_DIR:
+        for path in glob.glob(os.path.join(MULTIPROCESS_DIR, "*.db")):
+            os.remove(path)
+
+def render_metrics() -> Tuple[bytes, str]:
+    """Return the Prometheus text exposition of all metrics and its content type."""
+    if not MULTIPROCESS_DIR:
+        return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    for collector in _stats_collectors.values():
+        registry.register(collector)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
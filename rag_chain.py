@@ -0,0 +1,181 @@
+"""
+Retrieval-augmented QA pipeline for the Schema Therapy RAG API.
+
+Retrieval and generation are separate steps. The retriever is searched with a
+short retrieval query (the schema names, or the schemas plus the user's
+question), and only the LLM sees the full instruction prompt together with the
+retrieved context. This keeps prompt boilerplate out of the similarity search
+and out of the embedding request. Between the two, an optional context packer
+merges overlapping chunks and trims the context to a token budget.
+
+The chain counts the calls running on it, so when the index is reloaded the
+replaced chain can be drained, closed and its snapshot removed.
+"""
+
+import asyncio
+import logging
+import time
+from typing import AsyncIterator, Callable, List, Optional
+
+from langchain_core.documents import Document
+from langchain_core.messages.ai import add_usage
+from langchain_core.prompts import ChatPromptTemplate
+
+from context_packing import estimate_tokens
+from metrics import TIME_TO_FIRST_TOKEN, record_generation, record_stage, trace_stage
+
+logger = logging.getLogger(__name__)
+
+# Same wording as LangChain's "stuff" QA chain prompt for chat models
+QA_SYSTEM_TEMPLATE = """Use the following pieces of context to answer the user's question.
+If you don't know the answer, just say that you don't know, don't try to make up an answer.
+----------------
+{context}"""
+
+QA_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", QA_SYSTEM_TEMPLATE),
+    ("human", "{question}"),
+])
+
+class SchemaQAChain:
+    """
+    Question-answering chain with separate retrieval query and LLM instructions.
+
+    Args:
+        retriever: Retriever used to find context chunks
+        llm: Chat model that generates the answer
+        prompt: Chat prompt with `context` and `question` variables
+        context_packer: Optional `ContextPacker` that merges, deduplicates and
+            budgets the chunks before they are placed into the prompt
+        on_close: Optional function that releases the retriever's resources,
+            e.g. the vector store client, once the chain is replaced
+    """
+
+    def __init__(self, retriever, llm, prompt: ChatPromptTemplate = QA_PROMPT, context_packer=None,
+                 on_close: Optional[Callable[[], None]] = None):
+        self.retriever = retriever
+        self.llm = llm
+        self.prompt = prompt
+        self.context_packer = context_packer
+        self.active = 0  # Calls currently running on this chain
+        self._on_close = on_close
+        self.closed = False
+
+    async def drain(self, timeout: float) -> bool:
+        """Wait until no call is running on this chain. Returns False on timeout."""
+        deadline = time.monotonic() + timeout
+        while self.active and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+        return not self.active
+
+    def close(self):
+        """Release the retriever's resources. Call only once no call is running (see `drain`)."""
+        if self.closed:
+            return
+        self.closed = True
+        if self._on_close is not None:
+            self._on_close()
+
+    async def aretrieve(self, query: str) -> List[Document]:
+        """Retrieve the context chunks for a retrieval query."""
+        self.active += 1
+        try:
+            with trace_stage("retrieval"):
+                return await self.retriever.ainvoke(query)
+        finally:
+            self.active -= 1
+
+    def build_messages(self, instructions: str, documents: List[Document]):
+        """Place the retrieved chunks and the instruction prompt into the chat prompt."""
+        with trace_stage("prompt_assembly"):
+            context = "\n\n".join(document.page_content for document in documents)
+            return self.prompt.format_messages(context=context, question=instructions)
+
+    def _record_usage(self, messages, documents: List[Document], usage: Optional[dict], completion: str):
+        """Record token usage as reported by the model, or estimated if it reports none."""
+        if usage:
+            prompt_tokens, completion_tokens = usage.get("input_tokens", 0), usage.get("output_tokens", 0)
+        else:
+            prompt_tokens = sum(estimate_tokens(str(message.content)) for message in messages)
+            completion_tokens = estimate_tokens(completion)
+        record_generation(len(documents), prompt_tokens, completion_tokens)
+
+    async def agenerate(self, instructions: str, documents: List[Document]) -> str:
+        """Generate an answer to the instructions from the given context chunks."""
+        messages = self.build_messages(instructions, documents)
+        with trace_stage("generation"):
+            message = await self.llm.ainvoke(messages)
+        self._record_usage(messages, documents, getattr(message, "usage_metadata", None), message.content)
+        return message.content
+
+    async def _context(self, retrieval_query: str, documents: Optional[List[Document]]) -> List[Document]:
+        if documents is not None:
+            logger.info(f"Using {len(documents)} precomputed chunks for query: {retrieval_query[:100]}")
+        else:
+            documents = await self.aretrieve(retrieval_query)
+            logger.info(f"Retrieved {len(documents)} chunks for query: {retrieval_query[:100]}")
+        if self.context_packer is not None:
+            with trace_stage("context_packing"):
+                documents = self.context_packer.pack(documents)
+        return documents
+
+    async def arun(self, retrieval_query: str, instructions: str,
+                   documents: Optional[List[Document]] = None) -> str:
+        """
+        Retrieve context for `retrieval_query`, then answer `instructions` from it.
+
+        Args:
+            retrieval_query: Short query used for the similarity search
+            instructions: Full instruction prompt, sent only to the LLM
+            documents: Precomputed context chunks; when given, retrieval is skipped
+
+        Returns:
+            The generated answer
+        """
+        self.active += 1
+        try:
+            documents = await self._context(retrieval_query, documents)
+            return await self.agenerate(instructions, documents)
+        finally:
+            self.active -= 1
+
+    async def astream(self, retrieval_query: str, instructions: str,
+                      documents: Optional[List[Document]] = None) -> AsyncIterator[str]:
+        """
+        Retrieve context for `retrieval_query` (unless `documents` are given),
+        then stream the answer to `instructions`.
+        Yields text chunks as the model produces them.
+        """
+        self.active += 1
+        try:
+            documents = await self._context(retrieval_query, documents)
+            messages = self.build_messages(instructions, documents)
+
+            # Generation time excludes time spent by the consumer between chunks
+            started = time.perf_counter()
+            generation_seconds = 0.0
+            first_token = True
+            usage = None
+            parts = []
+            stream = self.llm.astream(messages)
+            try:
+                while True:
+                    chunk_started = time.perf_counter()
+                    chunk = await anext(stream, None)
+                    generation_seconds += time.perf_counter() - chunk_started
+                    if chunk is None:
+                        break
+                    if getattr(chunk, "usage_metadata", None):
+                        usage = add_usage(usage, chunk.usage_metadata)
+                    if chunk.content:
+                        if first_token:
+                            TIME_TO_FIRST_TOKEN.observe(time.perf_counter() - started)
+                            first_token = False
+                        parts.append(chunk.content)
+                        yield chunk.content
+            finally:
+                await stream.aclose()
+                record_stage("generation", generation_seconds)
+                self._record_usage(messages, documents, usage, "".join(parts))
+        finally:
+            self.active -= 1
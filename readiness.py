@@ -0,0 +1,67 @@
+"""
+Startup readiness tracking for the Schema Therapy RAG API.
+
+The server accepts connections immediately and builds or loads the index in
+the background. This module records which startup stage is running, how far
+indexing has progressed and how long each stage took, so health checks can
+tell a live-but-warming-up server from a ready one.
+"""
+
+import threading
+import time
+from typing import Dict, Optional
+
+class ReadinessTracker:
+    """
+    Tracks startup stages: `starting` -> `loading` -> `indexing` -> `ready`,
+    or `failed` if initialization stops.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started_at = time.monotonic()
+        self.stage = "starting"
+        self.detail: Optional[str] = None
+        self.error: Optional[str] = None
+        self.timings: Dict[str, float] = {}
+        self._stage_started_at = self.started_at
+        self._ready_after: Optional[float] = None
+
+    @property
+    def ready(self) -> bool:
+        return self.stage == "ready"
+
+    def enter(self, stage: str, detail: Optional[str] = None):
+        """Finish the current stage, recording its duration, and start the next one."""
+        with self._lock:
+            now = time.monotonic()
+            self.timings[self.stage] = round(now - self._stage_started_at, 3)
+            self.stage = stage
+            self.detail = detail
+            self._stage_started_at = now
+            if stage == "ready":
+                self._ready_after = round(now - self.started_at, 3)
+
+    def progress(self, done: int, total: int):
+        """Report indexing progress. Called from the indexing thread."""
+        with self._lock:
+            self.detail = f"indexing {done}/{total} files"
+
+    def fail(self, error: str):
+        """Mark initialization as failed."""
+        self.enter("failed", detail=error)
+        self.error = error
+
+    def snapshot(self) -> dict:
+        """Return the current stage, progress and timings."""
+        with self._lock:
+            now = time.monotonic()
+            return {
+                "stage": self.stage,
+                "detail": self.detail,
+                "error": self.error,
+                "uptime_seconds": round(now - self.started_at, 3),
+                "stage_seconds": round(now - self._stage_started_at, 3),
+                "ready_after_seconds": self._ready_after,
+                "stage_timings": dict(self.timings),
+            }
@@ -0,0 +1,136 @@
+"""
+Response cache for generated analyses.
+
+Keeps recently generated responses in an in-memory LRU with a TTL and,
+optionally, in an SQLite database that survives restarts. Entries are tied to
+the index version they were generated from: when the vector store is rebuilt,
+entries for older versions stop matching and are purged.
+"""
+
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+def normalize_schemas(schemas: List[str]) -> List[str]:
+    """
+    Normalize a list of schema names for use in cache keys.
+    Whitespace is collapsed, case is folded, duplicates are dropped and the
+    result is sorted, so equivalent requests share one entry.
+    """
+    normalized = {" ".join(schema.split()).casefold() for schema in schemas}
+    return sorted(schema for schema in normalized if schema)
+
+def make_cache_key(*parts) -> str:
+    """Build a stable cache key from JSON-serializable parts."""
+    payload = json.dumps(parts, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class ResponseCache:
+    """
+    Two-tier response cache: in-memory LRU with TTL, plus an optional SQLite tier.
+
+    Args:
+        max_entries: Maximum number of entries kept in memory
+        ttl_seconds: Time after which an entry expires
+        sqlite_path: Path of the SQLite database for the persistent tier (None disables it)
+    """
+
+    def __init__(self, max_entries: int = 256, ttl_seconds: float = 86400, sqlite_path: Optional[str] = None):
+        self.max_entries = max(1, max_entries)
+        self.ttl_seconds = ttl_seconds
+        self.index_version: Optional[str] = None
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self._db: Optional[sqlite3.Connection] = None
+        if sqlite_path:
+            self._db = sqlite3.connect(sqlite_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, index_version TEXT, value TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            self._db.commit()
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached value for a key, or None if it is missing or expired."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, created_at = entry
+                if now - created_at < self.ttl_seconds:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT value, created_at FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None and now - row[1] < self.ttl_seconds:
+                    self._store_in_memory(key, row[0], row[1])
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return row[0]
+
+            self.misses += 1
+            return None
+
+    def set(self, key: str, value: str):
+        """Store a value under a key in both tiers."""
+        created_at = time.time()
+        with self._lock:
+            self._store_in_memory(key, value, created_at)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO responses (key, index_version, value, created_at) VALUES (?, ?, ?, ?)",
+                    (key, self.index_version, value, created_at),
+                )
+                self._db.commit()
+
+    def _store_in_memory(self, key: str, value: str, created_at: float):
+        self._entries[key] = (value, created_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def set_index_version(self, index_version: Optional[str]):
+        """
+        Switch the cache to a new index version.
+        Entries generated from any other version are dropped from both tiers.
+        """
+        with self._lock:
+            if index_version == self.index_version:
+                return
+            logger.info(f"Response cache invalidated for index version {index_version}")
+            self.index_version = index_version
+            self._entries.clear()
+            if self._db is not None:
+                self._db.execute(
+                    "DELETE FROM responses WHERE index_version IS NOT ? OR created_at < ?",
+                    (index_version, time.time() - self.ttl_seconds),
+                )
+                self._db.commit()
+
+    def stats(self) -> dict:
+        """Return hit/miss counters and the current number of in-memory entries."""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "entries": len(self._entries),
+            "index_version": self.index_version,
+        }
@@ -0,0 +1,221 @@
+"""
+Precomputed schema-to-chunk index.
+
+Analysis requests name schemas from a small, fixed vocabulary: Young's 18 early
+maladaptive schemas, in English or Turkish. Instead of embedding the schema
+names and searching the vector store on every request, each index build
+searches once per canonical schema and stores the top chunks in the snapshot
+(`schema_index.json`). At request time, schema strings are resolved through an
+alias table and their context is a dictionary lookup, with no embedding call.
+Strings that match no alias fall back to live retrieval.
+"""
+
+import json
+import logging
+import os
+import re
+import unicodedata
+from typing import Dict, List, Optional
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_INDEX_FILENAME = "schema_index.json"
+SCHEMA_INDEX_FORMAT_VERSION = 1
+SCHEMA_INDEX_TOP_N = 10  # Chunks stored per canonical schema
+
+# Canonical schema name -> (Turkish name, additional aliases).
+# Both full names are aliases too, as is every part of a "A/B" name.
+SCHEMAS = {
+    "Abandonment/Instability": ("Terk Edilme/İstikrarsızlık", ["Abandonment", "Terk Edilme", "Terk"]),
+    "Mistrust/Abuse": ("Güvensizlik/Kötüye Kullanılma", ["Mistrust", "Abuse", "Güvensizlik", "Kötüye Kullanılma"]),
+    "Emotional Deprivation": ("Duygusal Yoksunluk", ["Duygusal Yoksunluk Şeması"]),
+    "Defectiveness/Shame": ("Kusurluluk/Utanç", ["Defectiveness", "Shame", "Kusurluluk", "Utanç"]),
+    "Social Isolation/Alienation": (
+        "Sosyal İzolasyon/Yabancılaşma", ["Social Isolation", "Alienation", "Sosyal İzolasyon", "Yabancılaşma"]
+    ),
+    "Dependence/Incompetence": (
+        "Bağımlılık/Yetersizlik", ["Dependence", "Dependency", "Incompetence", "Bağımlılık", "Yetersizlik"]
+    ),
+    "Vulnerability to Harm or Illness": (
+        "Zarar Görebilirlik/Hastalıklara Karşı Dayanıksızlık",
+        ["Vulnerability", "Vulnerability to Harm and Illness", "Vulnerability to Harm",
+         "Zarar Görebilirlik", "Dayanıksızlık", "Tehditler Karşısında Dayanıksızlık"],
+    ),
+    "Enmeshment/Undeveloped Self": (
+        "İç İçe Geçme/Gelişmemiş Benlik", ["Enmeshment", "Undeveloped Self", "İç İçe Geçme", "Gelişmemiş Benlik"]
+    ),
+    "Failure": ("Başarısızlık", ["Failure to Achieve"]),
+    "Entitlement/Grandiosity": ("Haklılık/Büyüklenmecilik", ["Entitlement", "Grandiosity", "Haklılık", "Büyüklenmecilik"]),
+    "Insufficient Self-Control/Self-Discipline": (
+        "Yetersiz Özdenetim/Özdisiplin",
+        ["Insufficient Self-Control", "Insufficient Self-Discipline", "Yetersiz Özdenetim", "Yetersiz Öz Denetim"],
+    ),
+    "Subjugation": ("Boyun Eğicilik", ["Boyun Eğme"]),
+    "Self-Sacrifice": ("Kendini Feda", ["Self Sacrifice", "Fedakarlık", "Kendini Feda Etme"]),
+    "Approval-Seeking/Recognition-Seeking": (
+        "Onay Arayıcılık/Takdir Arayıcılık",
+        ["Approval-Seeking", "Recognition-Seeking", "Onay Arayıcılık", "Takdir Arayıcılık", "Onay Arama"],
+    ),
+    "Negativity/Pessimism": ("Olumsuzluk/Karamsarlık", ["Negativity", "Pessimism", "Olumsuzluk", "Karamsarlık"]),
+    "Emotional Inhibition": ("Duygusal Bastırılmışlık", ["Duyguları Bastırma", "Duygusal Ketlenme"]),
+    "Unrelenting Standards/Hypercriticalness": (
+        "Yüksek Standartlar/Aşırı Eleştiricilik",
+        ["Unrelenting Standards", "Hypercriticalness", "Yüksek Standartlar", "Aşırı Eleştiricilik"],
+    ),
+    "Punitiveness": ("Cezalandırıcılık", ["Punishment", "Cezalandırma"]),
+}
+
+def normalize_alias(name: str) -> str:
+    """
+    Normalize a schema string for alias lookup: case-folded, accents removed
+    (so Turkish and ASCII spellings match), punctuation treated as spaces.
+    """
+    decomposed = unicodedata.normalize("NFKD", name.casefold().replace("ı", "i"))
+    stripped = "".join(char for char in decomposed if not unicodedata.combining(char))
+    return " ".join(re.sub(r"[\W_]+", " ", stripped).split())
+
+def build_alias_table() -> Dict[str, str]:
+    """Map every normalized alias to its canonical schema name."""
+    aliases = {}
+    for canonical, (turkish, extra_aliases) in SCHEMAS.items():
+        names = [canonical, turkish, *canonical.split("/"), *turkish.split("/"), *extra_aliases]
+        for name in names:
+            aliases.setdefault(normalize_alias(name), canonical)
+    return aliases
+
+def schema_query(canonical: str) -> str:
+    """Retrieval query used to precompute the chunks of a canonical schema."""
+    return f"{canonical} ({SCHEMAS[canonical][0]})"
+
+def build_schema_index(db_path: str, embeddings: Embeddings, index_version: Optional[str],
+                       top_n: int = SCHEMA_INDEX_TOP_N) -> dict:
+    """
+    Search the index once per canonical schema and store the top chunks in the snapshot.
+
+    Args:
+        db_path: Path of the vector database snapshot
+        embeddings: Embedding backend used for the schema queries
+        index_version: Index version of the snapshot
+        top_n: Number of chunks stored per schema
+
+    Returns:
+        The schema index data that was written
+    """
+    from vector_index import load_numpy_index
+
+    vector_index = load_numpy_index(db_path, index_version)
+    canonical_names = list(SCHEMAS)
+    query_vectors = [embeddings.embed_query(schema_query(canonical)) for canonical in canonical_names]
+
+    chunks = {}
+    for canonical, query_vector in zip(canonical_names, query_vectors):
+        chunks[canonical] = [
+            {
+                "id": vector_index.ids[row],
+                "text": vector_index.texts[row],
+                "metadata": vector_index.metadatas[row],
+                "score": round(score, 6),
+            }
+            for row, score in vector_index.search(query_vector, top_n)
+        ]
+
+    data = {
+        "format_version": SCHEMA_INDEX_FORMAT_VERSION,
+        "index_version": index_version,
+        "top_n": top_n,
+        "aliases": build_alias_table(),
+        "chunks": chunks,
+    }
+    path = os.path.join(db_path, SCHEMA_INDEX_FILENAME)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as file:
+        json.dump(data, file, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+    logger.info(f"Precomputed top {top_n} chunks for {len(chunks)} schemas")
+    return data
+
+class SchemaIndex:
+    """
+    Alias table and precomputed context chunks of the canonical schemas.
+
+    Args:
+        aliases: Normalized alias -> canonical schema name
+        chunks: Canonical schema name -> stored chunks, best first
+    """
+
+    def __init__(self, aliases: Dict[str, str], chunks: Dict[str, List[dict]]):
+        self.aliases = aliases
+        self.documents = {
+            canonical: [
+                Document(page_content=chunk["text"], metadata=chunk["metadata"], id=chunk["id"])
+                for chunk in schema_chunks
+            ]
+            for canonical, schema_chunks in chunks.items()
+        }
+        self.hits = 0
+        self.fallbacks = 0
+
+    def resolve(self, schema: str) -> Optional[str]:
+        """Return the canonical name for a schema string, or None if it is unknown."""
+        canonical = self.aliases.get(normalize_alias(schema))
+        return canonical if canonical in self.documents else None
+
+    def lookup(self, schemas: List[str], k: int = 5) -> Optional[List[Document]]:
+        """
+        Return the context chunks for a set of schemas without any retrieval.
+
+        Chunks are taken round-robin from each schema's ranked list, skipping
+        duplicates, until `k` are collected. Returns None if any schema is
+        unknown, so the caller falls back to live retrieval.
+        """
+        canonical_names = []
+        for schema in schemas:
+            canonical = self.resolve(schema)
+            if canonical is None:
+                self.fallbacks += 1
+                logger.info(f"Schema '{schema}' is not in the schema index, using live retrieval")
+                return None
+            if canonical not in canonical_names:
+                canonical_names.append(canonical)
+        if not canonical_names:
+            self.fallbacks += 1
+            return None
+
+        documents = []
+        seen = set()
+        for rank in range(max(len(self.documents[canonical]) for canonical in canonical_names)):
+            for canonical in canonical_names:
+                ranked = self.documents[canonical]
+                if rank < len(ranked) and ranked[rank].id not in seen:
+                    seen.add(ranked[rank].id)
+                    documents.append(ranked[rank])
+                if len(documents) >= k:
+                    self.hits += 1
+                    return documents
+        self.hits += 1
+        return documents
+
+    def stats(self) -> dict:
+        """Return lookup counters."""
+        return {"schemas": len(self.documents), "hits": self.hits, "fallbacks": self.fallbacks}
+
+def load_schema_index(db_path: str, embeddings: Embeddings, index_version: Optional[str]) -> SchemaIndex:
+    """
+    Load the schema index of a snapshot, building it first if it is missing
+    or was built for a different index version.
+    """
+    path = os.path.join(db_path, SCHEMA_INDEX_FILENAME)
+    data = None
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as file:
+            data = json.load(file)
+
+    if data is None or data.get("format_version") != SCHEMA_INDEX_FORMAT_VERSION \
+            or data.get("index_version") != index_version:
+        logger.info(f"Schema index in '{db_path}' is missing or outdated, building...")
+        data = build_schema_index(db_path, embeddings, index_version)
+
+    return SchemaIndex(data["aliases"], data["chunks"])
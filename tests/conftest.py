@@ -0,0 +1,56 @@
+"""
+Shared pytest setup.
+
+The service modules live in the repository root rather than in a package, so
+the root is put on the import path. No test calls a remote model or service.
+"""
+
+import os
+import sys
+
+import pytest
+from langchain_core.embeddings import Embeddings
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from embedding_stage import HashingEmbeddings  # noqa: E402
+
+class CountingEmbeddings(Embeddings):
+    """
+    Hashing embeddings that count the texts they embed and can fail on a given
+    embedding request, like an API that starts rejecting calls mid-build.
+    """
+
+    def __init__(self, fail_on_call: int = 0):
+        self.embeddings = HashingEmbeddings(dimensions=64)
+        self.fail_on_call = fail_on_call
+        self.calls = 0
+        self.embedded = 0
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        if self.calls == self.fail_on_call:
+            raise ValueError("API key not valid")
+        self.embedded += len(texts)
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text):
+        return self.embeddings.embed_query(text)
+
+@pytest.fixture
+def write_document():
+    """Write a DOCX source document that splits into `chunks` chunks, one per paragraph."""
+    from docx import Document
+
+    def write(folder, name: str, chunks: int = 5, topic: str = None) -> str:
+        topic = topic or name.split(".")[0]
+        document = Document()
+        for paragraph in range(chunks):
+            # About 900 characters: too long for two paragraphs to share a chunk
+            words = [f"{topic}p{paragraph}w{word}" for word in range(100)]
+            document.add_paragraph(" ".join(words)[:900])
+        path = folder / name
+        document.save(str(path))
+        return str(path)
+
+    return write
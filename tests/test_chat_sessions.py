@@ -0,0 +1,91 @@
+"""Tests for reusing and refreshing the context of chat sessions."""
+
+import asyncio
+import os
+
+import pytest
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+os.environ.setdefault("GOOGLE_API_KEY", "test-key")
+os.environ.setdefault("MY_APP_SECRET_KEY", "test-secret")
+
+import main  # noqa: E402
+from chat_sessions import ChatSessionStore, named_schemas  # noqa: E402
+from concurrency import ConcurrencyLimiter  # noqa: E402
+from rag_chain import SchemaQAChain  # noqa: E402
+
+ABANDONMENT = [
+    Document(id="a1", page_content="Abandonment: fear that close relationships will end and partners will leave."),
+    Document(id="a2", page_content="People with abandonment fears cling to partners and read distance as rejection."),
+]
+FAILURE = [
+    Document(id="f1", page_content="Failure: belief of being inadequate at work, school and career compared to peers."),
+    Document(id="f2", page_content="People with this schema avoid challenges at work and expect their career to fail."),
+]
+
+class TopicRetriever(BaseRetriever):
+    """Retriever that returns the chunks of the schema named in the query and counts its calls."""
+
+    calls: list = []
+
+    def _get_relevant_documents(self, query, *, run_manager):
+        self.calls.append(query)
+        return list(FAILURE if "Failure" in query else ABANDONMENT)
+
+@pytest.fixture
+def session(monkeypatch):
+    retriever = TopicRetriever(calls=[])
+    monkeypatch.setattr(main, "qa_chain", SchemaQAChain(retriever=retriever, llm=None))
+    monkeypatch.setattr(main, "index_version", "v1")
+    monkeypatch.setattr(main, "chat_sessions", ChatSessionStore())
+    monkeypatch.setattr(main, "request_limiter", ConcurrencyLimiter(max_concurrent=2, max_queued=2, queue_timeout=1))
+    return retriever
+
+def chat_turn(schemas, question, session_id="s1"):
+    async def turn():
+        query = main.build_contextual_query(schemas, question)
+        return await main.chat_context(session_id, schemas, question, query)
+    return asyncio.run(turn())
+
+def test_follow_up_on_same_topic_reuses_session_context(session):
+    first = chat_turn(["Abandonment"], "Why do I fear my partner will leave?")
+    second = chat_turn(["Abandonment"], "How does this fear affect close relationships?")
+
+    assert len(session.calls) == 1
+    assert second is first
+    assert main.chat_sessions.stats()["refreshes"] == 0
+
+def test_follow_up_on_other_schema_retrieves_and_merges(session):
+    first = chat_turn(["Abandonment"], "Why do I fear my partner will leave?")
+    assert [document.id for document in first] == ["a1", "a2"]
+
+    second = chat_turn(["Abandonment"], "And what about Failure at work?")
+
+    assert len(session.calls) == 2
+    assert [document.id for document in second] == ["f1", "f2", "a1", "a2"]
+    assert main.chat_sessions.stats()["refreshes"] == 1
+
+    # The merged context now covers both topics, so a third turn reuses it
+    third = chat_turn(["Abandonment"], "Does failure at work make my partner leave?")
+    assert len(session.calls) == 2
+    assert third is second
+
+def test_follow_up_without_overlap_retrieves_again(session):
+    chat_turn(["Abandonment"], "Why do I fear my partner will leave?")
+    chat_turn(["Abandonment"], "Which breathing exercises calm panic attacks?")
+
+    assert len(session.calls) == 2
+
+def test_merge_drops_duplicates_and_caps_chunks():
+    store = ChatSessionStore(max_documents=3)
+    merged = store.merge([FAILURE[0], ABANDONMENT[0]], ABANDONMENT + FAILURE)
+
+    assert [document.id for document in merged] == ["f1", "a1", "a2"]
+
+def test_named_schemas_matches_english_and_turkish_aliases():
+    assert named_schemas("Is my fear of abandonment linked to shame?") == {
+        "Abandonment/Instability", "Defectiveness/Shame",
+    }
+    assert named_schemas("Kusurluluk şeması nasıl gelişir?") == {"Defectiveness/Shame"}
+    assert named_schemas("How can I sleep better?") == set()
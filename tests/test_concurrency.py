@@ -0,0 +1,153 @@
+"""Tests for request admission control and single-flight coalescing."""
+
+import asyncio
+
+import pytest
+
+from concurrency import ConcurrencyLimiter, ServerOverloadedError, SingleFlight
+
+def test_limiter_admits_up_to_max_concurrent():
+    async def scenario():
+        limiter = ConcurrencyLimiter(max_concurrent=2, max_queued=0, queue_timeout=1)
+        async with limiter.slot():
+            async with limiter.slot():
+                assert limiter.active == 2
+        assert limiter.active == 0
+
+    asyncio.run(scenario())
+
+def test_limiter_rejects_when_queue_is_full():
+    async def scenario():
+        limiter = ConcurrencyLimiter(max_concurrent=1, max_queued=1, queue_timeout=5)
+        release = asyncio.Event()
+
+        async def hold():
+            async with limiter.slot():
+                await release.wait()
+
+        holder = asyncio.ensure_future(hold())
+        waiter = asyncio.ensure_future(hold())
+        await asyncio.sleep(0.01)
+        assert limiter.active == 1
+        assert limiter.waiting == 1
+
+        with pytest.raises(ServerOverloadedError, match="at capacity"):
+            async with limiter.slot():
+                pass
+
+        release.set()
+        await asyncio.gather(holder, waiter)
+        assert limiter.active == 0
+        assert limiter.waiting == 0
+
+    asyncio.run(scenario())
+
+def test_limiter_rejects_after_queue_timeout():
+    async def scenario():
+        limiter = ConcurrencyLimiter(max_concurrent=1, max_queued=4, queue_timeout=0.05)
+        release = asyncio.Event()
+
+        async def hold():
+            async with limiter.slot():
+                await release.wait()
+
+        holder = asyncio.ensure_future(hold())
+        await asyncio.sleep(0.01)
+
+        with pytest.raises(ServerOverloadedError, match="within"):
+            async with limiter.slot():
+                pass
+        assert limiter.waiting == 0
+
+        release.set()
+        await holder
+        # The slot of the timed-out waiter was never taken, so it is free again
+        async with limiter.slot():
+            assert limiter.active == 1
+
+    asyncio.run(scenario())
+
+def test_limiter_releases_slot_when_block_raises():
+    async def scenario():
+        limiter = ConcurrencyLimiter(max_concurrent=1, max_queued=0, queue_timeout=1)
+        with pytest.raises(RuntimeError):
+            async with limiter.slot():
+                raise RuntimeError("generation failed")
+        assert limiter.active == 0
+        async with limiter.slot():
+            pass
+
+    asyncio.run(scenario())
+
+def test_single_flight_coalesces_concurrent_calls():
+    async def scenario():
+        flight = SingleFlight()
+        calls = 0
+
+        async def work():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.02)
+            return "answer"
+
+        results = await asyncio.gather(*(flight.run("key", work) for _ in range(5)))
+        assert results == ["answer"] * 5
+        assert calls == 1
+        assert flight.stats() == {"in_flight": 0, "coalesced": 4}
+
+    asyncio.run(scenario())
+
+def test_single_flight_propagates_error_to_every_caller():
+    async def scenario():
+        flight = SingleFlight()
+        calls = 0
+
+        async def work():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.02)
+            raise ValueError("generation failed")
+
+        results = await asyncio.gather(*(flight.run("key", work) for _ in range(3)), return_exceptions=True)
+        assert calls == 1
+        assert all(isinstance(result, ValueError) for result in results)
+        assert flight.in_flight == 0
+
+        # A failed call is not remembered: the next call runs the work again
+        with pytest.raises(ValueError):
+            await flight.run("key", work)
+        assert calls == 2
+
+    asyncio.run(scenario())
+
+def test_single_flight_caller_cancellation_does_not_cancel_shared_work():
+    async def scenario():
+        flight = SingleFlight()
+
+        async def work():
+            await asyncio.sleep(0.05)
+            return "answer"
+
+        first = asyncio.ensure_future(flight.run("key", work))
+        second = asyncio.ensure_future(flight.run("key", work))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        assert await second == "answer"
+        with pytest.raises(asyncio.CancelledError):
+            await first
+
+    asyncio.run(scenario())
+
+def test_single_flight_runs_distinct_keys_separately():
+    async def scenario():
+        flight = SingleFlight()
+
+        async def work(value):
+            await asyncio.sleep(0.01)
+            return value
+
+        results = await asyncio.gather(flight.run("a", lambda: work(1)), flight.run("b", lambda: work(2)))
+        assert results == [1, 2]
+        assert flight.coalesced == 0
+
+    asyncio.run(scenario())
@@ -0,0 +1,80 @@
+"""Tests for merging, deduplicating and budgeting retrieved chunks."""
+
+from langchain_core.documents import Document
+
+from context_packing import ContextPacker, estimate_tokens
+
+SOURCE_TEXT = " ".join(f"word{number}" for number in range(400))
+
+def chunk(start: int, end: int, source: str = "a.pdf", text: str = SOURCE_TEXT) -> Document:
+    """A chunk of `text` covering characters start..end, as the splitter produces it."""
+    return Document(page_content=text[start:end], metadata={"source": source, "start_index": start})
+
+def test_overlapping_chunks_are_merged_without_repeating_text():
+    packer = ContextPacker(max_tokens=0)
+    packed = packer.pack([chunk(100, 400), chunk(0, 200), chunk(300, 600)])
+
+    assert len(packed) == 1
+    assert packed[0].page_content == SOURCE_TEXT[0:600]
+    assert packed[0].metadata["merged_chunks"] == 3
+    assert packed[0].metadata["start_index"] == 0
+    assert packer.stats()["chunks_merged"] == 2
+
+def test_distant_chunks_and_other_files_stay_separate():
+    packer = ContextPacker(max_tokens=0, duplicate_threshold=1.0)
+    packed = packer.pack([chunk(0, 200), chunk(1000, 1200), chunk(0, 200, source="b.pdf")])
+    assert len(packed) == 3
+    assert all("merged_chunks" not in document.metadata for document in packed)
+
+def test_passages_keep_the_best_rank_of_their_chunks():
+    packer = ContextPacker(max_tokens=0)
+    packed = packer.pack([chunk(1000, 1200), chunk(200, 400), chunk(0, 250)])
+    assert [document.metadata["start_index"] for document in packed] == [1000, 0]
+
+def test_chunks_without_position_are_kept_as_is():
+    packer = ContextPacker(max_tokens=0)
+    loose = Document(page_content="A note without a source position", metadata={})
+    packed = packer.pack([loose, chunk(0, 200)])
+    assert packed[0].page_content == loose.page_content
+    assert len(packed) == 2
+
+def test_near_duplicate_of_better_ranked_passage_is_dropped():
+    packer = ContextPacker(max_tokens=0, duplicate_threshold=0.8)
+    copy = chunk(0, 800, source="copy.pdf")
+    packed = packer.pack([chunk(0, 1000), copy, chunk(2000, 2200)])
+
+    assert [document.metadata["source"] for document in packed] == ["a.pdf", "a.pdf"]
+    assert packer.stats()["duplicates_dropped"] == 1
+
+def test_duplicate_removal_can_be_disabled():
+    packer = ContextPacker(max_tokens=0, duplicate_threshold=1.0)
+    packed = packer.pack([chunk(0, 1000), chunk(0, 1000, source="copy.pdf")])
+    assert len(packed) == 2
+
+def test_budget_truncates_last_passage_at_word_boundary():
+    packer = ContextPacker(max_tokens=300, duplicate_threshold=1.0)
+    first = chunk(0, 800)
+    second = chunk(0, 1200, source="b.pdf")
+    packed = packer.pack([first, second])
+
+    assert packed[0].page_content == first.page_content
+    truncated = packed[1].page_content
+    assert SOURCE_TEXT.startswith(truncated)
+    assert SOURCE_TEXT[len(truncated)] == " "
+    assert sum(estimate_tokens(document.page_content) for document in packed) <= 300
+    assert packer.stats()["passages_truncated"] == 1
+
+def test_budget_drops_passages_too_small_to_truncate():
+    packer = ContextPacker(max_tokens=210, duplicate_threshold=1.0)
+    packed = packer.pack([chunk(0, 800), chunk(0, 1200, source="b.pdf"), chunk(0, 100, source="c.pdf")])
+    assert len(packed) == 1
+    assert packer.stats()["passages_truncated"] == 0
+
+def test_stats_report_tokens_saved():
+    packer = ContextPacker(max_tokens=0)
+    packer.pack([chunk(0, 400), chunk(200, 600)])
+    stats = packer.stats()
+    assert stats["requests"] == 1
+    assert stats["input_tokens"] == 200
+    assert stats["packed_tokens"] == 150
+    assert stats["tokens_saved"] == 50
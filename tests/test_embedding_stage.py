@@ -0,0 +1,79 @@
+"""Tests for batched embedding with retries of transient errors."""
+
+import pytest
+from langchain_core.embeddings import Embeddings
+
+from embedding_stage import EmbeddingStage, HashingEmbeddings, is_transient_error
+
+class APIError(Exception):
+    """Error carrying an HTTP status, like the Google API client's errors."""
+
+    def __init__(self, code: int, message: str = ""):
+        super().__init__(f"{code} {message}")
+        self.code = code
+
+class FlakyEmbeddings(Embeddings):
+    """Embeddings that raise the given errors on the first calls, then answer."""
+
+    def __init__(self, errors):
+        self.errors = list(errors)
+        self.calls = 0
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return HashingEmbeddings(dimensions=8).embed_documents(texts)
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+@pytest.mark.parametrize("error", [
+    TimeoutError("read timed out"),
+    ConnectionResetError("connection reset"),
+    APIError(429, "Too many requests"),
+    APIError(500),
+    APIError(503, "Service unavailable"),
+])
+def test_transient_errors_are_retried(error):
+    embeddings = FlakyEmbeddings([error, error])
+    stage = EmbeddingStage(embeddings, max_retries=3, base_delay=0.001)
+    assert len(stage.embed_batch(["a", "b"])) == 2
+    assert embeddings.calls == 3
+
+@pytest.mark.parametrize("error", [
+    ValueError("invalid input"),
+    APIError(400, "Invalid argument"),
+    APIError(401, "API key not valid"),
+    APIError(403, "Permission denied"),
+    APIError(429, "Quota exceeded for metric 'Requests per day'"),
+])
+def test_non_transient_errors_are_raised_immediately(error):
+    embeddings = FlakyEmbeddings([error])
+    stage = EmbeddingStage(embeddings, max_retries=3, base_delay=0.001)
+    with pytest.raises(type(error)):
+        stage.embed_batch(["a"])
+    assert embeddings.calls == 1
+
+def test_retries_stop_after_max_retries():
+    embeddings = FlakyEmbeddings([TimeoutError()] * 5)
+    stage = EmbeddingStage(embeddings, max_retries=2, base_delay=0.001)
+    with pytest.raises(TimeoutError):
+        stage.embed_batch(["a"])
+    assert embeddings.calls == 3
+
+def test_wrapped_errors_are_classified_by_their_cause():
+    try:
+        try:
+            raise APIError(503)
+        except APIError as cause:
+            raise RuntimeError("Error embedding content") from cause
+    except RuntimeError as wrapped:
+        assert is_transient_error(wrapped)
+    assert not is_transient_error(RuntimeError("Error embedding content"))
+
+def test_batches_are_yielded_with_their_keys():
+    stage = EmbeddingStage(HashingEmbeddings(dimensions=8), max_in_flight=2)
+    results = dict(stage.embed_batches([(number, [f"text {number}"] * 3) for number in range(5)]))
+    assert sorted(results) == list(range(5))
+    assert all(len(vectors) == 3 for vectors in results.values())
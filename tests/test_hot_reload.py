@@ -0,0 +1,147 @@
+"""Tests for swapping the served index while requests are running."""
+
+import asyncio
+import json
+import os
+
+import pytest
+from langchain_core.retrievers import BaseRetriever
+
+os.environ.setdefault("GOOGLE_API_KEY", "test-key")
+os.environ.setdefault("MY_APP_SECRET_KEY", "test-secret")
+
+import main  # noqa: E402
+from rag_chain import SchemaQAChain  # noqa: E402
+
+class SlowRetriever(BaseRetriever):
+    """Retriever that answers after `delay` seconds, so a request stays in flight."""
+
+    delay: float = 0.3
+
+    def _get_relevant_documents(self, query, *, run_manager):
+        return []
+
+    async def _aget_relevant_documents(self, query, *, run_manager):
+        await asyncio.sleep(self.delay)
+        return []
+
+class ClosableChain(SchemaQAChain):
+    """QA chain that records when its resources are released."""
+
+    def __init__(self, delay: float = 0.3):
+        super().__init__(retriever=SlowRetriever(delay=delay), llm=None, on_close=self._released)
+        self.released = False
+
+    def _released(self):
+        assert self.active == 0, "closed while a request was still running"
+        self.released = True
+
+def make_snapshot(tmp_path, version: str) -> str:
+    path = tmp_path / version
+    path.mkdir()
+    (path / "manifest.json").write_text(json.dumps({"index_version": version, "files": {}}), encoding="utf-8")
+    return str(path)
+
+@pytest.fixture
+def served(tmp_path, monkeypatch):
+    """Serve an old index snapshot and make the next reload pick up a new one."""
+    old_path, new_path = make_snapshot(tmp_path, "v1"), make_snapshot(tmp_path, "v2")
+    old_chain, new_chain = ClosableChain(), ClosableChain()
+
+    async def resolve_index_snapshot(keep, progress=None):
+        return new_path
+
+    monkeypatch.setattr(main, "resolve_index_snapshot", resolve_index_snapshot)
+    monkeypatch.setattr(main, "setup_qa_chain", lambda path, version: (new_chain, None))
+    monkeypatch.setattr(main, "INDEX_BUILD_ON_STARTUP", False)
+    for name in ("qa_chain", "schema_index", "index_path", "index_version"):
+        monkeypatch.setattr(main, name, getattr(main, name))
+    main.activate_index(old_path, "v1", old_chain, None)
+    return old_chain, new_chain
+
+def test_reload_swaps_chain_and_closes_old_one_after_drain(served, monkeypatch):
+    old_chain, new_chain = served
+    monkeypatch.setattr(main, "RELOAD_DRAIN_TIMEOUT_SECONDS", 5)
+
+    async def scenario():
+        monkeypatch.setattr(main, "reload_lock", asyncio.Lock())
+        request = asyncio.ensure_future(old_chain.aretrieve("Abandonment"))
+        await asyncio.sleep(0.05)
+        reload = asyncio.ensure_future(main.reload_index("test"))
+        await asyncio.sleep(0.05)
+
+        # New requests already go to the new chain while the old one drains
+        assert main.qa_chain is new_chain
+        assert main.index_version == "v2"
+        assert old_chain.active == 1
+        assert not old_chain.released
+
+        assert await request == []
+        assert await reload
+        return main.reload_status["state"]
+
+    assert asyncio.run(scenario()) == "succeeded"
+    assert old_chain.released
+    assert not new_chain.released
+
+def test_chain_outliving_the_drain_timeout_is_closed_when_it_finishes(served, monkeypatch):
+    old_chain, new_chain = served
+    monkeypatch.setattr(main, "RELOAD_DRAIN_TIMEOUT_SECONDS", 0.05)
+
+    async def scenario():
+        monkeypatch.setattr(main, "reload_lock", asyncio.Lock())
+        request = asyncio.ensure_future(old_chain.aretrieve("Abandonment"))
+        await asyncio.sleep(0.01)
+
+        assert await main.reload_index("test")
+        assert main.qa_chain is new_chain
+        assert not old_chain.released
+
+        await request
+        await asyncio.gather(*main.close_tasks)
+
+    asyncio.run(scenario())
+    assert old_chain.released
+    assert not main.close_tasks
+
+def test_reload_of_served_snapshot_keeps_chain(served, monkeypatch):
+    old_chain, _ = served
+    monkeypatch.setattr(main, "setup_qa_chain", lambda path, version: pytest.fail("set up an unchanged index"))
+
+    async def scenario():
+        monkeypatch.setattr(main, "reload_lock", asyncio.Lock())
+        monkeypatch.setattr(main, "index_path", await main.resolve_index_snapshot(2))
+        monkeypatch.setattr(main, "index_version", "v2")
+        return await main.reload_index("test")
+
+    assert not asyncio.run(scenario())
+    assert main.qa_chain is old_chain
+    assert not old_chain.released
+
+def test_failed_reload_keeps_serving_old_chain(served, monkeypatch):
+    old_chain, _ = served
+    monkeypatch.setattr(main, "setup_qa_chain", lambda path, version: None)
+
+    async def scenario():
+        monkeypatch.setattr(main, "reload_lock", asyncio.Lock())
+        return await main.reload_index("test")
+
+    assert not asyncio.run(scenario())
+    assert main.qa_chain is old_chain
+    assert main.index_version == "v1"
+    assert main.reload_status["state"] == "failed"
+    assert not old_chain.released
+
+def test_close_vectorstore_releases_chroma_client(tmp_path):
+    from langchain_chroma import Chroma
+    from embedding_stage import HashingEmbeddings
+
+    embeddings = HashingEmbeddings(dimensions=8)
+    vectorstore = Chroma(persist_directory=str(tmp_path), embedding_function=embeddings)
+    vectorstore.add_texts(["Terk edilme şeması"], ids=["c0"])
+
+    main.close_vectorstore(vectorstore)
+    with pytest.raises(Exception):
+        vectorstore._collection.count()
+    # The data stays on disk for the next client of the snapshot
+    assert Chroma(persist_directory=str(tmp_path), embedding_function=embeddings)._collection.count() == 1
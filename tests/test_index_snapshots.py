@@ -0,0 +1,75 @@
+"""Tests for building, resuming and publishing index snapshots."""
+
+import os
+
+from conftest import CountingEmbeddings
+from embedding_stage import EmbeddingStage
+from index_snapshots import BUILD_PREFIX, build_index_snapshot, get_current_snapshot
+from ingestion import load_manifest
+
+EMBEDDING_MODEL = "hashing-64"
+
+def build(source, snapshots, embeddings):
+    stage = EmbeddingStage(embeddings, batch_size=5, max_in_flight=1, max_retries=0)
+    return build_index_snapshot(str(source), str(snapshots), stage, EMBEDDING_MODEL)
+
+def build_directories(snapshots):
+    return [name for name in os.listdir(snapshots) if name.startswith(BUILD_PREFIX)]
+
+def document_chunks(snapshot_path) -> int:
+    return sum(len(entry["chunk_ids"]) for entry in load_manifest(snapshot_path)["files"].values())
+
+def test_build_publishes_snapshot(tmp_path, write_document):
+    source, snapshots = tmp_path / "docs", tmp_path / "snapshots"
+    source.mkdir()
+    write_document(source, "a.docx")
+
+    path = build(source, snapshots, CountingEmbeddings())
+    assert path == get_current_snapshot(str(snapshots))
+    assert os.path.basename(path) == load_manifest(path)["index_version"]
+    assert build_directories(snapshots) == []
+
+def test_first_build_does_not_rebuild_from_scratch(tmp_path, write_document, caplog):
+    source, snapshots = tmp_path / "docs", tmp_path / "snapshots"
+    source.mkdir()
+    write_document(source, "a.docx")
+
+    assert build(source, snapshots, CountingEmbeddings()) is not None
+    assert "no compatible manifest" not in caplog.text
+
+def test_failed_build_resumes_without_embedding_stored_chunks(tmp_path, write_document):
+    source, snapshots = tmp_path / "docs", tmp_path / "snapshots"
+    source.mkdir()
+    for number in range(4):
+        write_document(source, f"doc{number}.docx", chunks=6)
+
+    # Batches of 5 chunks: the fourth request fails after 15 chunks are stored
+    failing = CountingEmbeddings(fail_on_call=4)
+    assert build(source, snapshots, failing) is None
+    assert failing.embedded == 15
+    assert len(build_directories(snapshots)) == 1
+
+    retry = CountingEmbeddings()
+    path = build(source, snapshots, retry)
+    assert path is not None
+    assert document_chunks(path) == 24
+    assert retry.embedded == 24 - 15
+    assert build_directories(snapshots) == []
+
+def test_failed_incremental_build_resumes_on_top_of_published_snapshot(tmp_path, write_document):
+    source, snapshots = tmp_path / "docs", tmp_path / "snapshots"
+    source.mkdir()
+    write_document(source, "a.docx", chunks=6)
+    published = build(source, snapshots, CountingEmbeddings())
+
+    write_document(source, "b.docx", chunks=12)
+    failing = CountingEmbeddings(fail_on_call=3)
+    assert build(source, snapshots, failing) is None
+    assert failing.embedded == 10
+    assert get_current_snapshot(str(snapshots)) == published
+
+    retry = CountingEmbeddings()
+    path = build(source, snapshots, retry)
+    assert retry.embedded == 2
+    assert document_chunks(path) == 18
+    assert get_current_snapshot(str(snapshots)) == path
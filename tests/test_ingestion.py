@@ -0,0 +1,171 @@
+"""Tests for incremental synchronization of the vector database with the source folder."""
+
+import os
+
+import chromadb
+import pytest
+
+from conftest import CountingEmbeddings
+from embedding_stage import EmbeddingStage
+from ingestion import (
+    compute_index_version, load_manifest, new_manifest, plan_sync, save_manifest, sync_vector_database,
+)
+
+EMBEDDING_MODEL = "hashing-64"
+
+@pytest.fixture
+def source(tmp_path):
+    folder = tmp_path / "docs"
+    folder.mkdir()
+    return folder
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "db")
+
+def sync(source, db_path, embeddings) -> bool:
+    stage = EmbeddingStage(embeddings, batch_size=5, max_in_flight=1, max_retries=0)
+    return sync_vector_database(str(source), db_path, stage, EMBEDDING_MODEL)
+
+def stored_ids(db_path) -> set:
+    collection = chromadb.PersistentClient(path=db_path).get_collection("langchain")
+    return set(collection.get(include=[])["ids"])
+
+def manifest_ids(db_path) -> set:
+    return {chunk_id for entry in load_manifest(db_path)["files"].values() for chunk_id in entry["chunk_ids"]}
+
+def touch_later(path: str):
+    """Move a file's mtime forward, as an edit a moment later would."""
+    stat = os.stat(path)
+    os.utime(path, (stat.st_atime, stat.st_mtime + 10))
+
+def test_initial_sync_embeds_every_chunk(source, db_path, write_document):
+    write_document(source, "a.docx", chunks=3)
+    write_document(source, "b.docx", chunks=4)
+    embeddings = CountingEmbeddings()
+
+    assert sync(source, db_path, embeddings)
+    assert embeddings.embedded == 7
+    assert stored_ids(db_path) == manifest_ids(db_path)
+    manifest = load_manifest(db_path)
+    assert sorted(manifest["files"]) == ["a.docx", "b.docx"]
+    assert manifest["index_version"] == compute_index_version(manifest)
+
+def test_unchanged_folder_embeds_nothing(source, db_path, write_document):
+    write_document(source, "a.docx", chunks=3)
+    sync(source, db_path, CountingEmbeddings())
+    version = load_manifest(db_path)["index_version"]
+
+    embeddings = CountingEmbeddings()
+    assert sync(source, db_path, embeddings)
+    assert embeddings.embedded == 0
+    assert load_manifest(db_path)["index_version"] == version
+
+def test_added_file_embeds_only_its_chunks(source, db_path, write_document):
+    write_document(source, "a.docx", chunks=3)
+    sync(source, db_path, CountingEmbeddings())
+    before = stored_ids(db_path)
+
+    write_document(source, "b.docx", chunks=4)
+    embeddings = CountingEmbeddings()
+    assert sync(source, db_path, embeddings)
+    assert embeddings.embedded == 4
+    assert before < stored_ids(db_path)
+    assert stored_ids(db_path) - before == set(load_manifest(db_path)["files"]["b.docx"]["chunk_ids"])
+
+def test_removed_file_deletes_its_chunks(source, db_path, write_document):
+    write_document(source, "a.docx", chunks=3)
+    removed = write_document(source, "b.docx", chunks=4)
+    sync(source, db_path, CountingEmbeddings())
+
+    os.remove(removed)
+    embeddings = CountingEmbeddings()
+    assert sync(source, db_path, embeddings)
+    assert embeddings.embedded == 0
+    manifest = load_manifest(db_path)
+    assert list(manifest["files"]) == ["a.docx"]
+    collection = chromadb.PersistentClient(path=db_path).get_collection("langchain")
+    assert collection.count() == sum(len(entry["chunk_ids"]) for entry in manifest["files"].values())
+
+def test_edited_file_replaces_its_chunks(source, db_path, write_document):
+    write_document(source, "a.docx", chunks=3)
+    edited = write_document(source, "b.docx", chunks=4)
+    sync(source, db_path, CountingEmbeddings())
+    old_ids = set(load_manifest(db_path)["files"]["b.docx"]["chunk_ids"])
+
+    write_document(source, "b.docx", chunks=2, topic="revised")
+    touch_later(edited)
+    embeddings = CountingEmbeddings()
+    assert sync(source, db_path, embeddings)
+    assert embeddings.embedded == 2
+
+    new_ids = set(load_manifest(db_path)["files"]["b.docx"]["chunk_ids"])
+    assert len(new_ids) == 2
+    assert not old_ids & stored_ids(db_path)
+    assert new_ids <= stored_ids(db_path)
+    assert stored_ids(db_path) == manifest_ids(db_path)
+
+def test_touched_file_is_not_embedded_again(source, db_path, write_document):
+    path = write_document(source, "a.docx", chunks=3)
+    sync(source, db_path, CountingEmbeddings())
+    touch_later(path)
+
+    manifest = load_manifest(db_path)
+    plan = plan_sync(str(source), manifest)
+    assert not plan.has_changes
+    assert plan.unchanged == 1
+    assert manifest["files"]["a.docx"]["mtime"] == os.stat(path).st_mtime
+
+def test_plan_sync_reports_new_changed_and_removed_files(source, db_path, write_document):
+    write_document(source, "kept.docx")
+    changed = write_document(source, "changed.docx")
+    removed = write_document(source, "removed.docx")
+    sync(source, db_path, CountingEmbeddings())
+
+    write_document(source, "changed.docx", topic="other")
+    touch_later(changed)
+    os.remove(removed)
+    write_document(source, "new.docx")
+
+    plan = plan_sync(str(source), load_manifest(db_path))
+    assert sorted(plan.to_index) == ["changed.docx", "new.docx"]
+    assert plan.removed == ["removed.docx"]
+    assert plan.unchanged == 1
+
+def test_failed_sync_resumes_without_embedding_stored_chunks(source, db_path, write_document):
+    write_document(source, "a.docx", chunks=12)
+    failing = CountingEmbeddings(fail_on_call=3)
+    assert not sync(source, db_path, failing)
+    assert failing.embedded == 10
+    assert "a.docx" not in load_manifest(db_path)["files"]
+
+    retry = CountingEmbeddings()
+    assert sync(source, db_path, retry)
+    assert retry.embedded == 2
+    assert len(stored_ids(db_path)) == 12
+
+def test_manifest_round_trip(db_path):
+    manifest = new_manifest(EMBEDDING_MODEL)
+    manifest["files"]["a.docx"] = {"sha256": "0" * 64, "mtime": 1.5, "size": 10, "chunk_ids": ["x"],
+                                   "embedding_model": EMBEDDING_MODEL}
+    os.makedirs(db_path)
+    save_manifest(db_path, manifest)
+    assert load_manifest(db_path) == manifest
+
+    changed = dict(manifest, files={"a.docx": dict(manifest["files"]["a.docx"], sha256="1" * 64)})
+    assert compute_index_version(changed) != compute_index_version(manifest)
+
+def test_incompatible_database_is_rebuilt(source, db_path, write_document):
+    write_document(source, "a.docx", chunks=3)
+    sync(source, db_path, CountingEmbeddings())
+    manifest = load_manifest(db_path)
+    manifest["embedding_model"] = "another-model"
+    save_manifest(db_path, manifest)
+
+    embeddings = CountingEmbeddings()
+    assert sync(source, db_path, embeddings)
+    assert embeddings.embedded == 3
+    assert load_manifest(db_path)["embedding_model"] == EMBEDDING_MODEL
+
+def test_missing_source_folder(tmp_path, db_path):
+    assert not sync(tmp_path / "missing", db_path, CountingEmbeddings())
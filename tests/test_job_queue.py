@@ -0,0 +1,163 @@
+"""Tests for the durable job queue, its worker pool and webhook URL checks."""
+
+import asyncio
+import time
+
+import pytest
+
+from job_queue import JobQueue, JobWorkerPool, WebhookURLError, validate_webhook_url
+
+@pytest.fixture
+def queue(tmp_path):
+    return JobQueue(str(tmp_path / "jobs.sqlite3"), lease_seconds=60, max_attempts=2)
+
+def test_duplicate_submission_returns_existing_job(queue):
+    job, created = queue.submit({"schemas": ["Abandonment"]}, dedupe_key="key")
+    duplicate, duplicate_created = queue.submit({"schemas": ["Abandonment"]}, dedupe_key="key")
+    assert created and not duplicate_created
+    assert duplicate["id"] == job["id"]
+
+    queue.complete(queue.claim()["id"], {"analysis": "done"})
+    finished, created = queue.submit({"schemas": ["Abandonment"]}, dedupe_key="key")
+    assert not created
+    assert finished["status"] == "succeeded"
+    assert finished["result"] == {"analysis": "done"}
+
+def test_failed_job_does_not_block_resubmission(queue):
+    job, _ = queue.submit({}, dedupe_key="key")
+    for _ in range(queue.max_attempts):
+        queue.fail(queue.claim()["id"], "boom", retry_delay=0)
+    assert queue.get(job["id"])["status"] == "failed"
+
+    retry, created = queue.submit({}, dedupe_key="key")
+    assert created
+    assert retry["id"] != job["id"]
+
+def test_claim_orders_by_priority_then_age(queue):
+    low, _ = queue.submit({"n": 1})
+    high, _ = queue.submit({"n": 2}, priority=5)
+    later_low, _ = queue.submit({"n": 3})
+    assert [queue.claim()["id"] for _ in range(3)] == [high["id"], low["id"], later_low["id"]]
+    assert queue.claim() is None
+
+def test_expired_lease_is_reclaimed(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.sqlite3"), lease_seconds=0.05)
+    job, _ = queue.submit({})
+    assert queue.claim()["id"] == job["id"]
+    assert queue.claim() is None
+
+    time.sleep(0.1)
+    reclaimed = queue.claim()
+    assert reclaimed["id"] == job["id"]
+    assert reclaimed["attempts"] == 2
+
+def test_renewed_lease_is_not_reclaimed(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.sqlite3"), lease_seconds=0.2)
+    queue.submit({})
+    job = queue.claim()
+    time.sleep(0.15)
+    queue.renew(job["id"])
+    time.sleep(0.1)
+    assert queue.claim() is None
+
+def test_job_fails_after_max_attempts(queue):
+    job, _ = queue.submit({})
+    assert queue.fail(queue.claim()["id"], "first", retry_delay=0)
+    assert queue.get(job["id"])["status"] == "queued"
+    assert not queue.fail(queue.claim()["id"], "second", retry_delay=0)
+
+    failed = queue.get(job["id"])
+    assert failed["status"] == "failed"
+    assert failed["error"] == "second"
+    assert failed["attempts"] == queue.max_attempts
+
+def test_retry_waits_for_its_delay(queue):
+    queue.submit({})
+    queue.fail(queue.claim()["id"], "boom", retry_delay=60)
+    assert queue.claim() is None
+
+def test_requeue_does_not_use_an_attempt(queue):
+    job, _ = queue.submit({})
+    for _ in range(5):
+        assert queue.requeue(queue.claim()["id"], "overloaded", delay=0)
+    requeued = queue.get(job["id"])
+    assert requeued["status"] == "queued"
+    assert requeued["attempts"] == 0
+
+def test_requeue_gives_up_after_max_age(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.sqlite3"), max_requeue_seconds=0.05)
+    job, _ = queue.submit({})
+    time.sleep(0.1)
+    assert not queue.requeue(queue.claim()["id"], "overloaded", delay=0)
+    failed = queue.get(job["id"])
+    assert failed["status"] == "failed"
+    assert "gave up" in failed["error"]
+
+def test_purge_deletes_finished_jobs_past_retention(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.sqlite3"), retention_seconds=0)
+    finished, _ = queue.submit({})
+    queue.complete(queue.claim()["id"], {})
+    pending, _ = queue.submit({})
+    assert queue.purge() == 1
+    assert queue.get(finished["id"]) is None
+    assert queue.get(pending["id"]) is not None
+
+class Overloaded(Exception):
+    pass
+
+def test_worker_pool_requeues_and_retries(queue):
+    calls = []
+
+    async def handler(payload):
+        calls.append(payload)
+        if payload["kind"] == "overloaded" and len(calls) < 3:
+            raise Overloaded("server at capacity")
+        if payload["kind"] == "broken":
+            raise ValueError("bad input")
+        return {"ok": True}
+
+    async def scenario():
+        pool = JobWorkerPool(
+            queue, handler, concurrency=1, poll_interval=0.01,
+            retry_delay=lambda error: 0,
+            requeue_delay=lambda error: 0 if isinstance(error, Overloaded) else None,
+        )
+        overloaded, _ = queue.submit({"kind": "overloaded"})
+        broken, _ = queue.submit({"kind": "broken"})
+        pool.start()
+        try:
+            for _ in range(200):
+                statuses = {queue.get(job["id"])["status"] for job in (overloaded, broken)}
+                if statuses <= {"succeeded", "failed"}:
+                    break
+                await asyncio.sleep(0.01)
+        finally:
+            await pool.stop()
+        return queue.get(overloaded["id"]), queue.get(broken["id"])
+
+    overloaded, broken = asyncio.run(scenario())
+    assert overloaded["status"] == "succeeded"
+    assert overloaded["attempts"] == 1
+    assert broken["status"] == "failed"
+    assert broken["attempts"] == queue.max_attempts
+
+@pytest.mark.parametrize("url", [
+    "ftp://example.com/hook",
+    "file:///etc/passwd",
+    "http://127.0.0.1/hook",
+    "http://localhost:8000/hook",
+    "http://10.0.0.5/hook",
+    "http://169.254.169.254/latest/meta-data",
+    "http://[::1]/hook",
+    "http://[::ffff:127.0.0.1]/hook",
+    "http://0.0.0.0/hook",
+    "http://example.com:99999/hook",
+])
+def test_webhook_url_rejects_non_public_targets(url):
+    with pytest.raises(WebhookURLError):
+        validate_webhook_url(url)
+
+def test_webhook_url_allow_list():
+    with pytest.raises(WebhookURLError, match="not allowed"):
+        validate_webhook_url("https://attacker.example/hook", {"hooks.example.com"})
+    validate_webhook_url("https://8.8.8.8/hook", {"8.8.8.8"})
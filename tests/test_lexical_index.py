@@ -0,0 +1,133 @@
+"""Tests for the BM25 index, reciprocal rank fusion and hybrid retrieval."""
+
+import asyncio
+import json
+import os
+
+import numpy as np
+import pytest
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from embedding_stage import HashingEmbeddings
+from lexical_index import (
+    RRF_K, HybridRetriever, LexicalRetriever, load_lexical_index, reciprocal_rank_fusion, tokenize,
+)
+from vector_index import (
+    CHUNKS_FILENAME, META_FILENAME, NumpyRetriever, get_numpy_index_path, load_numpy_index, vectors_filename,
+)
+
+CHUNKS = [
+    ("c0", "Terk edilme şeması, sevilen kişilerin ayrılacağı korkusudur."),
+    ("c1", "Kusurluluk ve utanç şeması, kişinin kusurlu olduğu inancıdır."),
+    ("c2", "The abandonment schema is the fear that loved ones will leave."),
+    ("c3", "Defectiveness means feeling flawed, bad or unwanted."),
+    ("c4", "Unrelenting standards drive perfectionism and hypercriticalness."),
+]
+
+def write_snapshot(db_path: str, index_version: str, embeddings) -> None:
+    """Write the NumPy export of a snapshot directly, as an index build would."""
+    index_path = get_numpy_index_path(db_path)
+    os.makedirs(index_path)
+    with open(os.path.join(index_path, CHUNKS_FILENAME), 'w', encoding='utf-8') as file:
+        for chunk_id, text in CHUNKS:
+            file.write(json.dumps({"id": chunk_id, "text": text, "metadata": {"source": f"{chunk_id}.pdf"}}) + "\n")
+    vectors = np.asarray(embeddings.embed_documents([text for _, text in CHUNKS]), dtype=np.float32)
+    np.save(os.path.join(index_path, vectors_filename("float32")), vectors)
+    with open(os.path.join(index_path, META_FILENAME), 'w', encoding='utf-8') as file:
+        json.dump({"index_version": index_version, "count": len(CHUNKS), "dimensions": vectors.shape[1]}, file)
+
+@pytest.fixture
+def embeddings():
+    return HashingEmbeddings()
+
+@pytest.fixture
+def snapshot(tmp_path, embeddings):
+    write_snapshot(str(tmp_path), "v1", embeddings)
+    return str(tmp_path)
+
+@pytest.fixture
+def lexical_index(snapshot):
+    return load_lexical_index(snapshot, "v1")
+
+class FailingRetriever(BaseRetriever):
+    """Vector retriever stand-in whose search always fails."""
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun):
+        raise RuntimeError("embedding API unavailable")
+
+class SlowRetriever(BaseRetriever):
+    """Vector retriever stand-in that answers after `delay` seconds."""
+
+    delay: float = 1.0
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun):
+        return []
+
+    async def _aget_relevant_documents(self, query: str, *, run_manager):
+        await asyncio.sleep(self.delay)
+        return []
+
+def document(chunk_id: str) -> Document:
+    return Document(page_content=f"text of {chunk_id}", id=chunk_id)
+
+def test_tokenize_folds_case_accents_and_suffixes():
+    assert tokenize("Kusurluluk") == tokenize("kusurlar") == ["kusur"]
+    assert tokenize("Şema, ŞEMASI!") == ["sema", "semas"]
+    assert tokenize("Utanç") == tokenize("utanc")
+
+def test_bm25_ranks_keyword_matches_first(lexical_index):
+    hits = lexical_index.search("Kusurluluk utanç", k=5)
+    assert lexical_index.ids[hits[0][0]] == "c1"
+    hits = lexical_index.search("defectiveness", k=5)
+    assert lexical_index.ids[hits[0][0]] == "c3"
+
+def test_bm25_returns_only_matching_chunks(lexical_index):
+    assert lexical_index.search("no such words anywhere") == []
+    hits = lexical_index.search("abandonment", k=5)
+    assert [lexical_index.ids[row] for row, _ in hits] == ["c2"]
+    assert hits[0][1] > 0
+
+def test_bm25_scores_are_sorted(lexical_index):
+    hits = lexical_index.search("schema şeması fear korku", k=5)
+    scores = [score for _, score in hits]
+    assert scores == sorted(scores, reverse=True)
+
+def test_lexical_index_is_stored_and_reused(snapshot, lexical_index):
+    assert os.path.exists(os.path.join(snapshot, "lexical_index.json"))
+    reloaded = load_lexical_index(snapshot, "v1")
+    assert reloaded.ids == lexical_index.ids
+    assert reloaded.search("defectiveness") == lexical_index.search("defectiveness")
+
+def test_reciprocal_rank_fusion_rewards_agreement():
+    # b is second in both lists: 2 / (RRF_K + 2) beats a single first place, 1 / (RRF_K + 1)
+    assert 2 / (RRF_K + 2) > 1 / (RRF_K + 1)
+    fused = reciprocal_rank_fusion([[document("a"), document("b")], [document("c"), document("b")]], k=4)
+    assert fused[0].id == "b"
+    assert [doc.id for doc in fused[1:]] in (["a", "c"], ["c", "a"])
+
+def test_reciprocal_rank_fusion_deduplicates_and_cuts_to_k():
+    fused = reciprocal_rank_fusion([[document("a"), document("b")], [document("a")], []], k=1)
+    assert [doc.id for doc in fused] == ["a"]
+
+def test_lexical_retriever(lexical_index):
+    documents = LexicalRetriever(index=lexical_index, k=2).invoke("abandonment")
+    assert [doc.id for doc in documents] == ["c2"]
+    assert documents[0].metadata == {"source": "c2.pdf"}
+
+def test_hybrid_retriever_fuses_vector_and_lexical_rankings(snapshot, lexical_index, embeddings):
+    vector_retriever = NumpyRetriever(index=load_numpy_index(snapshot, "v1"), embeddings=embeddings, k=5)
+    hybrid = HybridRetriever(vector_retriever=vector_retriever, index=lexical_index, k=3, candidates=5)
+    documents = hybrid.invoke("The abandonment schema")
+    assert documents[0].id == "c2"
+    assert len(documents) == 3
+
+def test_hybrid_retriever_falls_back_to_lexical_when_vector_search_fails(lexical_index):
+    hybrid = HybridRetriever(vector_retriever=FailingRetriever(), index=lexical_index, k=3)
+    assert [doc.id for doc in hybrid.invoke("defectiveness")] == ["c3"]
+    assert [doc.id for doc in asyncio.run(hybrid.ainvoke("defectiveness"))] == ["c3"]
+
+def test_hybrid_retriever_falls_back_to_lexical_when_vector_search_times_out(lexical_index):
+    hybrid = HybridRetriever(vector_retriever=SlowRetriever(delay=1.0), index=lexical_index, k=3, vector_timeout=0.05)
+    assert [doc.id for doc in asyncio.run(hybrid.ainvoke("abandonment"))] == ["c2"]
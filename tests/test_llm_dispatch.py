@@ -0,0 +1,190 @@
+"""Tests for deadline-aware, hedged LLM calls."""
+
+import asyncio
+import time
+
+import pytest
+from langchain_core.messages import HumanMessage
+from prometheus_client import REGISTRY
+
+from fake_models import FakeChatModel
+from llm_dispatch import DeadlineLLM, GenerationTimeoutError, LatencyTracker, clear_deadline, set_deadline
+
+class ScriptedLLM:
+    """
+    Chat model stand-in whose n-th call waits `delays[n]` seconds (the last
+    delay repeats) before it answers, fails with `error` or starts streaming.
+    """
+
+    def __init__(self, name: str, delays, error: Exception = None, chunks=("a", "b", "c"), chunk_delay: float = 0):
+        self.name = name
+        self.delays = list(delays)
+        self.error = error
+        self.chunks = chunks
+        self.chunk_delay = chunk_delay
+        self.calls = 0
+        self.closed_streams = 0
+
+    def _next_delay(self) -> float:
+        delay = self.delays[min(self.calls, len(self.delays) - 1)]
+        self.calls += 1
+        return delay
+
+    async def ainvoke(self, messages, **kwargs):
+        number = self.calls + 1
+        await asyncio.sleep(self._next_delay())
+        if self.error is not None:
+            raise self.error
+        return f"{self.name} call {number}"
+
+    async def astream(self, messages, **kwargs):
+        try:
+            await asyncio.sleep(self._next_delay())
+            if self.error is not None:
+                raise self.error
+            for index, chunk in enumerate(self.chunks):
+                if index:
+                    await asyncio.sleep(self.chunk_delay)
+                yield chunk
+        finally:
+            self.closed_streams += 1
+
+def warm_up(tracker: LatencyTracker, seconds: float):
+    """Fill a tracker with identical latencies so its percentiles are reported."""
+    for _ in range(tracker.min_samples):
+        tracker.observe(seconds)
+
+def generations(path: str) -> float:
+    return REGISTRY.get_sample_value("rag_generation_path_total", {"path": path}) or 0.0
+
+async def collect(stream):
+    return [chunk async for chunk in stream]
+
+def test_latency_tracker_percentiles():
+    tracker = LatencyTracker(window=100, min_samples=10)
+    for value in range(1, 10):
+        tracker.observe(value)
+    assert tracker.percentile(50) is None
+    tracker.observe(10)
+    assert tracker.percentile(50) == 6
+    assert tracker.percentile(99) == 10
+    assert tracker.stats()["samples"] == 10
+
+def test_fast_primary_answers_without_hedge():
+    primary = ScriptedLLM("primary", [0.01])
+    llm = DeadlineLLM(primary, fallback_llm=ScriptedLLM("fallback", [0]))
+    before = generations("primary")
+    assert asyncio.run(llm.ainvoke([])) == "primary call 1"
+    assert primary.calls == 1
+    assert generations("primary") == before + 1
+
+def test_slow_call_is_hedged():
+    primary = ScriptedLLM("primary", [2.0, 0.01])
+    llm = DeadlineLLM(primary, hedge_percentile=95)
+    warm_up(llm.primary.latency, 0.02)
+    before = generations("hedge")
+
+    started = time.monotonic()
+    assert asyncio.run(llm.ainvoke([])) == "primary call 2"
+    assert time.monotonic() - started < 1.0
+    assert primary.calls == 2
+    assert generations("hedge") == before + 1
+
+def test_hedging_can_be_disabled():
+    primary = ScriptedLLM("primary", [0.1, 0.01])
+    llm = DeadlineLLM(primary, hedge=False)
+    warm_up(llm.primary.latency, 0.02)
+    assert asyncio.run(llm.ainvoke([])) == "primary call 1"
+    assert primary.calls == 1
+
+def test_primary_error_uses_fallback():
+    primary = ScriptedLLM("primary", [0], error=RuntimeError("quota"))
+    fallback = ScriptedLLM("fallback", [0])
+    llm = DeadlineLLM(primary, fallback_llm=fallback)
+    before = generations("fallback")
+    assert asyncio.run(llm.ainvoke([])) == "fallback call 1"
+    assert generations("fallback") == before + 1
+
+def test_primary_error_without_fallback_is_raised():
+    llm = DeadlineLLM(ScriptedLLM("primary", [0], error=RuntimeError("quota")))
+    with pytest.raises(RuntimeError, match="quota"):
+        asyncio.run(llm.ainvoke([]))
+
+def test_primary_timeout_uses_fallback():
+    llm = DeadlineLLM(ScriptedLLM("primary", [2.0]), fallback_llm=ScriptedLLM("fallback", [0]), max_timeout=0.05)
+    assert asyncio.run(llm.ainvoke([])) == "fallback call 1"
+
+def test_timeout_without_fallback_raises_generation_timeout():
+    llm = DeadlineLLM(ScriptedLLM("primary", [2.0]), max_timeout=0.05)
+    started = time.monotonic()
+    with pytest.raises(GenerationTimeoutError):
+        asyncio.run(llm.ainvoke([]))
+    assert time.monotonic() - started < 1.0
+
+def test_deadline_at_risk_goes_straight_to_fallback():
+    primary = ScriptedLLM("primary", [0.5])
+    llm = DeadlineLLM(primary, fallback_llm=ScriptedLLM("fallback", [0.01]))
+    warm_up(llm.primary.latency, 0.5)
+    warm_up(llm.fallback.latency, 0.01)
+
+    async def scenario():
+        token = set_deadline(0.1)
+        try:
+            return await llm.ainvoke([])
+        finally:
+            clear_deadline(token)
+
+    assert asyncio.run(scenario()) == "fallback call 1"
+    assert primary.calls == 0
+
+def test_passed_deadline_raises_before_calling_a_model():
+    primary = ScriptedLLM("primary", [0])
+
+    async def scenario():
+        token = set_deadline(0.01)
+        try:
+            await asyncio.sleep(0.02)
+            return await DeadlineLLM(primary).ainvoke([])
+        finally:
+            clear_deadline(token)
+
+    with pytest.raises(GenerationTimeoutError):
+        asyncio.run(scenario())
+    assert primary.calls == 0
+
+def test_stream_first_chunk_is_hedged_and_losing_stream_closed():
+    primary = ScriptedLLM("primary", [2.0, 0.01])
+    llm = DeadlineLLM(primary)
+    warm_up(llm.primary.first_chunk_latency, 0.02)
+
+    assert asyncio.run(collect(llm.astream([]))) == ["a", "b", "c"]
+    assert primary.calls == 2
+    assert primary.closed_streams == 2
+
+def test_stream_stall_after_first_chunk_raises():
+    primary = ScriptedLLM("primary", [0], chunk_delay=2.0)
+    llm = DeadlineLLM(primary, max_timeout=0.05)
+    received = []
+
+    async def scenario():
+        async for chunk in llm.astream([]):
+            received.append(chunk)
+
+    started = time.monotonic()
+    with pytest.raises(GenerationTimeoutError, match="stalled"):
+        asyncio.run(scenario())
+    assert time.monotonic() - started < 1.0
+    assert received == ["a"]
+    assert primary.closed_streams == 1
+
+def test_fake_chat_model_through_deadline_llm():
+    model = FakeChatModel(latency_seconds=0, tokens_per_second=0, response_tokens=5)
+    llm = DeadlineLLM(model, max_timeout=5)
+    messages = [HumanMessage(content="Abandonment")]
+
+    message = asyncio.run(llm.ainvoke(messages))
+    # Some langchain-core versions end the stream with an empty chunk
+    chunks = [chunk for chunk in asyncio.run(collect(llm.astream(messages))) if chunk.content]
+    assert len(chunks) == 5
+    assert "".join(chunk.content for chunk in chunks).strip() == message.content
+    assert llm.stats()["primary"]["samples"] == 1
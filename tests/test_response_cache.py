@@ -0,0 +1,64 @@
+"""Tests for the two-tier response cache."""
+
+import time
+
+from response_cache import ResponseCache, make_cache_key, normalize_schemas
+
+def test_cache_key_ignores_schema_order_case_and_whitespace():
+    first = make_cache_key("analysis", normalize_schemas(["Abandonment", " defectiveness  "]))
+    second = make_cache_key("analysis", normalize_schemas(["DEFECTIVENESS", "abandonment", "Abandonment"]))
+    assert first == second
+
+def test_memory_tier_evicts_least_recently_used():
+    cache = ResponseCache(max_entries=2)
+    cache.set("a", "1")
+    cache.set("b", "2")
+    assert cache.get("a") == "1"
+    cache.set("c", "3")
+    assert cache.get("b") is None
+    assert cache.get("a") == "1"
+    assert cache.get("c") == "3"
+
+def test_entries_expire_after_ttl():
+    cache = ResponseCache(ttl_seconds=0.05)
+    cache.set("a", "1")
+    time.sleep(0.1)
+    assert cache.get("a") is None
+    assert cache.stats()["misses"] == 1
+
+def test_sqlite_tier_survives_restart(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    cache = ResponseCache(sqlite_path=path)
+    cache.set_index_version("v1")
+    cache.set("a", "answer")
+
+    restarted = ResponseCache(sqlite_path=path)
+    restarted.set_index_version("v1")
+    assert restarted.get("a") == "answer"
+    assert restarted.stats()["disk_hits"] == 1
+    # The disk hit is promoted to the memory tier
+    assert restarted.get("a") == "answer"
+    assert restarted.stats()["disk_hits"] == 1
+
+def test_new_index_version_invalidates_both_tiers(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    cache = ResponseCache(sqlite_path=path)
+    cache.set_index_version("v1")
+    cache.set("a", "old answer")
+
+    cache.set_index_version("v2")
+    assert cache.get("a") is None
+    cache.set("b", "new answer")
+
+    restarted = ResponseCache(sqlite_path=path)
+    restarted.set_index_version("v2")
+    assert restarted.get("a") is None
+    assert restarted.get("b") == "new answer"
+
+def test_same_index_version_keeps_entries():
+    cache = ResponseCache()
+    cache.set_index_version("v1")
+    cache.set("a", "1")
+    cache.set_index_version("v1")
+    assert cache.get("a") == "1"
+    assert cache.stats()["index_version"] == "v1"
@@ -0,0 +1,95 @@
+"""Tests for schema alias resolution and the precomputed schema context."""
+
+import json
+
+import pytest
+
+from schema_index import (
+    SCHEMA_INDEX_FILENAME, SCHEMA_INDEX_FORMAT_VERSION, SCHEMAS, SchemaIndex, build_alias_table,
+    load_schema_index, normalize_alias,
+)
+
+def stored_chunks(canonical: str, count: int, shared: int = 0) -> list:
+    """Stored chunks of a schema; the first `shared` chunks are common to all schemas."""
+    return [
+        {"id": f"shared-{rank}" if rank < shared else f"{canonical}-{rank}",
+         "text": f"{canonical} passage {rank}", "metadata": {"source": f"{canonical}.pdf"}, "score": 1.0 - rank / 10}
+        for rank in range(count)
+    ]
+
+@pytest.fixture
+def schema_index():
+    return SchemaIndex(build_alias_table(), {canonical: stored_chunks(canonical, 3) for canonical in SCHEMAS})
+
+@pytest.mark.parametrize("name, canonical", [
+    ("Abandonment/Instability", "Abandonment/Instability"),
+    ("abandonment", "Abandonment/Instability"),
+    ("  ABANDONMENT  ", "Abandonment/Instability"),
+    ("Terk Edilme", "Abandonment/Instability"),
+    ("terk edilme / istikrarsizlik", "Abandonment/Instability"),
+    ("Kusurluluk/Utanç", "Defectiveness/Shame"),
+    ("kusurluluk-utanc", "Defectiveness/Shame"),
+    ("Insufficient Self Control", "Insufficient Self-Control/Self-Discipline"),
+    ("YÜKSEK STANDARTLAR", "Unrelenting Standards/Hypercriticalness"),
+    ("Sosyal İzolasyon", "Social Isolation/Alienation"),
+    ("sosyal izolasyon", "Social Isolation/Alienation"),
+    ("Bağımlılık", "Dependence/Incompetence"),
+])
+def test_aliases_resolve_to_canonical_schema(schema_index, name, canonical):
+    assert schema_index.resolve(name) == canonical
+
+def test_unknown_schema_does_not_resolve(schema_index):
+    assert schema_index.resolve("Attachment Anxiety") is None
+
+def test_every_name_in_the_catalogue_resolves_to_its_own_schema():
+    aliases = build_alias_table()
+    for canonical, (turkish, extra_aliases) in SCHEMAS.items():
+        for name in [canonical, turkish, *canonical.split("/"), *turkish.split("/"), *extra_aliases]:
+            assert aliases[normalize_alias(name)] == canonical, name
+
+def test_normalize_alias_folds_turkish_characters_and_punctuation():
+    assert normalize_alias("İç İçe Geçme") == normalize_alias("ic ice gecme")
+    assert normalize_alias("Self-Sacrifice") == "self sacrifice"
+    assert normalize_alias("Approval_Seeking") == "approval seeking"
+
+def test_lookup_interleaves_schemas_by_rank(schema_index):
+    documents = schema_index.lookup(["Abandonment", "Kusurluluk"], k=4)
+    assert [document.id for document in documents] == [
+        "Abandonment/Instability-0", "Defectiveness/Shame-0",
+        "Abandonment/Instability-1", "Defectiveness/Shame-1",
+    ]
+    assert schema_index.stats()["hits"] == 1
+
+def test_lookup_skips_chunks_shared_by_schemas():
+    index = SchemaIndex(build_alias_table(), {
+        "Failure": stored_chunks("Failure", 3, shared=1),
+        "Subjugation": stored_chunks("Subjugation", 3, shared=1),
+    })
+    documents = index.lookup(["Failure", "Subjugation"], k=10)
+    assert [document.id for document in documents] == [
+        "shared-0", "Failure-1", "Subjugation-1", "Failure-2", "Subjugation-2",
+    ]
+
+def test_lookup_counts_aliases_of_one_schema_once(schema_index):
+    documents = schema_index.lookup(["Abandonment", "Terk Edilme", "abandonment/instability"], k=5)
+    assert [document.id for document in documents] == [f"Abandonment/Instability-{rank}" for rank in range(3)]
+
+def test_lookup_with_unknown_schema_falls_back(schema_index):
+    assert schema_index.lookup(["Abandonment", "Attachment Anxiety"]) is None
+    assert schema_index.lookup([]) is None
+    assert schema_index.stats()["fallbacks"] == 2
+
+def test_load_uses_stored_index_of_the_same_version(tmp_path):
+    data = {
+        "format_version": SCHEMA_INDEX_FORMAT_VERSION,
+        "index_version": "v1",
+        "top_n": 2,
+        "aliases": build_alias_table(),
+        "chunks": {"Failure": stored_chunks("Failure", 2)},
+    }
+    (tmp_path / SCHEMA_INDEX_FILENAME).write_text(json.dumps(data), encoding="utf-8")
+
+    index = load_schema_index(str(tmp_path), embeddings=None, index_version="v1")
+    assert index.resolve("Başarısızlık") == "Failure"
+    # Schemas without stored chunks are treated as unknown
+    assert index.resolve("Abandonment") is None